@@ -19,6 +19,7 @@ from app.services.bulk_operations_service import (
     BulkOperationType,
     BulkOperationStatus
 )
+from app.services.invoice_validation_service import InvoiceValidationService, ValidationCheck
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["bulk"])
@@ -31,6 +32,12 @@ class BulkDeleteRequest(BaseModel):
     metadata: Optional[Dict[str, Any]] = Field(default={}, description="Additional metadata")
 
 
+class BulkValidateRequest(BaseModel):
+    """Request model for bulk validate operation."""
+    checks: Optional[List[ValidationCheck]] = Field(default=None, description="Checks to run (all when omitted)")
+    metadata: Optional[Dict[str, Any]] = Field(default={}, description="Additional metadata")
+
+
 class BulkOperationResponse(BaseModel):
     """Response model for bulk operations."""
     operation_id: str
@@ -235,6 +242,100 @@ async def bulk_delete_invoices(
         )
 
 
+@router.post("/bulk/validate")
+@performance_monitor("api", "bulk_validate")
+async def bulk_validate_invoices(
+    validate_request: BulkValidateRequest,
+    auto_start: bool = Query(True, description="Automatically start processing"),
+    current_user: UserModel = Depends(get_current_user),
+    bulk_service: BulkOperationsService = Depends(get_bulk_service)
+):
+    """
+    Validate all stored invoices for the current user.
+    
+    Checks:
+    - Line item amounts equal quantity x rate
+    - Line items sum to the taxable amount
+    - CGST/SGST versus IGST consistency and tax totals
+    - GSTIN state code and checksum
+    - Duplicate invoice numbers per vendor
+    
+    Findings are stored and can be filtered via /bulk/validation/findings.
+    """
+    try:
+        operation_id = await bulk_service.create_bulk_validate_operation(
+            user_id=str(current_user.id),
+            checks=validate_request.checks,
+            metadata=validate_request.metadata
+        )
+        
+        # Start operation if requested
+        if auto_start:
+            started = await bulk_service.start_operation(operation_id)
+            if not started:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to start bulk validate operation"
+                )
+        
+        return success_response(
+            data={
+                "operation_id": operation_id,
+                "checks": [c.value for c in (validate_request.checks or list(ValidationCheck))],
+                "auto_started": auto_start
+            },
+            message="Bulk validate operation created" + (" and started" if auto_start else "")
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in bulk validate: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create bulk validate operation"
+        )
+
+
+@router.get("/bulk/validation/findings")
+@performance_monitor("api", "get_validation_findings")
+async def get_validation_findings(
+    check_type: Optional[ValidationCheck] = Query(None, description="Filter by check"),
+    invoice_id: Optional[str] = Query(None, description="Filter by invoice"),
+    page: int = Query(1, ge=1, description="Page number"),
+    limit: int = Query(50, ge=1, le=200, description="Items per page"),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """
+    Get stored validation findings for the current user.
+    
+    Reads the findings table written by the last validate operation,
+    so filtering never re-runs the checks.
+    """
+    try:
+        validation_service = InvoiceValidationService()
+        findings = validation_service.get_findings(
+            user_id=str(current_user.id),
+            check_type=check_type,
+            invoice_id=invoice_id,
+            page=page,
+            limit=limit
+        )
+        summary = validation_service.get_findings_summary(str(current_user.id))
+        
+        return success_response(
+            data={**findings, "summary": summary},
+            message=f"Retrieved {len(findings['findings'])} validation findings"
+        )
+        
+    except Exception as e:
+        logger.error(f"Error getting validation findings: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve validation findings"
+        )
+
+
 @router.post("/bulk/operations/{operation_id}/start")
 @performance_monitor("api", "start_bulk_operation")
 async def start_bulk_operation(
@@ -4,8 +4,10 @@ Dashboard Routes
 Handles user dashboard functionality including invoice history and statistics.
 """
 import logging
+from typing import Optional
 from fastapi import APIRouter, HTTPException, Depends, Query, status
 
+from app.core.exceptions import ValidationException
 from app.services.database_service import DatabaseService
 from app.services.auth_service import AuthService
 from app.models.database import UserModel
@@ -22,11 +24,15 @@ logger = logging.getLogger(__name__)
 async def get_user_invoices(
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(10, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor/prev_cursor from a previous page (overrides page)"),
     current_user: UserModel = Depends(get_current_user),
     db_service: DatabaseService = Depends(get_database_service)
 ):
     """
     Get current user's invoices with pagination.
+    
+    Follow `next_cursor`/`prev_cursor` for constant-cost paging at any
+    depth; `page` remains available as a legacy offset mode.
     """
     try:
         # CRITICAL DEBUG: Log the current user info for dashboard
@@ -37,12 +43,15 @@ async def get_user_invoices(
         result = db_service.get_user_invoices(
             user_id=str(current_user.id),
             page=page,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
         
         logger.info(f"Retrieved {len(result['invoices'])} invoices for user {current_user.email}")
         return result
         
+    except ValidationException:
+        raise
     except Exception as e:
         logger.error(f"Error getting invoices for user {current_user.id}: {e}")
         raise HTTPException(
@@ -4,10 +4,13 @@ File Management Routes
 Handles secure file upload, download, and management with user isolation.
 """
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request
 
-from app.services.file_service import FileService
+from app.core.config import get_settings
+from app.core.http_caching import build_etag, cached_file_response
+from app.core.exceptions import FileTooLargeException, UnsupportedFileTypeException
+from app.services.file_service import FileService, FileSortField
+from app.services.thumbnail_service import thumbnail_service
 from app.models.database import UserModel
 from app.api.routes.auth import get_current_user
 
@@ -22,6 +25,19 @@ def get_file_service() -> FileService:
     return FileService()
 
 
+def _get_file_reference(file_service: FileService, file_id: str, user_id: str) -> dict:
+    """Get the user's file reference or raise 404 (includes access control check)."""
+    reference = file_service.get_file_reference(file_id, user_id)
+    
+    if not reference:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found or access denied"
+        )
+    
+    return reference
+
+
 @router.post("/files/upload")
 async def upload_file(
     file: UploadFile = File(...),
@@ -40,28 +56,29 @@ async def upload_file(
         File information including file_id for future reference
     """
     try:
-        # Validate file type (same as existing validation)
-        allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
+        # Validate declared type up front; content is re-checked while streaming
+        settings = get_settings()
+        allowed_types = settings.ALLOWED_FILE_TYPES
         if file.content_type not in allowed_types:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Unsupported file type: {file.content_type}. Supported: {', '.join(allowed_types)}"
             )
         
-        # Validate file size (10MB max)
-        content = await file.read()
-        if len(content) > 10 * 1024 * 1024:
+        # Stream to disk, enforcing size and sniffing content in one pass
+        try:
+            file_id, file_info = await file_service.save_uploaded_file(
+                file,
+                str(current_user.id),
+                max_size=settings.MAX_FILE_SIZE,
+                allowed_types=allowed_types
+            )
+        except (FileTooLargeException, UnsupportedFileTypeException) as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File too large. Maximum size is 10MB."
+                detail=e.message
             )
         
-        # Reset file position for saving
-        await file.seek(0)
-        
-        # Save file
-        file_id, file_info = await file_service.save_uploaded_file(file, str(current_user.id))
-        
         logger.info(f"File uploaded by {current_user.email}: {file_id}")
         
         return {
@@ -69,6 +86,7 @@ async def upload_file(
             "file_id": file_id,
             "original_name": file_info["original_name"],
             "size": file_info["size"],
+            "sha256": file_info["sha256"],
             "content_type": file_info["content_type"],
             "created_at": file_info["created_at"],
             "message": "File uploaded successfully"
@@ -84,109 +102,171 @@ async def upload_file(
         )
 
 
-@router.get("/files/{file_id}")
-async def download_file(
+# Routes with a suffix are declared before the bare download route because
+# file_ids contain a slash ("<user_id>/<filename>") and are matched as paths.
+
+@router.get("/files/{file_id:path}/thumbnail")
+async def get_file_thumbnail(
+    request: Request,
     file_id: str,
+    size: int = Query(150, ge=50, le=500, description="Thumbnail size in pixels"),
     current_user: UserModel = Depends(get_current_user),
     file_service: FileService = Depends(get_file_service)
 ):
     """
-    Download file (only if user owns it).
+    Get prebuilt thumbnail of an image file (only if user owns it).
+    
+    Thumbnails are generated in the background after upload. The requested
+    size is served from the nearest prebuilt size; if none exists yet the
+    file is queued for generation and 503 is returned with Retry-After.
     
     Args:
+        request: Incoming request (conditional and range headers)
         file_id: File identifier
+        size: Thumbnail size in pixels (default: 150)
         current_user: Authenticated user
         file_service: File service instance
         
     Returns:
-        File response for download
+        Thumbnail image response (304 if the client copy is current)
     """
     try:
-        # Get file path (includes access control check)
-        file_path = file_service.get_file_path(file_id, str(current_user.id))
+        user_id = str(current_user.id)
+        
+        reference = _get_file_reference(file_service, file_id, user_id)
+        
+        content_key = reference["sha256"]
+        thumbnail_key = await thumbnail_service.get_thumbnail(user_id, content_key, size)
         
-        if not file_path:
+        if not thumbnail_key:
+            # Never resize on the request path; queue it for the workers
+            thumbnail_service.schedule(user_id, content_key, reference["storage_key"])
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="File not found or access denied"
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Thumbnail is being generated",
+                headers={"Retry-After": "2"}
             )
         
-        # Extract original filename for download
-        filename = file_path.name
+        # The variant is the prebuilt size actually served, not the requested one
+        served_size = thumbnail_key.rsplit("_", 1)[-1].removesuffix(".webp")
         
-        logger.info(f"File downloaded by {current_user.email}: {file_id}")
+        return cached_file_response(
+            request,
+            file_service.storage,
+            thumbnail_key,
+            etag=build_etag(content_key, f"{served_size}-webp"),
+            media_type="image/webp",
+            filename=f"thumbnail_{file_id.split('/', 1)[-1]}.webp",
+            content_disposition_type="inline"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting thumbnail for file {file_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get thumbnail"
+        )
+
+
+@router.get("/files/{file_id:path}/preview")
+async def preview_file(
+    request: Request,
+    file_id: str,
+    current_user: UserModel = Depends(get_current_user),
+    file_service: FileService = Depends(get_file_service)
+):
+    """
+    Serve the original file inline for display (only if user owns it).
+    
+    Args:
+        request: Incoming request (conditional and range headers)
+        file_id: File identifier
+        current_user: Authenticated user
+        file_service: File service instance
         
-        return FileResponse(
-            path=str(file_path),
-            filename=filename,
-            media_type='application/octet-stream'
+    Returns:
+        File response with the stored content type
+    """
+    try:
+        user_id = str(current_user.id)
+        
+        reference = _get_file_reference(file_service, file_id, user_id)
+        
+        media_type = reference["content_type"] or "application/octet-stream"
+        
+        return cached_file_response(
+            request,
+            file_service.storage,
+            reference["storage_key"],
+            etag=build_etag(reference["sha256"]),
+            media_type=media_type,
+            content_disposition_type="inline"
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error downloading file {file_id} for user {current_user.id}: {e}")
+        logger.error(f"Error previewing file {file_id} for user {current_user.id}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to download file"
+            detail="Failed to preview file"
         )
 
 
-@router.get("/files/{file_id}/thumbnail")
-async def get_file_thumbnail(
+@router.get("/files/{file_id:path}")
+async def download_file(
+    request: Request,
     file_id: str,
-    size: int = Query(150, ge=50, le=500, description="Thumbnail size in pixels"),
     current_user: UserModel = Depends(get_current_user),
     file_service: FileService = Depends(get_file_service)
 ):
     """
-    Get thumbnail of an image file (only if user owns it).
+    Download file (only if user owns it).
+    
+    Supports conditional requests and single byte ranges so repeat views
+    and resumed downloads do not transfer the file again.
     
     Args:
+        request: Incoming request (conditional and range headers)
         file_id: File identifier
-        size: Thumbnail size in pixels (default: 150)
         current_user: Authenticated user
         file_service: File service instance
         
     Returns:
-        Thumbnail image response
+        File response for download
     """
     try:
-        # Get file path (includes access control check)
-        file_path = file_service.get_file_path(file_id, str(current_user.id))
+        user_id = str(current_user.id)
         
-        if not file_path:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="File not found or access denied"
-            )
+        reference = _get_file_reference(file_service, file_id, user_id)
         
-        # Generate thumbnail
-        thumbnail_path = file_service.generate_thumbnail(file_path, size)
+        # Extract original filename for download
+        filename = reference["original_name"] or file_id.split("/", 1)[-1]
         
-        if not thumbnail_path:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to generate thumbnail"
-            )
+        logger.info(f"File downloaded by {current_user.email}: {file_id}")
         
-        return FileResponse(
-            path=thumbnail_path,
-            media_type="image/jpeg",
-            filename=f"thumbnail_{file_id}.jpg"
+        return cached_file_response(
+            request,
+            file_service.storage,
+            reference["storage_key"],
+            etag=build_etag(reference["sha256"]),
+            media_type='application/octet-stream',
+            filename=filename
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting thumbnail for file {file_id}: {e}")
+        logger.error(f"Error downloading file {file_id} for user {current_user.id}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to get thumbnail"
+            detail="Failed to download file"
         )
 
 
-@router.delete("/files/{file_id}")
+@router.delete("/files/{file_id:path}")
 async def delete_file(
     file_id: str,
     current_user: UserModel = Depends(get_current_user),
@@ -233,27 +313,42 @@ async def delete_file(
 
 @router.get("/files")
 async def list_user_files(
+    page: int = Query(1, ge=1, description="Page number"),
+    limit: int = Query(50, ge=1, le=200, description="Files per page"),
+    sort_by: FileSortField = Query(FileSortField.CREATED_AT, description="Sort key"),
+    sort_order: str = Query("desc", pattern="^(asc|desc)$", description="Sort direction"),
     current_user: UserModel = Depends(get_current_user),
     file_service: FileService = Depends(get_file_service)
 ):
     """
-    List all files for the current user.
+    List files for the current user, one page at a time.
     
     Args:
+        page: Page number
+        limit: Files per page
+        sort_by: Sort key (created_at, size, name)
+        sort_order: Sort direction
         current_user: Authenticated user
         file_service: File service instance
         
     Returns:
-        List of user's files with metadata
+        Page of user's files with metadata and storage totals
     """
     try:
-        files = file_service.get_user_files(str(current_user.id))
+        result = file_service.get_user_files(
+            str(current_user.id),
+            page=page,
+            limit=limit,
+            sort_by=sort_by,
+            sort_order=sort_order
+        )
         storage_stats = file_service.get_user_storage_stats(str(current_user.id))
         
         return {
-            "files": files,
+            "files": result["files"],
+            "pagination": result["pagination"],
             "storage_stats": storage_stats,
-            "total_files": len(files)
+            "total_files": storage_stats["file_count"]
         }
         
     except Exception as e:
@@ -261,4 +356,4 @@ async def list_user_files(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to list files"
-        )
\ No newline at end of file
+        )
@@ -3,11 +3,14 @@ Invoice Processing Routes
 
 Handles invoice upload, processing, and database operations.
 """
+import asyncio
 from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
 import logging
 
 from app.core.config import get_settings
+from app.core.exceptions import FileTooLargeException, UnsupportedFileTypeException
 
 logger = logging.getLogger(__name__)
 from app.models.schemas import (
@@ -19,6 +22,7 @@ from app.api.routes.auth import get_current_user
 from app.services.invoice_service import InvoiceService
 from app.services.file_service import FileService
 from app.services.database_service import DatabaseService
+from app.services.duplicate_detection_service import compute_dhash, find_near_duplicate_invoices
 
 router = APIRouter(tags=["invoices"])
 
@@ -28,6 +32,35 @@ def get_file_service() -> FileService:
     return FileService()
 
 
+async def _check_near_duplicates(
+    user_id: str,
+    perceptual_hash: Optional[int],
+    exclude_file_id: str = None
+) -> Optional[ParseResponseSchema]:
+    """
+    Look up saved invoices with a near-identical image before extraction.
+    
+    Returns:
+        A failed ParseResponseSchema listing the matches, or None to proceed
+    """
+    if perceptual_hash is None:
+        return None
+    
+    matches = await asyncio.to_thread(
+        find_near_duplicate_invoices, user_id, perceptual_hash, exclude_file_id
+    )
+    if not matches:
+        return None
+    
+    logger.info(f"Upload for user {user_id} is a near-duplicate of invoice {matches[0]['invoice_id']}")
+    return ParseResponseSchema(
+        success=False,
+        error="This image looks like an invoice that has already been processed. "
+              "Resubmit with allow_duplicates=true to extract it anyway.",
+        near_duplicates=matches
+    )
+
+
 @router.get("/supported-formats")
 async def get_supported_formats():
     """Get information about supported file formats and recommendations."""
@@ -66,6 +99,7 @@ async def get_supported_formats():
 @router.post("/parse-invoice", response_model=ParseResponseSchema)
 async def parse_invoice(
     file: UploadFile = File(...),
+    allow_duplicates: bool = Query(False, description="Extract even if a near-duplicate invoice exists"),
     current_user: UserModel = Depends(get_current_user),
     invoice_service: InvoiceService = Depends(get_invoice_service)
 ):
@@ -89,6 +123,18 @@ async def parse_invoice(
         if not is_valid:
             raise HTTPException(status_code=400, detail=error_message)
         
+        # Flag near-duplicates before spending an extraction on them
+        if not allow_duplicates:
+            try:
+                perceptual_hash = await asyncio.to_thread(compute_dhash, file_data)
+            except Exception as e:
+                logger.warning(f"Could not compute perceptual hash for {filename}: {e}")
+                perceptual_hash = None
+            
+            duplicate_response = await _check_near_duplicates(str(current_user.id), perceptual_hash)
+            if duplicate_response:
+                return duplicate_response
+        
         # Process invoice
         result = await invoice_service.process_invoice(
             file_data, content_type, filename
@@ -157,6 +203,7 @@ async def save_invoice_to_database(
 async def process_and_save_invoice(
     file: UploadFile = File(...),
     auto_save: bool = True,
+    allow_duplicates: bool = Query(False, description="Extract even if a near-duplicate invoice exists"),
     current_user: UserModel = Depends(get_current_user),
     invoice_service: InvoiceService = Depends(get_invoice_service),
     file_service: FileService = Depends(get_file_service)
@@ -173,27 +220,51 @@ async def process_and_save_invoice(
         logger.error(f"🚨 CRITICAL DEBUG - current_user.email: {current_user.email}")
         logger.error(f"🚨 CRITICAL DEBUG - File name: {file.filename}")
         
-        # First, save the uploaded file
-        file_id, file_info = await file_service.save_uploaded_file(file, str(current_user.id))
+        # First, stream the uploaded file to storage (size enforced while copying)
+        settings = get_settings()
+        try:
+            file_id, file_info = await file_service.save_uploaded_file(
+                file,
+                str(current_user.id),
+                max_size=settings.MAX_FILE_SIZE,
+                allowed_types=settings.ALLOWED_FILE_TYPES
+            )
+        except (FileTooLargeException, UnsupportedFileTypeException) as e:
+            raise HTTPException(status_code=400, detail=e.message)
         
-        # Read file data for processing
-        file_data = await file.read()
-        content_type = file.content_type or "application/octet-stream"
+        content_type = file_info["content_type"] or "application/octet-stream"
         filename = file.filename or "unknown"
         
-        # Validate file
-        is_valid, error_message = invoice_service.validate_file(
-            file_data, content_type
-        )
+        # The stored copy is authoritative; release the upload's spool now
+        await file.close()
         
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=error_message)
+        # Flag near-duplicates before spending an extraction on them
+        if not allow_duplicates:
+            duplicate_response = await _check_near_duplicates(
+                str(current_user.id), file_info.get("perceptual_hash"), exclude_file_id=file_id
+            )
+            if duplicate_response:
+                return {
+                    "parse_result": duplicate_response,
+                    "save_result": None,
+                    "pipeline_success": False
+                }
         
-        # Process and optionally save with file information
-        parse_result, save_result = await invoice_service.process_and_save_invoice(
-            file_data, content_type, filename, auto_save, str(current_user.id), 
-            file_id=file_id, original_filename=filename
-        )
+        # Map the stored file instead of reading it back into Python buffers
+        with file_service.storage.open_buffer(file_info["storage_key"]) as file_data:
+            # Validate file
+            is_valid, error_message = invoice_service.validate_file(
+                file_data, content_type
+            )
+            
+            if not is_valid:
+                raise HTTPException(status_code=400, detail=error_message)
+            
+            # Process and optionally save with file information
+            parse_result, save_result = await invoice_service.process_and_save_invoice(
+                file_data, content_type, filename, auto_save, str(current_user.id), 
+                file_id=file_id, original_filename=filename
+            )
         
         return {
             "parse_result": parse_result,
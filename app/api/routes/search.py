@@ -11,6 +11,7 @@ from fastapi import APIRouter, Depends, Query, HTTPException, status, Body
 from pydantic import BaseModel, Field
 
 from app.api.routes.auth import get_current_user
+from app.core.exceptions import ValidationException
 from app.core.logging_config import performance_monitor
 from app.models.database import UserModel
 from app.models.api_responses import success_response, error_response
@@ -42,6 +43,7 @@ class AdvancedSearchRequest(BaseModel):
     sort_by: Optional[SearchSortOrder] = Field(default=SearchSortOrder.RELEVANCE, description="Sort order")
     page: Optional[int] = Field(default=1, ge=1, description="Page number")
     limit: Optional[int] = Field(default=20, ge=1, le=100, description="Results per page")
+    cursor: Optional[str] = Field(None, description="next_cursor/prev_cursor from a previous page (overrides page)")
     include_facets: Optional[bool] = Field(default=False, description="Include facet counts")
 
 
@@ -58,6 +60,7 @@ async def search_invoices(
     sort_by: Optional[SearchSortOrder] = Query(SearchSortOrder.RELEVANCE, description="Sort order"),
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(20, ge=1, le=100, description="Results per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor/prev_cursor from a previous page (overrides page)"),
     include_facets: bool = Query(False, description="Include facet counts"),
     # Filter parameters
     min_amount: Optional[float] = Query(None, description="Minimum amount filter"),
@@ -80,7 +83,7 @@ async def search_invoices(
     - Amount, date, and confidence filtering
     - Multiple sorting options
     - Faceted search for refinement
-    - Pagination
+    - Pagination (opaque next/prev cursors, or legacy page numbers)
     
     Returns paginated search results with optional facets for search refinement.
     """
@@ -125,7 +128,8 @@ async def search_invoices(
             sort_by=sort_by,
             page=page,
             limit=limit,
-            include_facets=include_facets
+            include_facets=include_facets,
+            cursor=cursor
         )
         
         if search_results["success"]:
@@ -139,6 +143,8 @@ async def search_invoices(
                 error_details={"error": search_results.get("error")}
             )
             
+    except ValidationException:
+        raise
     except Exception as e:
         logger.error(f"Error in search endpoint: {e}")
         raise HTTPException(
@@ -187,7 +193,8 @@ async def advanced_search(
             sort_by=search_request.sort_by,
             page=search_request.page,
             limit=search_request.limit,
-            include_facets=search_request.include_facets
+            include_facets=search_request.include_facets,
+            cursor=search_request.cursor
         )
         
         if search_results["success"]:
@@ -201,6 +208,8 @@ async def advanced_search(
                 error_details={"error": search_results.get("error")}
             )
             
+    except ValidationException:
+        raise
     except Exception as e:
         logger.error(f"Error in advanced search endpoint: {e}")
         raise HTTPException(
@@ -366,7 +375,8 @@ async def get_available_filters():
                 "invoice_number": "Search only invoice numbers",
                 "vendor": "Search only vendor names",
                 "customer": "Search only customer names",
-                "description": "Search only line item descriptions",
+                "description": "Search line item descriptions (results report matched_line_items)",
+                "hsn_code": "Search line item HSN codes by prefix (results report matched_line_items)",
                 "raw_text": "Search only raw extracted text"
             },
             "sort_options": {
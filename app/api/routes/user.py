@@ -7,6 +7,7 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 
 from app.services.database_service import DatabaseService
+from app.services.count_service import invoice_count_service
 from app.models.database import UserModel
 from app.api.routes.auth import get_current_user
 from app.api.dependencies import get_database_service
@@ -19,8 +20,7 @@ logger = logging.getLogger(__name__)
 
 @router.get("/user/invoice-count")
 async def get_user_invoice_count(
-    current_user: UserModel = Depends(get_current_user),
-    db_service: DatabaseService = Depends(get_database_service)
+    current_user: UserModel = Depends(get_current_user)
 ):
     """
     Get user's invoice count for contextual routing.
@@ -31,9 +31,8 @@ async def get_user_invoice_count(
         - recommended_view: Suggested view based on user experience
     """
     try:
-        # Get user's invoice count
-        result = db_service.get_user_invoices(str(current_user.id), page=1, limit=1)
-        invoice_count = result["pagination"]["total"]
+        # Get user's invoice count from the maintained counter
+        invoice_count = invoice_count_service.get_user_invoice_count(str(current_user.id))
         
         # Determine recommended view
         if invoice_count == 0:
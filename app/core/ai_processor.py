@@ -4,7 +4,7 @@ AI Processing Service
 Handles AI-powered invoice data extraction using Google Gemini
 with structured output parsing and validation.
 """
-import base64
+import binascii
 import logging
 from typing import Optional
 from io import BytesIO
@@ -17,11 +17,47 @@ from langchain.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
 
 from app.core.config import get_settings
+from app.core.storage import Buffer
 from app.models.schemas import InvoiceDataSchema
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Base64 is encoded in input chunks that are a multiple of 3 bytes, so chunk
+# outputs concatenate without padding in between
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def build_data_url(data: Buffer, content_type: str) -> str:
+    """
+    Base64-encode a buffer into a data URL in fixed-size chunks.
+    
+    Output is written into one preallocated bytearray, so the only full-size
+    copies are that array and the final string; no intermediate bytes
+    objects of the whole file are created.
+    
+    Args:
+        data: Image contents (bytes, memoryview or mmap)
+        content_type: MIME type for the data URL
+        
+    Returns:
+        "data:<content_type>;base64,..." string
+    """
+    prefix = f"data:{content_type};base64,".encode("ascii")
+    
+    with memoryview(data) as view:
+        output = bytearray(len(prefix) + 4 * ((len(view) + 2) // 3))
+        output[:len(prefix)] = prefix
+        position = len(prefix)
+        
+        for offset in range(0, len(view), BASE64_CHUNK_SIZE):
+            encoded = binascii.b2a_base64(view[offset:offset + BASE64_CHUNK_SIZE], newline=False)
+            output[position:position + len(encoded)] = encoded
+            position += len(encoded)
+    
+    return output.decode("ascii")
+
+
 # Extraction prompt template
 EXTRACTION_PROMPT = """
 You are an expert at extracting structured data from Indian GST-compliant invoices. 
@@ -93,15 +129,17 @@ class AIProcessor:
         except Exception:
             return False
     
-    def preprocess_image(self, image_data: bytes, content_type: str) -> Image.Image:
-        """Preprocess image for AI processing."""
+    def preprocess_image(self, image_data: Buffer, content_type: str) -> Image.Image:
+        """
+        Check that the data is a readable image.
+        
+        Only the header is parsed; pixel data is never decoded because the
+        model receives the original encoded bytes.
+        """
         try:
-            image = Image.open(BytesIO(image_data))
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-                logger.info(f"Converted image from {image.mode} to RGB")
+            # mmap objects are file-like already; wrap other buffers without copying
+            source = image_data if hasattr(image_data, "seek") else BytesIO(image_data)
+            image = Image.open(source)
             
             logger.info(f"Image preprocessed: {image.size}, mode: {image.mode}")
             return image
@@ -109,17 +147,20 @@ class AIProcessor:
         except Exception as e:
             logger.error(f"Image preprocessing failed: {e}")
             raise ValueError(f"Invalid image data: {str(e)}")
+        finally:
+            if hasattr(image_data, "seek"):
+                image_data.seek(0)
     
     async def extract_invoice_data(
         self, 
-        image_data: bytes, 
+        image_data: Buffer, 
         content_type: str
     ) -> tuple[InvoiceDataSchema, str]:
         """
         Extract structured data from invoice image.
         
         Args:
-            image_data: Raw image bytes
+            image_data: Raw image bytes, or a memory-mapped stored file
             content_type: MIME type of the image
             
         Returns:
@@ -137,14 +178,13 @@ class AIProcessor:
             formatted_prompt = self.prompt_template.format()
             
             # Encode image for API
-            image_base64 = base64.b64encode(image_data).decode()
-            file_extension = content_type.split('/')[-1]
+            image_url = build_data_url(image_data, content_type)
             
             # Create message with image and prompt
             message = HumanMessage(
                 content=[
                     {"type": "text", "text": formatted_prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:{content_type};base64,{image_base64}"}}
+                    {"type": "image_url", "image_url": {"url": image_url}}
                 ]
             )
             
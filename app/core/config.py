@@ -56,6 +56,62 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_FILE_TYPES: list[str] = ["image/jpeg", "image/jpg", "image/png", "image/webp"]
     
+    # File Storage Configuration
+    UPLOAD_DIR: str = "uploads"
+    STORAGE_GC_INTERVAL_SECONDS: int = 3600  # How often unreferenced blobs are collected
+    STORAGE_GC_GRACE_SECONDS: int = 86400  # How long an unreferenced blob is kept
+    STORAGE_REAPER_INTERVAL_SECONDS: int = 600  # Pause between full orphan-file sweeps
+    STORAGE_REAPER_GRACE_SECONDS: int = 86400  # Unlinked uploads younger than this are kept
+    STORAGE_REAPER_BATCH_SIZE: int = 200
+    STORAGE_IO_BUDGET_BYTES_PER_SECOND: int = 20 * 1024 * 1024  # Throttle for background deletes
+    STORAGE_BACKEND: str = "local"  # "local", "s3" or "memory"
+    S3_BUCKET: str = ""
+    S3_PREFIX: str = ""
+    S3_ENDPOINT_URL: Optional[str] = None  # Set for MinIO / R2 / other S3-compatible stores
+    S3_REGION: Optional[str] = None
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    
+    # Thumbnail Configuration
+    THUMBNAIL_SIZES: list[int] = [150, 300, 500]  # Bounding boxes prebuilt after upload
+    THUMBNAIL_WORKERS: int = 2  # Processes used for resizing
+    
+    # Duplicate Detection Configuration
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 6  # Max differing dHash bits (of 64) for a near-duplicate
+    PHASH_INDEX_MAX_USERS: int = 1000  # Per-user hash trees kept in memory
+    
+    # Company Resolution Configuration
+    COMPANY_CACHE_MAX_ENTRIES: int = 10000  # GSTIN / normalized-name keys kept in memory
+    COMPANY_CACHE_TTL_SECONDS: int = 3600
+    COMPANY_MATCH_SIMILARITY_THRESHOLD: float = 0.85  # Trigram similarity of normalized names for fuzzy matches
+    COMPANY_MERGE_INTERVAL_SECONDS: int = 86400  # How often duplicate companies are merged
+    COMPANY_MERGE_BATCH_SIZE: int = 100  # Duplicate groups merged per transaction
+    
+    # Count Configuration
+    COUNT_CACHE_TTL_SECONDS: int = 30  # Filtered listing totals reused across pages
+    COUNT_CACHE_MAX_ENTRIES: int = 5000
+    COUNT_ESTIMATE_THRESHOLD: int = 100000  # Above this planner estimate, totals are approximate
+    
+    # Result Cache Configuration
+    RESULT_CACHE_TTL_SECONDS: int = 300  # Upper bound; writes invalidate a user's results immediately
+    RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # Serialized results kept in process memory
+    RESULT_CACHE_MAX_ENTRY_BYTES: int = 1024 * 1024  # Larger results are not cached
+    RESULT_CACHE_SHARED: bool = False  # Also share results and versions across workers via the database
+    
+    # Analytics Configuration
+    ANALYTICS_ROLLUP_BACKFILL_BATCH_SIZE: int = 100  # Users looked up per rollup backfill batch
+    
+    # Invoice Date Configuration
+    INVOICE_DATE_BACKFILL_BATCH_SIZE: int = 1000  # Invoices parsed per backfill transaction
+    
+    # Search Configuration
+    SEARCH_VECTOR_BACKFILL_BATCH_SIZE: int = 500  # Invoices indexed per backfill transaction
+    SUGGESTION_INDEX_MAX_USERS: int = 500  # Per-user typeahead indexes kept in memory
+    SUGGESTION_MIN_TERM_FREQUENCY: int = 2  # Line-item words suggested once they occur this often
+    
+    # Validation Configuration
+    VALIDATION_AMOUNT_TOLERANCE: float = 1.0  # Rounding tolerance for arithmetic checks
+    
     # Logging Configuration
     LOG_LEVEL: str = "INFO"
     
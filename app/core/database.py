@@ -5,8 +5,11 @@ Handles PostgreSQL connections via SQLAlchemy with proper error handling,
 connection pooling, and session management.
 """
 import logging
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
-from sqlalchemy import create_engine, Engine
+from sqlalchemy import create_engine, event, inspect, text, Engine
 from sqlalchemy.orm import sessionmaker, Session
 from contextlib import contextmanager
 
@@ -20,6 +23,77 @@ logger = logging.getLogger(__name__)
 engine: Optional[Engine] = None
 SessionLocal: Optional[sessionmaker] = None
 
+# Columns and indexes added after the first release; create_all only
+# builds them for tables it creates
+UPGRADE_COLUMNS = (
+    ("companies", "normalized_name", "VARCHAR(500)"),
+    ("companies", "normalized_version", "INTEGER"),
+    ("invoices", "invoice_date_parsed", "DATE"),
+    ("invoices", "due_date_parsed", "DATE"),
+    ("invoices", "search_vector", "TSVECTOR"),
+)
+UPGRADE_INDEXES = (
+    "uq_companies_gstin",
+    "uq_companies_name_without_gstin",
+    "idx_companies_normalized_name",
+    "idx_companies_normalized_name_search",
+    "idx_invoices_user_invoice_date",
+    "idx_invoices_user_due_date",
+    "idx_invoices_search_vector",
+    "idx_line_items_hsn_code",
+    "idx_line_items_description_search",
+)
+
+
+@dataclass
+class RoundTripCounter:
+    """Database round-trips issued inside a count_round_trips() block."""
+    statements: int = 0
+    transactions: int = 0
+    parent: Optional["RoundTripCounter"] = None
+    
+    @property
+    def total(self) -> int:
+        # Each transaction costs a BEGIN and a COMMIT/ROLLBACK on top of its statements
+        return self.statements + 2 * self.transactions
+
+
+_round_trip_counter: ContextVar[Optional[RoundTripCounter]] = ContextVar("round_trip_counter", default=None)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _round_trip_counter.get()
+    while counter is not None:
+        counter.statements += 1
+        counter = counter.parent
+
+
+def _count_transaction(conn):
+    counter = _round_trip_counter.get()
+    while counter is not None:
+        counter.transactions += 1
+        counter = counter.parent
+
+
+@contextmanager
+def count_round_trips():
+    """
+    Count database round-trips made by the current context.
+    
+    Usage:
+        with count_round_trips() as trips:
+            service.save_invoice_to_db(...)
+        trips.total
+    
+    Blocks nest; round-trips also count toward every enclosing block.
+    """
+    counter = RoundTripCounter(parent=_round_trip_counter.get())
+    token = _round_trip_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _round_trip_counter.reset(token)
+
 
 def get_database_engine() -> Engine:
     """Get or create database engine with connection pooling."""
@@ -35,6 +109,8 @@ def get_database_engine() -> Engine:
                 settings.DATABASE_URL,
                 **db_config
             )
+            event.listen(engine, "before_cursor_execute", _count_statement)
+            event.listen(engine, "begin", _count_transaction)
             logger.info(f"Database engine created successfully with config: {db_config}")
             logger.info(f"Pool size: {db_config['pool_size']}, Max overflow: {db_config['max_overflow']}")
         except Exception as e:
@@ -77,12 +153,59 @@ def create_tables() -> bool:
         engine = get_database_engine()
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully")
+        apply_schema_upgrades()
         return True
     except Exception as e:
         logger.error(f"Failed to create tables: {e}")
         return False
 
 
+def apply_schema_upgrades():
+    """
+    Bring tables created by earlier releases up to the current schema.
+    
+    Every step is idempotent and runs on its own, so one failure (for
+    example a unique index blocked by existing duplicates) does not stop
+    the others. Callers that depend on an upgrade check has_index().
+    """
+    engine = get_database_engine()
+    indexes = {
+        index.name: index
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+    }
+    
+    for table_name, column_name, column_type in UPGRADE_COLUMNS:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column_name} {column_type}"
+                ))
+        except Exception as e:
+            logger.warning(f"Schema upgrade: could not add column {table_name}.{column_name}: {e}")
+    
+    for name in UPGRADE_INDEXES:
+        try:
+            indexes[name].create(bind=engine, checkfirst=True)
+        except Exception as e:
+            logger.warning(f"Schema upgrade: could not create index {name}: {e}")
+    
+    has_index.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def has_index(table_name: str, index_name: str) -> bool:
+    """Whether an index exists in the live database (cached per process)."""
+    try:
+        return any(
+            index["name"] == index_name
+            for index in inspect(get_database_engine()).get_indexes(table_name)
+        )
+    except Exception as e:
+        logger.error(f"Failed to inspect indexes of {table_name}: {e}")
+        return False
+
+
 def health_check_db() -> dict[str, any]:
     """Check database connection health."""
     try:
@@ -0,0 +1,228 @@
+"""
+HTTP Caching Helpers
+
+Conditional request handling (ETag / Last-Modified), long-lived caching
+headers and single byte-range support for serving objects from a storage
+backend.
+"""
+import logging
+import re
+import unicodedata
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request, HTTPException, status
+from fastapi.responses import Response, FileResponse, StreamingResponse
+
+from app.core.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Stored files never change once written, so clients may keep them for a year.
+# "private" because every file is behind per-user authentication.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def build_etag(content_key: str, variant: Optional[str] = None) -> str:
+    """
+    Build a strong ETag from a content hash.
+    
+    Args:
+        content_key: Content hash of the stored file
+        variant: Optional representation suffix (e.g. thumbnail size)
+        
+    Returns:
+        Quoted ETag value
+    """
+    tag = f"{content_key}-{variant}" if variant else content_key
+    return f'"{tag}"'
+
+
+def _etag_matches(header_value: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag (RFC 9110 13.1.2)."""
+    if header_value.strip() == "*":
+        return True
+    
+    opaque = etag.removeprefix("W/")
+    for candidate in header_value.split(","):
+        if candidate.strip().removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    """
+    Check conditional request headers.
+    
+    If-None-Match takes precedence over If-Modified-Since when both are sent.
+    
+    Args:
+        request: Incoming request
+        etag: Current ETag of the representation
+        last_modified: Modification time as a POSIX timestamp
+        
+    Returns:
+        True if a 304 Not Modified response should be sent
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= int(since)
+    
+    return False
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range.
+    
+    Multi-range requests are answered with the full representation, which
+    RFC 9110 allows.
+    
+    Args:
+        range_header: Value of the Range header
+        file_size: Size of the file in bytes
+        
+    Returns:
+        Inclusive (start, end) tuple, or None to serve the full file
+        
+    Raises:
+        HTTPException: 416 if the range cannot be satisfied
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    
+    start_text, _, end_text = ranges.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        else:
+            # Suffix range: last N bytes
+            suffix_length = int(end_text)
+            if suffix_length == 0:
+                raise ValueError("Empty suffix range")
+            start = max(file_size - suffix_length, 0)
+            end = file_size - 1
+    except ValueError:
+        return None
+    
+    if start >= file_size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    
+    return start, min(end, file_size - 1)
+
+
+def content_disposition(disposition_type: str, filename: str) -> str:
+    """
+    Build a Content-Disposition header value for a user-supplied filename (RFC 6266).
+    
+    The exact name goes in filename* (UTF-8, percent-encoded); filename
+    carries an ASCII fallback with quotes, separators and control
+    characters replaced, so any name yields a valid latin-1 header.
+    """
+    fallback = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode()
+    fallback = re.sub(r'[\x00-\x1f\x7f"\\;,]', "_", fallback).strip()
+    if not fallback or fallback.startswith("."):
+        # Nothing of the name survived except perhaps its extension
+        fallback = f"download{fallback}"
+    if fallback == filename:
+        return f'{disposition_type}; filename="{filename}"'
+    return f"{disposition_type}; filename=\"{fallback}\"; filename*=utf-8''{quote(filename, safe='')}"
+
+
+def cached_file_response(
+    request: Request,
+    storage: StorageBackend,
+    key: str,
+    etag: str,
+    media_type: str,
+    filename: Optional[str] = None,
+    content_disposition_type: str = "attachment",
+    immutable: bool = True
+) -> Response:
+    """
+    Serve a stored object with validators, caching headers and range support.
+    
+    Args:
+        request: Incoming request
+        storage: Storage backend holding the object
+        key: Storage key of the object
+        etag: Strong ETag for the object contents
+        media_type: Content type of the response
+        filename: Optional download filename
+        content_disposition_type: "attachment" or "inline"
+        immutable: Whether the object can be cached for a long time without revalidation
+        
+    Returns:
+        304, 206 or 200 response
+        
+    Raises:
+        HTTPException: 404 if the object is missing, 416 for unsatisfiable ranges
+    """
+    stored = storage.stat(key)
+    if not stored:
+        logger.warning(f"Stored object missing: {key}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stored.last_modified, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if filename:
+        headers["Content-Disposition"] = content_disposition(content_disposition_type, filename)
+    
+    if is_not_modified(request, etag, stored.last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, stored.size)
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{stored.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                storage.get_range(key, start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=media_type,
+                headers=headers
+            )
+    
+    # Local files go through sendfile; other backends are streamed in chunks
+    local_path = storage.local_path(key)
+    if local_path:
+        return FileResponse(path=str(local_path), media_type=media_type, headers=headers)
+    
+    headers["Content-Length"] = str(stored.size)
+    return StreamingResponse(storage.get(key), media_type=media_type, headers=headers)
+
+
+__all__ = [
+    "build_etag",
+    "is_not_modified",
+    "parse_range",
+    "cached_file_response",
+    "content_disposition",
+    "IMMUTABLE_CACHE_CONTROL",
+]
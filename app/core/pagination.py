@@ -0,0 +1,255 @@
+"""
+Keyset Pagination
+
+Cursor-based pagination over an ordered list of sort keys. A cursor is an
+opaque, URL-safe token holding the sort-key values of the row at a page
+boundary, so each page is an index range scan that starts where the last
+one ended instead of an OFFSET that reads and discards every earlier row.
+"""
+import base64
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, tuple_
+
+from app.core.exceptions import ValidationException
+from app.core.monitoring import app_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PageDirection(str, Enum):
+    """Which side of the boundary row a cursor continues on."""
+    NEXT = "next"
+    PREV = "prev"
+
+
+@dataclass(frozen=True)
+class SortKey:
+    """One ORDER BY term; the last key of a listing must be unique (usually the id)."""
+    expression: Any
+    descending: bool = False
+    nullable: bool = True
+
+
+@dataclass
+class Cursor:
+    """Decoded cursor: boundary sort-key values, direction and page number."""
+    values: List[Any]
+    direction: PageDirection
+    page: int = 1
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    if isinstance(value, uuid.UUID):
+        return {"u": str(value)}
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    if "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    if "d" in value:
+        return date.fromisoformat(value["d"])
+    if "n" in value:
+        return Decimal(value["n"])
+    if "u" in value:
+        return uuid.UUID(value["u"])
+    raise ValueError(f"Unknown cursor value {value}")
+
+
+def encode_cursor(values: List[Any], direction: PageDirection, page: int) -> str:
+    """Encode boundary sort-key values as an opaque cursor."""
+    payload = {"v": [_encode_value(value) for value in values], "d": direction.value, "p": page}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str, key_count: int) -> Cursor:
+    """
+    Decode a cursor produced by encode_cursor.
+    
+    Raises:
+        ValidationException: If the cursor is malformed or was issued for a
+            different sort order
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        values = [_decode_value(value) for value in payload["v"]]
+        cursor = Cursor(values=values, direction=PageDirection(payload["d"]), page=int(payload["p"]))
+    except Exception:
+        raise ValidationException("Invalid pagination cursor", details={"cursor": token})
+    
+    if len(cursor.values) != key_count:
+        raise ValidationException("Pagination cursor does not match the sort order", details={"cursor": token})
+    return cursor
+
+
+def order_by_keys(keys: List[SortKey], reverse: bool = False) -> list:
+    """ORDER BY clauses for the keys, optionally in reverse (for previous pages)."""
+    return [
+        key.expression.desc() if key.descending != reverse else key.expression.asc()
+        for key in keys
+    ]
+
+
+def _after(key: SortKey, value: Any, descending: bool):
+    """Rows strictly after value on one key, under PostgreSQL's default NULL placement."""
+    # NULLs sort as larger than any value: last ascending, first descending
+    if not descending:
+        if value is None:
+            return None
+        condition = key.expression > value
+        return or_(condition, key.expression.is_(None)) if key.nullable else condition
+    
+    if value is None:
+        return key.expression.isnot(None)
+    return key.expression < value
+
+
+def _equal(key: SortKey, value: Any):
+    return key.expression.is_(None) if value is None else key.expression == value
+
+
+def keyset_condition(keys: List[SortKey], values: List[Any], reverse: bool = False):
+    """
+    Filter for rows that follow the boundary row in (possibly reversed) key order.
+    
+    Uniform-direction, non-null keys use a row comparison so the planner can
+    seek a composite index directly; mixed directions and NULLs expand to
+    the equivalent OR chain.
+    """
+    directions = {key.descending != reverse for key in keys}
+    if len(directions) == 1 and all(not key.nullable for key in keys) and None not in values:
+        left = tuple_(*[key.expression for key in keys])
+        right = tuple_(*values)
+        return left < right if directions.pop() else left > right
+    
+    terms = []
+    for index, key in enumerate(keys):
+        after = _after(key, values[index], key.descending != reverse)
+        if after is not None:
+            ties = [_equal(prior, values[position]) for position, prior in enumerate(keys[:index])]
+            terms.append(and_(*ties, after))
+    return or_(*terms)
+
+
+def _depth_bucket(page: int) -> str:
+    if page <= 1:
+        return "1"
+    if page <= 10:
+        return "2-10"
+    if page <= 100:
+        return "11-100"
+    return "100+"
+
+
+def paginate(
+    query,
+    keys: List[SortKey],
+    limit: int,
+    cursor: Optional[str] = None,
+    page: int = 1,
+    metric_name: str = "keyset_page",
+    window_total: bool = False
+) -> Tuple[list, Dict[str, Any]]:
+    """
+    Fetch one page of an ORM query ordered by keys.
+    
+    With a cursor the page is located by seeking past the boundary row;
+    without one, `page` selects a legacy OFFSET page. Either way the
+    response carries next/prev cursors, so clients can switch to keyset
+    paging from any page. Query latency is recorded per mode and page
+    depth as `<metric_name>_duration_ms`, so offset and keyset pages can
+    be compared at increasing depth.
+    
+    With window_total, offset pages also select COUNT(*) OVER () and
+    report the filtered total as pagination["total"] without a separate
+    count query. Keyset pages cannot (the window only sees rows past the
+    cursor), nor can empty pages; callers fall back to a count strategy.
+    
+    Args:
+        query: ORM query (an entity or a column projection), filtered but not ordered
+        keys: Sort keys, ending with a unique key
+        limit: Page size
+        cursor: Cursor from a previous response
+        page: Page number for offset pagination (ignored with a cursor)
+        metric_name: Prefix for the latency metric
+        window_total: Compute the total in the page query (offset pages only)
+    
+    Returns:
+        (entities or projection rows, pagination dict)
+    """
+    decoded = decode_cursor(cursor, len(keys)) if cursor else None
+    reverse = decoded is not None and decoded.direction == PageDirection.PREV
+    selected = len(query.column_descriptions)
+    key_columns = slice(selected, selected + len(keys))
+    
+    query = query.add_columns(*[key.expression.label(f"sort_key_{index}") for index, key in enumerate(keys)])
+    if decoded:
+        query = query.filter(keyset_condition(keys, decoded.values, reverse))
+        page = decoded.page + (-1 if reverse else 1)
+    else:
+        query = query.offset((page - 1) * limit)
+        if window_total:
+            query = query.add_columns(func.count().over().label("window_total"))
+    
+    started = time.perf_counter()
+    rows = query.order_by(*order_by_keys(keys, reverse)).limit(limit + 1).all()
+    app_metrics.metrics.record_timing(
+        metric_name,
+        (time.perf_counter() - started) * 1000,
+        tags={"mode": "keyset" if decoded else "offset", "depth": _depth_bucket(page)}
+    )
+    
+    total = rows[0].window_total if rows and window_total and not decoded else None
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if reverse:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, page > 1
+    
+    pagination = {
+        "page": page,
+        "limit": limit,
+        "has_next": has_next,
+        "has_prev": has_prev,
+        "next_cursor": encode_cursor(list(rows[-1][key_columns]), PageDirection.NEXT, page) if rows and has_next else None,
+        "prev_cursor": encode_cursor(list(rows[0][key_columns]), PageDirection.PREV, page) if rows and has_prev else None
+    }
+    if total is not None:
+        pagination["total"] = total
+    return [row[0] for row in rows] if selected == 1 else rows, pagination
+
+
+__all__ = [
+    "Cursor",
+    "PageDirection",
+    "SortKey",
+    "decode_cursor",
+    "encode_cursor",
+    "keyset_condition",
+    "order_by_keys",
+    "paginate",
+]
@@ -257,6 +257,11 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         # Add custom headers
         headers_to_apply.update(self.custom_headers)
         
+        # Keep caching policy chosen by the route (e.g. immutable stored files)
+        if "cache-control" in response.headers:
+            for header_name in ("Cache-Control", "Pragma", "Expires"):
+                headers_to_apply.pop(header_name, None)
+        
         # Apply headers to response
         for header_name, header_value in headers_to_apply.items():
             response.headers[header_name] = header_value
@@ -0,0 +1,410 @@
+"""
+File Storage Backends
+
+Provides a storage interface for all file I/O so uploads, blobs and
+thumbnails can live on local disk or on shared S3-compatible storage.
+
+Keys are "/"-separated paths such as "blobs/<sha256>" or
+"thumbnails/<user_id>/<sha256>_150.webp".
+"""
+import logging
+import mmap
+import os
+import shutil
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import Enum
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Any, Union
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Read and write objects in fixed-size chunks so a file is never held in memory whole
+STORAGE_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Anything supporting the buffer protocol, file-style read/seek for mmap
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+class StorageBackendType(str, Enum):
+    """Available storage backends."""
+    LOCAL = "local"
+    S3 = "s3"
+    MEMORY = "memory"
+
+
+@dataclass
+class StoredObject:
+    """Metadata for a stored object."""
+    key: str
+    size: int
+    last_modified: float  # POSIX timestamp
+    content_type: Optional[str] = None
+
+
+class StorageBackend(ABC):
+    """Abstract base class for file storage backends."""
+    
+    @abstractmethod
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        """Store an object from a file-like stream and return its size."""
+        pass
+    
+    @abstractmethod
+    def get(self, key: str) -> Iterator[bytes]:
+        """Stream an object's contents in chunks."""
+        pass
+    
+    @abstractmethod
+    def get_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        """Stream an inclusive byte range of an object in chunks."""
+        pass
+    
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Delete an object. Returns False if it did not exist."""
+        pass
+    
+    @abstractmethod
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        """List objects whose keys start with prefix."""
+        pass
+    
+    @abstractmethod
+    def stat(self, key: str) -> Optional[StoredObject]:
+        """Get object metadata, or None if it does not exist."""
+        pass
+    
+    def put_file(self, key: str, file_path: Path, content_type: Optional[str] = None) -> int:
+        """Store a local file. The caller keeps ownership of file_path."""
+        with open(file_path, "rb") as stream:
+            return self.put(key, stream, content_type)
+    
+    def exists(self, key: str) -> bool:
+        """Check whether an object exists."""
+        return self.stat(key) is not None
+    
+    def read(self, key: str) -> bytes:
+        """Read a whole object into memory (for small objects only)."""
+        return b"".join(self.get(key))
+    
+    def local_path(self, key: str) -> Optional[Path]:
+        """Get a local filesystem path for the object, if the backend has one."""
+        return None
+    
+    @contextmanager
+    def open_buffer(self, key: str) -> Iterator[Buffer]:
+        """
+        Expose an object's contents as a read-only buffer.
+        
+        Backends without local files read the object once into memory;
+        LocalStorageBackend maps the file instead of copying it.
+        """
+        yield self.read(key)
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Local-disk storage with sharded directories.
+    
+    The last key segment is sharded by its first four characters, so
+    "blobs/abcdef..." is stored at "<root>/blobs/ab/cd/abcdef...". This keeps
+    directory sizes bounded for hash-named objects.
+    """
+    
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+    
+    def _path(self, key: str) -> Path:
+        """Map a key to its sharded path."""
+        parts = [part for part in key.split("/") if part]
+        if not parts or any(part in (".", "..") for part in parts):
+            raise ValueError(f"Invalid storage key: {key!r}")
+        
+        name = parts[-1]
+        shard = [name[:2], name[2:4]] if len(name) > 4 else []
+        return self.root.joinpath(*parts[:-1], *shard, name)
+    
+    def _key(self, path: Path) -> str:
+        """Map a sharded path back to its key."""
+        parts = list(path.relative_to(self.root).parts)
+        name = parts[-1]
+        if len(name) > 4 and len(parts) >= 3 and parts[-3] == name[:2] and parts[-2] == name[2:4]:
+            del parts[-3:-1]
+        return "/".join(parts)
+    
+    def _stored_object(self, key: str, path: Path) -> StoredObject:
+        stat_result = path.stat()
+        return StoredObject(key=key, size=stat_result.st_size, last_modified=stat_result.st_mtime)
+    
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Write to a temporary name and rename, so readers never see partial objects
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(temp_path, "wb") as buffer:
+                shutil.copyfileobj(stream, buffer, STORAGE_CHUNK_SIZE)
+            os.replace(temp_path, path)
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+        
+        return path.stat().st_size
+    
+    def put_file(self, key: str, file_path: Path, content_type: Optional[str] = None) -> int:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Hard-link when possible so staging files on the same disk are not copied
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        try:
+            try:
+                os.link(file_path, temp_path)
+            except OSError:
+                shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+        
+        return path.stat().st_size
+    
+    def get(self, key: str) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as f:
+            while chunk := f.read(STORAGE_CHUNK_SIZE):
+                yield chunk
+    
+    def get_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        remaining = end - start + 1
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(STORAGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    
+    def delete(self, key: str) -> bool:
+        path = self._path(key)
+        try:
+            path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+    
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        # Walk the deepest directory the prefix fully names, then filter by key
+        directory = self.root.joinpath(*[part for part in prefix.split("/")[:-1] if part])
+        if not directory.is_dir():
+            return
+        
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                path = Path(dirpath) / filename
+                key = self._key(path)
+                if key.startswith(prefix):
+                    yield self._stored_object(key, path)
+    
+    def stat(self, key: str) -> Optional[StoredObject]:
+        path = self._path(key)
+        try:
+            return self._stored_object(key, path)
+        except FileNotFoundError:
+            return None
+    
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+    
+    @contextmanager
+    def open_buffer(self, key: str) -> Iterator[Buffer]:
+        # Pages come straight from the OS page cache; nothing is copied into Python
+        with open(self._path(key), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3-compatible object storage (AWS S3, MinIO, R2, ...).
+    
+    Takes a boto3-style client so tests can pass an in-process fake
+    (e.g. a moto-backed client) instead of talking to a real endpoint.
+    """
+    
+    def __init__(self, bucket: str, client: Any = None, prefix: str = ""):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = client or self._create_client()
+    
+    @staticmethod
+    def _create_client() -> Any:
+        """Create a boto3 client from settings."""
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("S3 storage backend requires boto3 (pip install 'invoice-parser[s3]')") from e
+        
+        settings = get_settings()
+        return boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL or None,
+            region_name=settings.S3_REGION or None,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None
+        )
+    
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+    
+    @staticmethod
+    def _is_not_found(error: Exception) -> bool:
+        response = getattr(error, "response", None) or {}
+        return response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+    
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        extra_args = {"ContentType": content_type} if content_type else {}
+        # upload_fileobj streams in multipart chunks for large objects
+        self.client.upload_fileobj(stream, self.bucket, self._object_key(key), ExtraArgs=extra_args)
+        return self.stat(key).size
+    
+    def _stream_body(self, **kwargs) -> Iterator[bytes]:
+        response = self.client.get_object(Bucket=self.bucket, **kwargs)
+        body = response["Body"]
+        try:
+            while chunk := body.read(STORAGE_CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+    
+    def get(self, key: str) -> Iterator[bytes]:
+        return self._stream_body(Key=self._object_key(key))
+    
+    def get_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        return self._stream_body(Key=self._object_key(key), Range=f"bytes={start}-{end}")
+    
+    def delete(self, key: str) -> bool:
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+    
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object_key(prefix)):
+            for item in page.get("Contents", []):
+                yield StoredObject(
+                    key=item["Key"][len(self.prefix):],
+                    size=item["Size"],
+                    last_modified=item["LastModified"].timestamp()
+                )
+    
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        
+        return StoredObject(
+            key=key,
+            size=response["ContentLength"],
+            last_modified=response["LastModified"].timestamp(),
+            content_type=response.get("ContentType")
+        )
+
+
+class InMemoryStorageBackend(StorageBackend):
+    """In-memory storage (not suitable for multi-instance deployments)."""
+    
+    def __init__(self):
+        self._objects: Dict[str, StoredObject] = {}
+        self._data: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+    
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        data = stream.read()
+        with self._lock:
+            self._data[key] = data
+            self._objects[key] = StoredObject(
+                key=key,
+                size=len(data),
+                last_modified=datetime.now(timezone.utc).timestamp(),
+                content_type=content_type
+            )
+        return len(data)
+    
+    def _require(self, key: str) -> bytes:
+        with self._lock:
+            if key not in self._data:
+                raise FileNotFoundError(key)
+            return self._data[key]
+    
+    def get(self, key: str) -> Iterator[bytes]:
+        data = self._require(key)
+        for offset in range(0, len(data), STORAGE_CHUNK_SIZE):
+            yield data[offset:offset + STORAGE_CHUNK_SIZE]
+    
+    def get_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        yield self._require(key)[start:end + 1]
+    
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            self._objects.pop(key, None)
+            return self._data.pop(key, None) is not None
+    
+    def list(self, prefix: str = "") -> Iterator[StoredObject]:
+        with self._lock:
+            objects = [obj for key, obj in self._objects.items() if key.startswith(prefix)]
+        yield from objects
+    
+    def stat(self, key: str) -> Optional[StoredObject]:
+        with self._lock:
+            return self._objects.get(key)
+
+
+@lru_cache()
+def get_storage_backend() -> StorageBackend:
+    """Get the configured storage backend (one per process)."""
+    settings = get_settings()
+    backend_type = StorageBackendType(settings.STORAGE_BACKEND)
+    
+    if backend_type == StorageBackendType.S3:
+        logger.info(f"Using S3 storage backend (bucket={settings.S3_BUCKET})")
+        return S3StorageBackend(settings.S3_BUCKET, prefix=settings.S3_PREFIX)
+    
+    if backend_type == StorageBackendType.MEMORY:
+        logger.info("Using in-memory storage backend")
+        return InMemoryStorageBackend()
+    
+    logger.info(f"Using local storage backend ({settings.UPLOAD_DIR})")
+    return LocalStorageBackend(settings.UPLOAD_DIR)
+
+
+__all__ = [
+    "StorageBackend",
+    "StorageBackendType",
+    "StoredObject",
+    "LocalStorageBackend",
+    "S3StorageBackend",
+    "InMemoryStorageBackend",
+    "get_storage_backend",
+    "STORAGE_CHUNK_SIZE",
+    "Buffer",
+]
@@ -427,6 +427,71 @@ def sanitize_search_query(query: str) -> str:
     return sanitized.strip()
 
 
+# Formats seen in extracted invoice dates; numeric dates are read day-first
+INVOICE_DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%Y.%m.%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%y",
+    "%d-%m-%y",
+    "%d.%m.%y",
+    "%d %b %Y",
+    "%d %B %Y",
+    "%d-%b-%Y",
+    "%d-%B-%Y",
+    "%d-%b-%y",
+    "%d %b %y",
+    "%b %d %Y",
+    "%B %d %Y",
+    "%Y%m%d",
+]
+
+_ORDINAL_SUFFIX = re.compile(r'(?<=\d)(st|nd|rd|th)\b', re.IGNORECASE)
+
+
+def parse_invoice_date(value: Any) -> Optional[date]:
+    """
+    Parse an extracted invoice date into a date.
+    
+    Accepts ISO dates (with or without a time part), day-first numeric
+    dates with 2- or 4-digit years and dates with month names
+    ("15 Mar 2024", "15-Mar-24", "March 15th, 2024").
+    
+    Returns:
+        The date, or None if the value is empty, unrecognised or outside
+        1900-2100
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    
+    text = _ORDINAL_SUFFIX.sub("", str(value).strip())
+    text = re.sub(r'\s*,\s*|\s+', ' ', text).strip()
+    text = re.sub(r'\bSept\b', 'Sep', text, flags=re.IGNORECASE)
+    if not text:
+        return None
+    
+    # ISO timestamps ("2024-03-15T00:00:00Z") keep only the date part
+    if re.match(r'^\d{4}-\d{2}-\d{2}[T ]', text):
+        text = text[:10]
+    
+    for format_str in INVOICE_DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(text, format_str).date()
+        except ValueError:
+            continue
+        if date(1900, 1, 1) <= parsed <= date(2100, 12, 31):
+            return parsed
+        return None
+    return None
+
+
 # Install email-validator if not present
 try:
     import email_validator
@@ -450,5 +515,7 @@ __all__ = [
     "InvoiceDataValidator",
     "validate_and_sanitize_dict",
     "sanitize_search_query",
+    "parse_invoice_date",
+    "INVOICE_DATE_FORMATS",
     "ValidationException"
 ]
@@ -29,6 +29,12 @@ async def init_database():
         return False
 from app.core.logging_config import setup_logging, RequestLoggingMiddleware
 from app.core.monitoring import start_monitoring, stop_monitoring
+from app.services.file_service import storage_gc, orphan_file_reaper
+from app.services.thumbnail_service import thumbnail_service
+from app.services.analytics_rollup_service import analytics_rollup_backfill_job
+from app.services.company_service import company_merge_job
+from app.services.invoice_date_service import invoice_date_backfill_job
+from app.services.search_index_service import search_vector_backfill_job
 from app.core.rate_limiting import create_production_rate_limiter
 from app.core.security_headers import create_security_middleware
 from app.core.exceptions import (
@@ -69,6 +75,31 @@ async def lifespan(app: FastAPI):
         logger.info("Starting application monitoring...")
         await start_monitoring()
         
+        # Start storage garbage collection
+        logger.info("Starting storage garbage collector...")
+        await storage_gc.start()
+        await orphan_file_reaper.start()
+        
+        # Start thumbnail workers
+        logger.info("Starting thumbnail workers...")
+        await thumbnail_service.start()
+        
+        # Start duplicate company merging
+        logger.info("Starting company merge job...")
+        await company_merge_job.start()
+        
+        # Parse dates of invoices saved before the typed date columns existed
+        logger.info("Starting invoice date backfill...")
+        await invoice_date_backfill_job.start()
+        
+        # Index invoices saved before the stored search vector existed
+        logger.info("Starting search vector backfill...")
+        await search_vector_backfill_job.start()
+        
+        # Build analytics rollups of users whose invoices predate them
+        logger.info("Starting analytics rollup backfill...")
+        await analytics_rollup_backfill_job.start()
+        
         logger.info("Application startup complete")
     except Exception as e:
         logger.error(f"Startup error: {e}")
@@ -79,6 +110,13 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down monitoring...")
     stop_monitoring()
+    storage_gc.stop()
+    orphan_file_reaper.stop()
+    thumbnail_service.stop()
+    company_merge_job.stop()
+    invoice_date_backfill_job.stop()
+    search_vector_backfill_job.stop()
+    analytics_rollup_backfill_job.stop()
     logger.info("Application shutdown complete")
 
 
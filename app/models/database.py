@@ -4,10 +4,11 @@ SQLAlchemy Database Models
 These models define the database schema and relationships
 for persistent storage of invoice data.
 """
-from sqlalchemy import Column, String, Text, DECIMAL, Integer, DateTime, ForeignKey, Enum, Index, Boolean
+from sqlalchemy import Column, String, Text, DECIMAL, Integer, BigInteger, Date, DateTime, ForeignKey, Enum, Index, Boolean
+from sqlalchemy import select, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship, deferred, column_property
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 from datetime import datetime
 import uuid
 import enum
@@ -53,6 +54,8 @@ class CompanyModel(Base):
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     company_name = Column(String(500), nullable=False)  # Increased for long company names
+    normalized_name = Column(String(500), nullable=True)  # Lowercased, punctuation and legal suffixes stripped
+    normalized_version = Column(Integer, nullable=True)  # Rules version (NORMALIZATION_VERSION) that wrote normalized_name
     gstin = Column(String(15), nullable=True)  # GST Identification Number
     phone = Column(String(100), nullable=True)  # Increased for multiple phone numbers
     email = Column(String(320), nullable=True)  # Standard email max length
@@ -96,13 +99,19 @@ class InvoiceModel(Base):
     invoice_number = Column(String(100), unique=True, nullable=True)
     invoice_date = Column(String(20), nullable=True)  # Store as string to match Pydantic model
     due_date = Column(String(20), nullable=True)
+    # Parsed copies of the extracted dates for range filters (NULL when unparseable)
+    invoice_date_parsed = Column(Date, nullable=True)
+    due_date_parsed = Column(Date, nullable=True)
     currency = Column(String(10), default="INR")
     gross_amount = Column(DECIMAL(15, 2), nullable=True)
     net_amount = Column(DECIMAL(15, 2), nullable=True)
     amount_in_words = Column(Text, nullable=True)
     qr_code_data = Column(Text, nullable=True)
     extraction_confidence = Column(Enum(ExtractionConfidence), default=ExtractionConfidence.medium)
-    raw_text = Column(Text, nullable=True)
+    raw_text = deferred(Column(Text, nullable=True))  # Large; loaded only by detail views (undefer)
+    # Weighted full-text document (number A, company names B, line items C, raw text D);
+    # written with the invoice, see services.search_index_service
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
     
     # File references
     original_file_id = Column(String(255), nullable=True)  # Reference to uploaded file
@@ -122,6 +131,7 @@ class InvoiceModel(Base):
     user = relationship("UserModel", back_populates="invoices")
     line_items = relationship("LineItemModel", back_populates="invoice", cascade="all, delete-orphan")
     tax_calculation = relationship("TaxCalculationModel", back_populates="invoice", uselist=False, cascade="all, delete-orphan")
+    validation_findings = relationship("InvoiceValidationFindingModel", back_populates="invoice", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Invoice(id={self.id}, number='{self.invoice_number}', amount={self.net_amount})>"
@@ -170,6 +180,213 @@ class TaxCalculationModel(Base):
         return f"<TaxCalculation(id={self.id}, invoice_id={self.invoice_id}, total_tax={self.total_tax})>"
 
 
+class InvoiceValidationFindingModel(Base):
+    """Validation findings table - results of bulk arithmetic and GST checks."""
+    __tablename__ = "invoice_validation_findings"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    invoice_id = Column(UUID(as_uuid=True), ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False)
+    line_item_id = Column(UUID(as_uuid=True), nullable=True)  # Set for line-level findings
+    check_type = Column(String(50), nullable=False)  # See ValidationCheck in invoice_validation_service
+    severity = Column(String(20), nullable=False, default="error")
+    message = Column(Text, nullable=False)
+    expected_value = Column(DECIMAL(15, 2), nullable=True)
+    actual_value = Column(DECIMAL(15, 2), nullable=True)
+    operation_id = Column(String(36), nullable=True)  # Bulk operation that produced the finding
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    invoice = relationship("InvoiceModel", back_populates="validation_findings")
+    
+    def __repr__(self):
+        return f"<InvoiceValidationFinding(id={self.id}, invoice_id={self.invoice_id}, check='{self.check_type}')>"
+
+
+class FileBlobModel(Base):
+    """File blobs table - content-addressed file storage with reference counts."""
+    __tablename__ = "file_blobs"
+    
+    sha256 = Column(String(64), primary_key=True)  # Hex digest, also the storage key
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(100), nullable=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    orphaned_at = Column(DateTime, nullable=True)  # Set when ref_count drops to zero
+    
+    # Relationships
+    references = relationship("FileReferenceModel", back_populates="blob")
+    
+    def __repr__(self):
+        return f"<FileBlob(sha256='{self.sha256[:12]}', size={self.size}, refs={self.ref_count})>"
+
+
+class FileReferenceModel(Base):
+    """File references table - per-user handles onto shared blobs."""
+    __tablename__ = "file_references"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(String(255), unique=True, nullable=False)  # "<user_id>/<secure_filename>"
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    sha256 = Column(String(64), ForeignKey("file_blobs.sha256"), nullable=False)
+    original_name = Column(String(255), nullable=True)
+    content_type = Column(String(100), nullable=True)
+    size = Column(BigInteger, nullable=False)
+    invoice_id = Column(UUID(as_uuid=True), ForeignKey("invoices.id", ondelete="SET NULL"), nullable=True)
+    perceptual_hash = Column(BigInteger, nullable=True)  # 64-bit dHash (signed) for near-duplicate lookup
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    blob = relationship("FileBlobModel", back_populates="references")
+    
+    def __repr__(self):
+        return f"<FileReference(file_id='{self.file_id}', sha256='{self.sha256[:12]}')>"
+
+
+class UserBlobModel(Base):
+    """Per-user reference counts of blobs; a user's physical usage counts each blob they reference once."""
+    __tablename__ = "user_blobs"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    sha256 = Column(String(64), primary_key=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<UserBlob(user_id='{self.user_id}', sha256='{self.sha256[:12]}', refs={self.ref_count})>"
+
+
+class UserStorageStatsModel(Base):
+    """Per-user storage totals, maintained alongside file references."""
+    __tablename__ = "user_storage_stats"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    file_count = Column(Integer, nullable=False, default=0)
+    logical_bytes = Column(BigInteger, nullable=False, default=0)  # Sum over all references
+    physical_bytes = Column(BigInteger, nullable=False, default=0)  # Sum over distinct blobs
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<UserStorageStats(user_id='{self.user_id}', files={self.file_count})>"
+
+
+class UserInvoiceStatsModel(Base):
+    """Per-user invoice totals, maintained by the save and delete paths."""
+    __tablename__ = "user_invoice_stats"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<UserInvoiceStats(user_id='{self.user_id}', invoices={self.invoice_count})>"
+
+
+class UserCacheVersionModel(Base):
+    """Per-user data version for the shared result cache tier, bumped with each invoice write."""
+    __tablename__ = "user_cache_versions"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<UserCacheVersion(user_id='{self.user_id}', version={self.version})>"
+
+
+class ResultCacheEntryModel(Base):
+    """Shared result cache tier: serialized results keyed by user, endpoint, params and version."""
+    __tablename__ = "result_cache_entries"
+    
+    cache_key = Column(String(200), primary_key=True)
+    value = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<ResultCacheEntry(key='{self.cache_key}', expires_at={self.expires_at})>"
+
+
+class InvoiceDailyRollupModel(Base):
+    """Per-user daily invoice aggregates by currency, vendor and customer, maintained by the save and delete paths."""
+    __tablename__ = "invoice_daily_rollups"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)  # Invoice date, or processing date when unknown
+    currency = Column(String(10), nullable=True)
+    vendor_id = Column(UUID(as_uuid=True), nullable=True)  # No FK; company merges refresh affected rows
+    customer_id = Column(UUID(as_uuid=True), nullable=True)
+    
+    invoice_count = Column(Integer, nullable=False, default=0)
+    amount_count = Column(Integer, nullable=False, default=0)  # Invoices with a net amount
+    amount_sum = Column(DECIMAL(18, 2), nullable=False, default=0)
+    amount_min = Column(DECIMAL(15, 2), nullable=True)
+    amount_max = Column(DECIMAL(15, 2), nullable=True)
+    
+    # Invoice counts per net amount range (see AMOUNT_RANGES in analytics_rollup_service)
+    amount_under_100 = Column(Integer, nullable=False, default=0)
+    amount_100_500 = Column(Integer, nullable=False, default=0)
+    amount_500_1000 = Column(Integer, nullable=False, default=0)
+    amount_1000_5000 = Column(Integer, nullable=False, default=0)
+    amount_over_5000 = Column(Integer, nullable=False, default=0)
+    
+    # Invoice counts per extraction confidence level
+    confidence_low = Column(Integer, nullable=False, default=0)
+    confidence_medium = Column(Integer, nullable=False, default=0)
+    confidence_high = Column(Integer, nullable=False, default=0)
+    
+    tax_count = Column(Integer, nullable=False, default=0)  # Invoices with a tax calculation
+    tax_total = Column(DECIMAL(18, 2), nullable=False, default=0)
+    cgst_total = Column(DECIMAL(18, 2), nullable=False, default=0)
+    sgst_total = Column(DECIMAL(18, 2), nullable=False, default=0)
+    igst_total = Column(DECIMAL(18, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<InvoiceDailyRollup(user_id='{self.user_id}', day={self.day}, invoices={self.invoice_count})>"
+
+
+class InvoiceHourlyRollupModel(Base):
+    """Per-user invoice processing counts by hour of created_at."""
+    __tablename__ = "invoice_hourly_rollups"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    hour = Column(DateTime, primary_key=True)  # created_at truncated to the hour
+    invoice_count = Column(Integer, nullable=False, default=0)
+    confidence_low = Column(Integer, nullable=False, default=0)
+    confidence_medium = Column(Integer, nullable=False, default=0)
+    confidence_high = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<InvoiceHourlyRollup(user_id='{self.user_id}', hour={self.hour}, invoices={self.invoice_count})>"
+
+
+class AnalyticsRollupStateModel(Base):
+    """Users whose analytics rollups have been built from their full invoice history."""
+    __tablename__ = "analytics_rollup_state"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    built_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<AnalyticsRollupState(user_id='{self.user_id}', built_at={self.built_at})>"
+
+
+# Derived invoice list columns, computed by correlated subqueries and only
+# loaded when selected or undeferred
+InvoiceModel.line_item_count = column_property(
+    select(func.count(LineItemModel.id))
+    .where(LineItemModel.invoice_id == InvoiceModel.id)
+    .correlate_except(LineItemModel)
+    .scalar_subquery(),
+    deferred=True
+)
+InvoiceModel.has_tax_calculation = column_property(
+    select(TaxCalculationModel.id)
+    .where(TaxCalculationModel.invoice_id == InvoiceModel.id)
+    .correlate_except(TaxCalculationModel)
+    .exists(),
+    deferred=True
+)
+
+
 # Performance Indexes - Enhanced for common query patterns
 
 # Single column indexes (existing)
@@ -177,18 +394,31 @@ Index('idx_invoices_number', InvoiceModel.invoice_number)
 Index('idx_invoices_date', InvoiceModel.invoice_date)
 Index('idx_invoices_user', InvoiceModel.user_id)
 Index('idx_companies_gstin', CompanyModel.gstin)
+Index('idx_companies_normalized_name', CompanyModel.normalized_name)
 Index('idx_line_items_invoice', LineItemModel.invoice_id)
+Index('idx_line_items_hsn_code', LineItemModel.hsn_code, postgresql_ops={'hsn_code': 'varchar_pattern_ops'})
 Index('idx_addresses_company', AddressModel.company_id)
 Index('idx_users_email', UserModel.email)
+Index('idx_findings_invoice', InvoiceValidationFindingModel.invoice_id)
+Index('idx_file_references_sha256', FileReferenceModel.sha256)
+Index('idx_file_references_invoice', FileReferenceModel.invoice_id)
 
 # Composite indexes for common query patterns
 Index('idx_invoices_user_date', InvoiceModel.user_id, InvoiceModel.created_at.desc())
+Index('idx_invoices_user_invoice_date', InvoiceModel.user_id, InvoiceModel.invoice_date_parsed)
+Index('idx_invoices_user_due_date', InvoiceModel.user_id, InvoiceModel.due_date_parsed)
 Index('idx_invoices_user_number', InvoiceModel.user_id, InvoiceModel.invoice_number)
 Index('idx_invoices_user_amount', InvoiceModel.user_id, InvoiceModel.net_amount)
 Index('idx_companies_gstin_name', CompanyModel.gstin, CompanyModel.company_name)
 Index('idx_invoices_vendor_date', InvoiceModel.vendor_id, InvoiceModel.created_at.desc())
 Index('idx_invoices_customer_date', InvoiceModel.customer_id, InvoiceModel.created_at.desc())
 Index('idx_invoices_file_user', InvoiceModel.original_file_id, InvoiceModel.user_id)
+Index('idx_file_references_created', FileReferenceModel.created_at, FileReferenceModel.id)
+Index('idx_file_references_user_created', FileReferenceModel.user_id, FileReferenceModel.created_at.desc(), FileReferenceModel.id)
+Index('idx_file_references_user_size', FileReferenceModel.user_id, FileReferenceModel.size, FileReferenceModel.id)
+Index('idx_file_references_user_name', FileReferenceModel.user_id, FileReferenceModel.original_name, FileReferenceModel.id)
+Index('idx_file_references_user_sha256', FileReferenceModel.user_id, FileReferenceModel.sha256)
+Index('idx_findings_user_check', InvoiceValidationFindingModel.user_id, InvoiceValidationFindingModel.check_type)
 
 # Partial indexes for specific conditions
 Index('idx_invoices_active_files', InvoiceModel.user_id, InvoiceModel.original_file_id, 
@@ -196,8 +426,28 @@ Index('idx_invoices_active_files', InvoiceModel.user_id, InvoiceModel.original_f
 Index('idx_invoices_with_amounts', InvoiceModel.user_id, InvoiceModel.net_amount,
       postgresql_where=InvoiceModel.net_amount.isnot(None))
 
+Index('idx_result_cache_entries_expires', ResultCacheEntryModel.expires_at)
+
+Index('idx_invoice_daily_rollups_user_day', InvoiceDailyRollupModel.user_id, InvoiceDailyRollupModel.day)
+Index('idx_invoice_daily_rollups_vendor', InvoiceDailyRollupModel.vendor_id)
+Index('idx_invoice_daily_rollups_customer', InvoiceDailyRollupModel.customer_id)
+
+Index('idx_file_blobs_orphaned', FileBlobModel.orphaned_at,
+      postgresql_where=FileBlobModel.orphaned_at.isnot(None))
+
+# Conflict targets for company upserts (GSTIN when known, otherwise the name)
+Index('uq_companies_gstin', CompanyModel.gstin, unique=True,
+      postgresql_where=CompanyModel.gstin.isnot(None))
+Index('uq_companies_name_without_gstin', CompanyModel.company_name, unique=True,
+      postgresql_where=CompanyModel.gstin.is_(None))
+
 # Full-text search indexes for text fields (PostgreSQL specific)
+Index('idx_invoices_search_vector', InvoiceModel.search_vector, postgresql_using='gin')
 Index('idx_invoices_text_search', InvoiceModel.raw_text, postgresql_using='gin',
       postgresql_ops={'raw_text': 'gin_trgm_ops'})
 Index('idx_companies_name_search', CompanyModel.company_name, postgresql_using='gin',
       postgresql_ops={'company_name': 'gin_trgm_ops'})
+Index('idx_companies_normalized_name_search', CompanyModel.normalized_name, postgresql_using='gin',
+      postgresql_ops={'normalized_name': 'gin_trgm_ops'})
+Index('idx_line_items_description_search', LineItemModel.description, postgresql_using='gin',
+      postgresql_ops={'description': 'gin_trgm_ops'})
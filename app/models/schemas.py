@@ -5,7 +5,7 @@ These models define the structure for API request/response data
 and provide automatic validation and serialization.
 """
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List
 
 
 class LineItemSchema(BaseModel):
@@ -71,12 +71,21 @@ class InvoiceDataSchema(BaseModel):
     original_filename: Optional[str] = None
 
 
+class NearDuplicateSchema(BaseModel):
+    """Schema for a saved invoice whose image closely matches an upload."""
+    invoice_id: str
+    invoice_number: Optional[str] = None
+    file_id: str
+    distance: int  # Differing perceptual hash bits
+
+
 class ParseResponseSchema(BaseModel):
     """Schema for invoice parsing API response."""
     success: bool
     data: Optional[InvoiceDataSchema] = None
     error: Optional[str] = None
     processing_time: Optional[float] = None
+    near_duplicates: Optional[List[NearDuplicateSchema]] = None
 
 
 class SaveResponseSchema(BaseModel):
@@ -18,7 +18,9 @@ from sqlalchemy.orm import Session
 from app.core.database import get_db_session
 from app.core.logging_config import performance_monitor
 from app.models.database import InvoiceModel, CompanyModel, LineItemModel
+from app.services.analytics_rollup_service import invoice_period_filter
 from app.services.database_service import DatabaseService
+from app.services.result_cache_service import cached_result
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +33,7 @@ class AIInsightsService:
         self.db_service = DatabaseService()
     
     @performance_monitor("ai_insights", "comprehensive_analysis")
+    @cached_result("ai_insights")
     def get_comprehensive_insights(
         self,
         user_id: str,
@@ -55,7 +58,7 @@ class AIInsightsService:
                 
                 invoices = session.query(InvoiceModel).filter(
                     InvoiceModel.user_id == user_id,
-                    InvoiceModel.created_at >= since_date
+                    invoice_period_filter(since_date)
                 ).all()
                 
                 if not invoices:
@@ -493,12 +496,18 @@ class AIInsightsService:
         
         # Analyze processing time patterns
         processing_times = []
+        amount_speed_correlation = []
         for invoice in invoices:
-            if invoice.created_at and invoice.invoice_date:
+            if invoice.created_at and invoice.invoice_date_parsed:
                 # Time from invoice date to processing
-                time_diff = (invoice.created_at - invoice.invoice_date).days
+                time_diff = (invoice.created_at.date() - invoice.invoice_date_parsed).days
                 if 0 <= time_diff <= 365:  # Reasonable range
                     processing_times.append(time_diff)
+                    if invoice.net_amount:
+                        amount_speed_correlation.append({
+                            "amount": float(invoice.net_amount),
+                            "processing_days": time_diff
+                        })
         
         behavior_analysis = {}
         if processing_times:
@@ -520,16 +529,6 @@ class AIInsightsService:
                           "slow_payer" if slow_payments / len(processing_times) > 0.3 else "average_payer"
             }
         
-        # Analyze invoice amounts vs processing speed
-        amount_speed_correlation = []
-        for invoice in invoices:
-            if (invoice.net_amount and invoice.created_at and invoice.invoice_date and
-                0 <= (invoice.created_at - invoice.invoice_date).days <= 365):
-                amount_speed_correlation.append({
-                    "amount": float(invoice.net_amount),
-                    "processing_days": (invoice.created_at - invoice.invoice_date).days
-                })
-        
         return {
             "behavior_analysis": behavior_analysis,
             "insights": [
@@ -0,0 +1,374 @@
+"""
+Analytics Rollup Service
+
+Maintains the per-user rollups that dashboard analytics read instead of
+raw invoices:
+
+    invoice_daily_rollups   counts, amount sum/min/max, amount-range and
+                            confidence counts and tax sums per
+                            (user, day, currency, vendor, customer)
+    invoice_hourly_rollups  processing counts per (user, created_at hour)
+
+Saves and deletes recompute the rollup rows of the day and hour they
+touch, inside the writing transaction. One day of one user is a small
+index range, and recomputing rather than applying deltas keeps min/max
+exact across deletes. Rollup writers of a user are serialized by a
+transaction-scoped advisory lock.
+
+A user's rollups are built from their full history by the backfill job,
+or on their first dashboard read if that comes sooner.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.monitoring import app_metrics
+from app.models.database import (
+    AnalyticsRollupStateModel, ExtractionConfidence, InvoiceDailyRollupModel,
+    InvoiceHourlyRollupModel, InvoiceModel, TaxCalculationModel, UserModel
+)
+
+logger = logging.getLogger(__name__)
+
+# (label, rollup column, lower bound, upper bound) of the net amount ranges
+AMOUNT_RANGES = [
+    ("0-100", "amount_under_100", 0, 100),
+    ("100-500", "amount_100_500", 100, 500),
+    ("500-1000", "amount_500_1000", 500, 1000),
+    ("1000-5000", "amount_1000_5000", 1000, 5000),
+    ("5000+", "amount_over_5000", 5000, None),
+]
+
+# Advisory lock namespace of rollup writers (the second key is the user)
+ROLLUP_LOCK = "analytics_rollups"
+
+
+def invoice_period_date():
+    """Date an invoice counts towards: its invoice date, or the day it was processed if that is unknown."""
+    return func.coalesce(InvoiceModel.invoice_date_parsed, func.date(InvoiceModel.created_at))
+
+
+def invoice_period_filter(start_date: datetime, end_date: Optional[datetime] = None):
+    """
+    Invoices whose period date falls in [start_date, end_date).
+    
+    Written as two ranges rather than a filter on invoice_period_date() so
+    each side is an index range scan: idx_invoices_user_invoice_date for
+    dated invoices, idx_invoices_user_date for the undated remainder.
+    """
+    dated = [InvoiceModel.invoice_date_parsed >= start_date.date()]
+    undated = [InvoiceModel.invoice_date_parsed.is_(None), InvoiceModel.created_at >= start_date]
+    if end_date is not None:
+        dated.append(InvoiceModel.invoice_date_parsed < end_date.date())
+        undated.append(InvoiceModel.created_at < end_date)
+    return or_(and_(*dated), and_(*undated))
+
+
+def _confidence_counts() -> Dict[str, Any]:
+    return {
+        f"confidence_{level.value}": func.count().filter(InvoiceModel.extraction_confidence == level)
+        for level in ExtractionConfidence
+    }
+
+
+def _amount_range_counts() -> Dict[str, Any]:
+    amount = InvoiceModel.net_amount
+    return {
+        column: func.count().filter(amount >= low if high is None else and_(amount >= low, amount < high))
+        for _, column, low, high in AMOUNT_RANGES
+    }
+
+
+def _hour(created_at: datetime) -> datetime:
+    return created_at.replace(minute=0, second=0, microsecond=0)
+
+
+class AnalyticsRollupService:
+    """Builds and refreshes per-user analytics rollups."""
+    
+    def __init__(self):
+        # Users known to have built rollups; saves a state lookup per dashboard read
+        self._built: set = set()
+        self._lock = threading.Lock()
+    
+    def _lock_user(self, session, user_id: str):
+        session.execute(select(func.pg_advisory_xact_lock(func.hashtext(ROLLUP_LOCK), func.hashtext(str(user_id)))))
+    
+    def _insert_daily(self, session, user_id: str, condition):
+        """Aggregate a user's invoices matching condition into daily rollup rows."""
+        period = invoice_period_date()
+        columns = {
+            "id": func.gen_random_uuid(),
+            "user_id": InvoiceModel.user_id,
+            "day": period,
+            "currency": InvoiceModel.currency,
+            "vendor_id": InvoiceModel.vendor_id,
+            "customer_id": InvoiceModel.customer_id,
+            "invoice_count": func.count(),
+            "amount_count": func.count(InvoiceModel.net_amount),
+            "amount_sum": func.coalesce(func.sum(InvoiceModel.net_amount), 0),
+            "amount_min": func.min(InvoiceModel.net_amount),
+            "amount_max": func.max(InvoiceModel.net_amount),
+            **_amount_range_counts(),
+            **_confidence_counts(),
+            "tax_count": func.count(TaxCalculationModel.id),
+            "tax_total": func.coalesce(func.sum(TaxCalculationModel.total_tax), 0),
+            "cgst_total": func.coalesce(func.sum(TaxCalculationModel.cgst_amount), 0),
+            "sgst_total": func.coalesce(func.sum(TaxCalculationModel.sgst_amount), 0),
+            "igst_total": func.coalesce(func.sum(TaxCalculationModel.igst_amount), 0),
+        }
+        query = select(*columns.values()).join_from(
+            InvoiceModel, TaxCalculationModel, TaxCalculationModel.invoice_id == InvoiceModel.id, isouter=True
+        ).where(
+            InvoiceModel.user_id == user_id,
+            condition
+        ).group_by(
+            InvoiceModel.user_id, period, InvoiceModel.currency, InvoiceModel.vendor_id, InvoiceModel.customer_id
+        )
+        session.execute(insert(InvoiceDailyRollupModel).from_select(list(columns), query))
+    
+    def _insert_hourly(self, session, user_id: str, condition):
+        """Aggregate a user's invoices matching condition into hourly rollup rows."""
+        # Literal unit so the SELECT and GROUP BY expressions are identical
+        hour = func.date_trunc(literal_column("'hour'"), InvoiceModel.created_at)
+        columns = {
+            "user_id": InvoiceModel.user_id,
+            "hour": hour,
+            "invoice_count": func.count(),
+            **_confidence_counts(),
+        }
+        query = select(*columns.values()).where(
+            InvoiceModel.user_id == user_id,
+            InvoiceModel.created_at.isnot(None),
+            condition
+        ).group_by(InvoiceModel.user_id, hour)
+        session.execute(insert(InvoiceHourlyRollupModel).from_select(list(columns), query))
+    
+    def refresh(self, session, user_id: str, days: Iterable[date] = (), hours: Iterable[datetime] = ()):
+        """
+        Recompute a user's rollup rows for some days and hours inside the caller's transaction.
+        
+        Call after the invoice changes are written and before commit.
+        
+        Args:
+            days: Period dates (invoice date, or processing date when unknown)
+            hours: created_at values truncated to the hour
+        """
+        days = sorted({day for day in days if day is not None})
+        hours = sorted({hour for hour in hours if hour is not None})
+        if not days and not hours:
+            return
+        
+        self._lock_user(session, user_id)
+        if days:
+            session.execute(
+                delete(InvoiceDailyRollupModel).where(
+                    InvoiceDailyRollupModel.user_id == user_id,
+                    InvoiceDailyRollupModel.day.in_(days)
+                ).execution_options(synchronize_session=False)
+            )
+            self._insert_daily(session, user_id, or_(*[
+                invoice_period_filter(datetime.combine(day, datetime.min.time()),
+                                      datetime.combine(day + timedelta(days=1), datetime.min.time()))
+                for day in days
+            ]))
+        if hours:
+            session.execute(
+                delete(InvoiceHourlyRollupModel).where(
+                    InvoiceHourlyRollupModel.user_id == user_id,
+                    InvoiceHourlyRollupModel.hour.in_(hours)
+                ).execution_options(synchronize_session=False)
+            )
+            self._insert_hourly(session, user_id, or_(*[
+                and_(InvoiceModel.created_at >= hour, InvoiceModel.created_at < hour + timedelta(hours=1))
+                for hour in hours
+            ]))
+    
+    def refresh_invoice(self, session, user_id: str, invoice_date_parsed: Optional[date], created_at: Optional[datetime]):
+        """Recompute the rollup rows an invoice with these dates counts towards."""
+        day = invoice_date_parsed or (created_at.date() if created_at else None)
+        self.refresh(session, user_id, [day], [_hour(created_at)] if created_at else [])
+    
+    def refresh_companies(self, session, company_ids: List[uuid.UUID]) -> int:
+        """
+        Recompute the daily rollups that reference companies, after merges repoint their invoices.
+        
+        Returns:
+            Number of (user, day) pairs refreshed
+        """
+        rows = session.execute(
+            select(InvoiceDailyRollupModel.user_id, InvoiceDailyRollupModel.day).where(
+                or_(
+                    InvoiceDailyRollupModel.vendor_id.in_(company_ids),
+                    InvoiceDailyRollupModel.customer_id.in_(company_ids)
+                )
+            ).distinct()
+        ).all()
+        
+        days_by_user = defaultdict(set)
+        for user_id, day in rows:
+            days_by_user[user_id].add(day)
+        # Fixed lock order across users
+        for user_id in sorted(days_by_user):
+            self.refresh(session, user_id, days_by_user[user_id])
+        return len(rows)
+    
+    def rebuild_user(self, session, user_id: str):
+        """Rebuild all of a user's rollups from their invoices and mark them built."""
+        self._lock_user(session, user_id)
+        session.execute(
+            delete(InvoiceDailyRollupModel).where(InvoiceDailyRollupModel.user_id == user_id)
+            .execution_options(synchronize_session=False)
+        )
+        session.execute(
+            delete(InvoiceHourlyRollupModel).where(InvoiceHourlyRollupModel.user_id == user_id)
+            .execution_options(synchronize_session=False)
+        )
+        self._insert_daily(session, user_id, invoice_period_date().isnot(None))
+        self._insert_hourly(session, user_id, InvoiceModel.created_at.isnot(None))
+        
+        built_at = datetime.utcnow()
+        session.execute(
+            pg_insert(AnalyticsRollupStateModel)
+            .values(user_id=user_id, built_at=built_at)
+            .on_conflict_do_update(index_elements=[AnalyticsRollupStateModel.user_id], set_={"built_at": built_at})
+        )
+    
+    def _is_built(self, session, user_id: str) -> bool:
+        return session.execute(
+            select(AnalyticsRollupStateModel.built_at).where(AnalyticsRollupStateModel.user_id == user_id)
+        ).scalar() is not None
+    
+    def ensure_built(self, user_id: str) -> bool:
+        """
+        Build a user's rollups if they never were.
+        
+        Returns:
+            True if this call built them
+        """
+        user_id = str(user_id)
+        with self._lock:
+            if user_id in self._built:
+                return False
+        
+        started = time.perf_counter()
+        built_here = False
+        with get_db_session() as session:
+            if not self._is_built(session, user_id):
+                # Check again under the lock; a concurrent build may have just finished
+                self._lock_user(session, user_id)
+                if not self._is_built(session, user_id):
+                    self.rebuild_user(session, user_id)
+                    session.commit()
+                    built_here = True
+        
+        with self._lock:
+            self._built.add(user_id)
+        if built_here:
+            app_metrics.metrics.record_timing("analytics_rollup_build", (time.perf_counter() - started) * 1000)
+            logger.info(f"Built analytics rollups for user {user_id}")
+        return built_here
+
+
+# Global analytics rollup service
+analytics_rollups = AnalyticsRollupService()
+
+
+def backfill_analytics_rollups(batch_size: int = None, after: Optional[uuid.UUID] = None) -> Dict[str, Any]:
+    """
+    Build rollups for one batch of users that have none yet, one transaction per user.
+    
+    Args:
+        batch_size: Users looked up per call
+        after: User id to resume after (cursor from the previous call)
+    
+    Returns:
+        Dictionary with the build count and the cursor for the next call (None when done)
+    """
+    batch_size = batch_size or get_settings().ANALYTICS_ROLLUP_BACKFILL_BATCH_SIZE
+    
+    with get_db_session() as session:
+        query = select(UserModel.id).where(
+            ~select(AnalyticsRollupStateModel.user_id)
+            .where(AnalyticsRollupStateModel.user_id == UserModel.id)
+            .exists()
+        )
+        if after:
+            query = query.where(UserModel.id > after)
+        user_ids = session.execute(query.order_by(UserModel.id).limit(batch_size)).scalars().all()
+    
+    built = sum(1 for user_id in user_ids if analytics_rollups.ensure_built(user_id))
+    return {"built": built, "cursor": user_ids[-1] if len(user_ids) == batch_size else None}
+
+
+class AnalyticsRollupBackfillJob:
+    """Background task that builds rollups of users without them once at startup."""
+    
+    def __init__(self):
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start the backfill."""
+        if self._running:
+            return
+        
+        self._running = True
+        logger.info("Starting analytics rollup backfill")
+        self._task = asyncio.create_task(self._backfill())
+    
+    def stop(self):
+        """Stop the backfill (a later start resumes with the remaining users)."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        logger.info("Stopping analytics rollup backfill")
+    
+    async def run_once(self) -> int:
+        """Build rollups for every user without them."""
+        built = 0
+        cursor = None
+        while self._running:
+            result = await asyncio.to_thread(backfill_analytics_rollups, after=cursor)
+            built += result["built"]
+            cursor = result["cursor"]
+            if cursor is None:
+                break
+        return built
+    
+    async def _backfill(self):
+        try:
+            built = await self.run_once()
+            if built:
+                logger.info(f"Analytics rollup backfill complete: {built} users built")
+        except Exception as e:
+            logger.error(f"Error in analytics rollup backfill: {e}")
+        finally:
+            self._running = False
+
+
+# Global analytics rollup backfill job
+analytics_rollup_backfill_job = AnalyticsRollupBackfillJob()
+
+
+__all__ = [
+    "AMOUNT_RANGES",
+    "AnalyticsRollupBackfillJob",
+    "AnalyticsRollupService",
+    "analytics_rollup_backfill_job",
+    "analytics_rollups",
+    "backfill_analytics_rollups",
+    "invoice_period_date",
+    "invoice_period_filter",
+]
@@ -13,12 +13,43 @@ from decimal import Decimal
 from sqlalchemy import func, and_, or_, extract, text
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db_session
+from app.core.database import count_round_trips, get_db_session
 from app.core.logging_config import performance_monitor
-from app.models.database import InvoiceModel, CompanyModel, UserModel, LineItemModel, TaxCalculationModel
+from app.core.monitoring import app_metrics
+from app.models.database import (
+    CompanyModel, ExtractionConfidence, InvoiceDailyRollupModel, InvoiceHourlyRollupModel
+)
+from app.services.analytics_rollup_service import AMOUNT_RANGES, analytics_rollups
+from app.services.result_cache_service import cached_result
 
 logger = logging.getLogger(__name__)
 
+# Nominal score of each extraction confidence level, for averages
+CONFIDENCE_SCORES = {
+    ExtractionConfidence.low: 0.5,
+    ExtractionConfidence.medium: 0.75,
+    ExtractionConfidence.high: 0.9,
+}
+
+# Statements one dashboard computation issues (rollup builds excluded); more
+# means a section regressed to per-bucket or per-period queries
+DASHBOARD_STATEMENT_BUDGET = 8
+
+# Rollups every section reads (see analytics_rollup_service)
+DAILY = InvoiceDailyRollupModel
+HOURLY = InvoiceHourlyRollupModel
+
+
+def _days_in(start_date: datetime, end_date: datetime):
+    """
+    Daily rollup rows of a period, both ends inclusive.
+    
+    Days are invoice dates, which can lie in the future (a due date read as
+    the invoice date, a typo year); the upper bound keeps those out of
+    every current period.
+    """
+    return DAILY.day.between(start_date.date(), end_date.date())
+
 
 class AnalyticsService:
     """Advanced analytics and reporting service."""
@@ -28,39 +59,42 @@ class AnalyticsService:
         pass
     
     @performance_monitor("analytics", "dashboard_metrics")
+    @cached_result("analytics_dashboard")
     def get_dashboard_analytics(self, user_id: str, date_range: int = 30) -> Dict[str, Any]:
         """Get comprehensive dashboard analytics."""
         try:
-            with get_db_session() as session:
+            # Sections read the user's rollups; build them if the backfill has not yet
+            analytics_rollups.ensure_built(user_id)
+            
+            with count_round_trips() as trips, get_db_session() as session:
                 end_date = datetime.utcnow()
                 start_date = end_date - timedelta(days=date_range)
                 
-                # Base query for user's invoices
-                base_query = session.query(InvoiceModel).filter(
-                    InvoiceModel.user_id == user_id,
-                    InvoiceModel.created_at >= start_date
-                )
+                # Summary, amount ranges and tax come from one scan of both periods
+                totals = self._get_period_totals(session, user_id, start_date, end_date)
                 
                 analytics = {
-                    "summary": self._get_summary_metrics(session, user_id, start_date, end_date),
+                    "summary": self._get_summary_metrics(totals),
                     "trends": self._get_trend_analysis(session, user_id, start_date, end_date),
-                    "categories": self._get_category_analysis(session, user_id, start_date, end_date),
+                    "categories": self._get_category_analysis(session, user_id, start_date, end_date, totals),
                     "vendors": self._get_vendor_analysis(session, user_id, start_date, end_date),
                     "processing": self._get_processing_analytics(session, user_id, start_date, end_date),
                     "time_analysis": self._get_time_based_analysis(session, user_id, start_date, end_date),
-                    "financial": self._get_financial_insights(session, user_id, start_date, end_date)
+                    "financial": self._get_financial_insights(session, user_id, start_date, end_date, totals)
                 }
-                
-                return {
-                    "success": True,
-                    "data": analytics,
-                    "date_range": {
-                        "start": start_date.isoformat(),
-                        "end": end_date.isoformat(),
-                        "days": date_range
-                    }
+            
+            self._check_statement_budget(trips)
+            
+            return {
+                "success": True,
+                "data": analytics,
+                "date_range": {
+                    "start": start_date.isoformat(),
+                    "end": end_date.isoformat(),
+                    "days": date_range
                 }
-                
+            }
+        
         except Exception as e:
             logger.error(f"Error generating dashboard analytics for user {user_id}: {e}")
             return {
@@ -69,62 +103,73 @@ class AnalyticsService:
                 "data": None
             }
     
-    def _get_summary_metrics(self, session: Session, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
-        """Get summary metrics for the dashboard."""
-        # Total invoices and amounts
-        total_invoices = session.query(func.count(InvoiceModel.id)).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
-        ).scalar() or 0
+    def _check_statement_budget(self, trips):
+        """Record the statements a dashboard computation issued and flag regressions past the budget."""
+        app_metrics.metrics.record_histogram("analytics_dashboard_statements", trips.statements)
+        if trips.statements > DASHBOARD_STATEMENT_BUDGET:
+            app_metrics.metrics.increment_counter("analytics_statement_budget_exceeded")
+            logger.warning(
+                f"Dashboard analytics issued {trips.statements} statements "
+                f"(budget {DASHBOARD_STATEMENT_BUDGET})"
+            )
+    
+    def _get_period_totals(self, session: Session, user_id: str, start_date: datetime, end_date: datetime) -> Any:
+        """
+        Aggregate the current and previous period in one scan of the daily rollups.
         
-        total_amount = session.query(func.sum(InvoiceModel.net_amount)).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date,
-            InvoiceModel.net_amount.isnot(None)
-        ).scalar() or Decimal('0')
+        Rollup rows from the previous period's start are read once; FILTER
+        clauses split them into current-period figures (summary, amount
+        ranges, tax) and the previous period's totals for growth.
+        """
+        prev_start = start_date - (end_date - start_date)
+        current = _days_in(start_date, end_date)
+        previous = DAILY.day < start_date.date()
         
-        # Average processing confidence
-        avg_confidence = session.query(func.avg(InvoiceModel.extraction_confidence)).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date,
-            InvoiceModel.extraction_confidence.isnot(None)
-        ).scalar() or 0
+        def current_sum(column, label: str):
+            return func.coalesce(func.sum(column).filter(current), 0).label(label)
         
-        # Unique vendors and customers
-        unique_vendors = session.query(func.count(func.distinct(InvoiceModel.vendor_id))).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date,
-            InvoiceModel.vendor_id.isnot(None)
-        ).scalar() or 0
+        return session.query(
+            current_sum(DAILY.invoice_count, 'invoices'),
+            current_sum(DAILY.amount_sum, 'amount'),
+            func.min(DAILY.amount_min).filter(current).label('smallest'),
+            func.max(DAILY.amount_max).filter(current).label('largest'),
+            *[current_sum(getattr(DAILY, f"confidence_{level.value}"), level.value) for level in ExtractionConfidence],
+            *[current_sum(getattr(DAILY, column), column) for _, column, _, _ in AMOUNT_RANGES],
+            current_sum(DAILY.tax_total, 'tax_total'),
+            current_sum(DAILY.tax_count, 'tax_count'),
+            func.count(func.distinct(DAILY.vendor_id)).filter(current).label('vendors'),
+            func.count(func.distinct(DAILY.customer_id)).filter(current).label('customers'),
+            func.coalesce(func.sum(DAILY.invoice_count).filter(previous), 0).label('prev_invoices'),
+            func.coalesce(func.sum(DAILY.amount_sum).filter(previous), 0).label('prev_amount')
+        ).filter(
+            DAILY.user_id == user_id,
+            _days_in(prev_start, end_date)
+        ).one()
+    
+    def _get_summary_metrics(self, totals: Any) -> Dict[str, Any]:
+        """Get summary metrics for the dashboard."""
+        total_invoices = totals.invoices
+        total_amount = totals.amount
         
-        unique_customers = session.query(func.count(func.distinct(InvoiceModel.customer_id))).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date,
-            InvoiceModel.customer_id.isnot(None)
-        ).scalar() or 0
+        # Average processing confidence over the nominal scores of the stored levels
+        rated = sum(getattr(totals, level.value) for level in ExtractionConfidence)
+        avg_confidence = sum(
+            getattr(totals, level.value) * CONFIDENCE_SCORES[level] for level in ExtractionConfidence
+        ) / rated if rated else 0
         
         # Previous period comparison
-        prev_start = start_date - (end_date - start_date)
-        prev_invoices = session.query(func.count(InvoiceModel.id)).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= prev_start,
-            InvoiceModel.created_at < start_date
-        ).scalar() or 0
-        
-        prev_amount = session.query(func.sum(InvoiceModel.net_amount)).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= prev_start,
-            InvoiceModel.created_at < start_date,
-            InvoiceModel.net_amount.isnot(None)
-        ).scalar() or Decimal('0')
+        prev_invoices = totals.prev_invoices
+        prev_amount = totals.prev_amount
         
         return {
             "total_invoices": total_invoices,
             "total_amount": float(total_amount),
             "average_amount": float(total_amount / total_invoices) if total_invoices > 0 else 0,
+            "smallest_amount": float(totals.smallest or 0),
+            "largest_amount": float(totals.largest or 0),
             "average_confidence": round(float(avg_confidence), 2) if avg_confidence else 0,
-            "unique_vendors": unique_vendors,
-            "unique_customers": unique_customers,
+            "unique_vendors": totals.vendors,
+            "unique_customers": totals.customers,
             "growth": {
                 "invoices_change": ((total_invoices - prev_invoices) / prev_invoices * 100) if prev_invoices > 0 else 0,
                 "amount_change": ((float(total_amount) - float(prev_amount)) / float(prev_amount) * 100) if prev_amount > 0 else 0
@@ -135,29 +180,22 @@ class AnalyticsService:
         """Get trend analysis over time."""
         # Daily invoice counts and amounts
         daily_data = session.query(
-            func.date(InvoiceModel.created_at).label('date'),
-            func.count(InvoiceModel.id).label('count'),
-            func.sum(InvoiceModel.net_amount).label('amount')
+            DAILY.day.label('date'),
+            func.sum(DAILY.invoice_count).label('count'),
+            func.sum(DAILY.amount_sum).label('amount')
         ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
+            DAILY.user_id == user_id,
+            _days_in(start_date, end_date)
         ).group_by(
-            func.date(InvoiceModel.created_at)
-        ).order_by('date').all()
+            DAILY.day
+        ).order_by(DAILY.day).all()
         
-        # Weekly aggregation
-        weekly_data = session.query(
-            extract('week', InvoiceModel.created_at).label('week'),
-            extract('year', InvoiceModel.created_at).label('year'),
-            func.count(InvoiceModel.id).label('count'),
-            func.sum(InvoiceModel.net_amount).label('amount')
-        ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
-        ).group_by(
-            extract('week', InvoiceModel.created_at),
-            extract('year', InvoiceModel.created_at)
-        ).order_by('year', 'week').all()
+        # Weekly aggregation (ISO weeks) of the daily rows
+        weekly_data = defaultdict(lambda: {"count": 0, "amount": 0.0})
+        for row in daily_data:
+            year, week, _ = row.date.isocalendar()
+            weekly_data[(year, week)]["count"] += row.count
+            weekly_data[(year, week)]["amount"] += float(row.amount or 0)
         
         return {
             "daily": [
@@ -170,46 +208,27 @@ class AnalyticsService:
             ],
             "weekly": [
                 {
-                    "week": f"{row.year}-W{row.week:02d}",
-                    "count": row.count,
-                    "amount": float(row.amount or 0)
+                    "week": f"{year}-W{week:02d}",
+                    "count": bucket["count"],
+                    "amount": bucket["amount"]
                 }
-                for row in weekly_data
+                for (year, week), bucket in sorted(weekly_data.items())
             ]
         }
     
-    def _get_category_analysis(self, session: Session, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    def _get_category_analysis(
+        self, session: Session, user_id: str, start_date: datetime, end_date: datetime, totals: Any
+    ) -> Dict[str, Any]:
         """Get category-based analysis."""
         # Amount ranges
-        amount_ranges = [
-            ("0-100", 0, 100),
-            ("100-500", 100, 500),
-            ("500-1000", 500, 1000),
-            ("1000-5000", 1000, 5000),
-            ("5000+", 5000, float('inf'))
-        ]
-        
-        range_data = []
-        for label, min_amount, max_amount in amount_ranges:
-            if max_amount == float('inf'):
-                count = session.query(func.count(InvoiceModel.id)).filter(
-                    InvoiceModel.user_id == user_id,
-                    InvoiceModel.created_at >= start_date,
-                    InvoiceModel.net_amount >= min_amount
-                ).scalar() or 0
-            else:
-                count = session.query(func.count(InvoiceModel.id)).filter(
-                    InvoiceModel.user_id == user_id,
-                    InvoiceModel.created_at >= start_date,
-                    InvoiceModel.net_amount >= min_amount,
-                    InvoiceModel.net_amount < max_amount
-                ).scalar() or 0
-            
-            range_data.append({
+        range_data = [
+            {
                 "range": label,
-                "count": count,
+                "count": getattr(totals, column),
                 "percentage": 0  # Will be calculated after getting total
-            })
+            }
+            for label, column, _, _ in AMOUNT_RANGES
+        ]
         
         # Calculate percentages
         total_invoices = sum(item["count"] for item in range_data)
@@ -219,22 +238,24 @@ class AnalyticsService:
         
         return {
             "amount_ranges": range_data,
-            "currency_distribution": self._get_currency_distribution(session, user_id, start_date)
+            "currency_distribution": self._get_currency_distribution(session, user_id, start_date, end_date)
         }
     
-    def _get_currency_distribution(self, session: Session, user_id: str, start_date: datetime) -> List[Dict[str, Any]]:
+    def _get_currency_distribution(
+        self, session: Session, user_id: str, start_date: datetime, end_date: datetime
+    ) -> List[Dict[str, Any]]:
         """Get currency distribution."""
         currency_data = session.query(
-            InvoiceModel.currency,
-            func.count(InvoiceModel.id).label('count'),
-            func.sum(InvoiceModel.net_amount).label('total_amount')
+            DAILY.currency,
+            func.sum(DAILY.invoice_count).label('count'),
+            func.sum(DAILY.amount_sum).label('total_amount')
         ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date,
-            InvoiceModel.currency.isnot(None)
+            DAILY.user_id == user_id,
+            _days_in(start_date, end_date),
+            DAILY.currency.isnot(None)
         ).group_by(
-            InvoiceModel.currency
-        ).order_by(func.count(InvoiceModel.id).desc()).all()
+            DAILY.currency
+        ).order_by(func.sum(DAILY.invoice_count).desc()).all()
         
         return [
             {
@@ -247,39 +268,26 @@ class AnalyticsService:
     
     def _get_vendor_analysis(self, session: Session, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Get vendor analysis."""
-        # Top vendors by transaction count
-        top_vendors = session.query(
-            CompanyModel.company_name,
-            func.count(InvoiceModel.id).label('transaction_count'),
-            func.sum(InvoiceModel.net_amount).label('total_amount'),
-            func.avg(InvoiceModel.net_amount).label('avg_amount')
-        ).join(
-            InvoiceModel, InvoiceModel.vendor_id == CompanyModel.id
-        ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
-        ).group_by(
-            CompanyModel.id, CompanyModel.company_name
-        ).order_by(
-            func.count(InvoiceModel.id).desc()
-        ).limit(10).all()
+        def top_companies(company_column, order_by):
+            return session.query(
+                CompanyModel.company_name,
+                func.sum(DAILY.invoice_count).label('transaction_count'),
+                func.sum(DAILY.amount_sum).label('total_amount'),
+                (func.sum(DAILY.amount_sum) / func.nullif(func.sum(DAILY.amount_count), 0)).label('avg_amount')
+            ).join(
+                DAILY, company_column == CompanyModel.id
+            ).filter(
+                DAILY.user_id == user_id,
+                _days_in(start_date, end_date)
+            ).group_by(
+                CompanyModel.id, CompanyModel.company_name
+            ).order_by(
+                order_by.desc()
+            ).limit(10).all()
         
-        # Top customers by amount
-        top_customers = session.query(
-            CompanyModel.company_name,
-            func.count(InvoiceModel.id).label('transaction_count'),
-            func.sum(InvoiceModel.net_amount).label('total_amount'),
-            func.avg(InvoiceModel.net_amount).label('avg_amount')
-        ).join(
-            InvoiceModel, InvoiceModel.customer_id == CompanyModel.id
-        ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
-        ).group_by(
-            CompanyModel.id, CompanyModel.company_name
-        ).order_by(
-            func.sum(InvoiceModel.net_amount).desc()
-        ).limit(10).all()
+        # Top vendors by transaction count, top customers by amount
+        top_vendors = top_companies(DAILY.vendor_id, func.sum(DAILY.invoice_count))
+        top_customers = top_companies(DAILY.customer_id, func.sum(DAILY.amount_sum))
         
         return {
             "top_vendors": [
@@ -304,27 +312,22 @@ class AnalyticsService:
     
     def _get_processing_analytics(self, session: Session, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Get processing performance analytics."""
-        # Confidence score distribution
-        confidence_ranges = [
-            ("Low (0-60%)", 0, 0.6),
-            ("Medium (60-80%)", 0.6, 0.8),
-            ("High (80-95%)", 0.8, 0.95),
-            ("Excellent (95%+)", 0.95, 1.0)
-        ]
+        # Confidence level distribution of invoices processed in the period
+        counts = session.query(*[
+            func.coalesce(func.sum(getattr(HOURLY, f"confidence_{level.value}")), 0).label(level.value)
+            for level in ExtractionConfidence
+        ]).filter(
+            HOURLY.user_id == user_id,
+            HOURLY.hour.between(start_date.replace(minute=0, second=0, microsecond=0), end_date)
+        ).one()
         
-        confidence_data = []
-        for label, min_conf, max_conf in confidence_ranges:
-            count = session.query(func.count(InvoiceModel.id)).filter(
-                InvoiceModel.user_id == user_id,
-                InvoiceModel.created_at >= start_date,
-                InvoiceModel.extraction_confidence >= min_conf,
-                InvoiceModel.extraction_confidence < max_conf if max_conf < 1.0 else InvoiceModel.extraction_confidence <= max_conf
-            ).scalar() or 0
-            
-            confidence_data.append({
-                "range": label,
-                "count": count
-            })
+        confidence_data = [
+            {
+                "range": level.value.capitalize(),
+                "count": getattr(counts, level.value)
+            }
+            for level in ExtractionConfidence
+        ]
         
         # Average processing time (if tracked)
         # This would require additional tracking in the processing pipeline
@@ -336,27 +339,24 @@ class AnalyticsService:
     
     def _get_time_based_analysis(self, session: Session, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Get time-based processing patterns."""
-        # Hour of day analysis
-        hourly_data = session.query(
-            extract('hour', InvoiceModel.created_at).label('hour'),
-            func.count(InvoiceModel.id).label('count')
+        # Counts per (hour of day, day of week); both patterns are sums over it
+        slots = session.query(
+            extract('hour', HOURLY.hour).label('hour'),
+            extract('dow', HOURLY.hour).label('dow'),
+            func.sum(HOURLY.invoice_count).label('count')
         ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
+            HOURLY.user_id == user_id,
+            HOURLY.hour.between(start_date.replace(minute=0, second=0, microsecond=0), end_date)
         ).group_by(
-            extract('hour', InvoiceModel.created_at)
-        ).order_by('hour').all()
+            extract('hour', HOURLY.hour),
+            extract('dow', HOURLY.hour)
+        ).all()
         
-        # Day of week analysis
-        dow_data = session.query(
-            extract('dow', InvoiceModel.created_at).label('dow'),
-            func.count(InvoiceModel.id).label('count')
-        ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
-        ).group_by(
-            extract('dow', InvoiceModel.created_at)
-        ).order_by('dow').all()
+        hourly_data = defaultdict(int)
+        dow_data = defaultdict(int)
+        for row in slots:
+            hourly_data[int(row.hour)] += row.count
+            dow_data[int(row.dow)] += row.count
         
         # Map day of week numbers to names
         dow_names = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
@@ -364,55 +364,45 @@ class AnalyticsService:
         return {
             "hourly_pattern": [
                 {
-                    "hour": int(row.hour),
-                    "count": row.count
+                    "hour": hour,
+                    "count": count
                 }
-                for row in hourly_data
+                for hour, count in sorted(hourly_data.items())
             ],
             "weekly_pattern": [
                 {
-                    "day": dow_names[int(row.dow)],
-                    "day_number": int(row.dow),
-                    "count": row.count
+                    "day": dow_names[dow],
+                    "day_number": dow,
+                    "count": count
                 }
-                for row in dow_data
+                for dow, count in sorted(dow_data.items())
             ]
         }
     
-    def _get_financial_insights(self, session: Session, user_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    def _get_financial_insights(
+        self, session: Session, user_id: str, start_date: datetime, end_date: datetime, totals: Any
+    ) -> Dict[str, Any]:
         """Get financial insights and patterns."""
-        # Tax analysis
-        tax_data = session.query(
-            func.sum(TaxCalculationModel.total_tax).label('total_tax'),
-            func.avg(TaxCalculationModel.total_tax).label('avg_tax'),
-            func.count(TaxCalculationModel.id).label('tax_invoices')
-        ).join(
-            InvoiceModel, TaxCalculationModel.invoice_id == InvoiceModel.id
-        ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
-        ).first()
-        
         # Monthly financial summary
         monthly_data = session.query(
-            extract('year', InvoiceModel.created_at).label('year'),
-            extract('month', InvoiceModel.created_at).label('month'),
-            func.count(InvoiceModel.id).label('count'),
-            func.sum(InvoiceModel.net_amount).label('total_amount'),
-            func.avg(InvoiceModel.net_amount).label('avg_amount')
+            extract('year', DAILY.day).label('year'),
+            extract('month', DAILY.day).label('month'),
+            func.sum(DAILY.invoice_count).label('count'),
+            func.sum(DAILY.amount_sum).label('total_amount'),
+            (func.sum(DAILY.amount_sum) / func.nullif(func.sum(DAILY.amount_count), 0)).label('avg_amount')
         ).filter(
-            InvoiceModel.user_id == user_id,
-            InvoiceModel.created_at >= start_date
+            DAILY.user_id == user_id,
+            _days_in(start_date, end_date)
         ).group_by(
-            extract('year', InvoiceModel.created_at),
-            extract('month', InvoiceModel.created_at)
+            extract('year', DAILY.day),
+            extract('month', DAILY.day)
         ).order_by('year', 'month').all()
         
         return {
             "tax_summary": {
-                "total_tax": float(tax_data.total_tax or 0),
-                "average_tax": float(tax_data.avg_tax or 0),
-                "invoices_with_tax": tax_data.tax_invoices or 0
+                "total_tax": float(totals.tax_total),
+                "average_tax": float(totals.tax_total / totals.tax_count) if totals.tax_count else 0,
+                "invoices_with_tax": totals.tax_count
             },
             "monthly_summary": [
                 {
@@ -443,7 +433,7 @@ class AnalyticsService:
             else:
                 # Return JSON format
                 return analytics_data
-                
+        
         except Exception as e:
             logger.error(f"Error exporting analytics data for user {user_id}: {e}")
             return {
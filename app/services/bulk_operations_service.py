@@ -18,6 +18,7 @@ from app.core.logging_config import performance_monitor
 from app.core.websocket_manager import websocket_manager, NotificationType, NotificationPriority
 from app.services.invoice_service import InvoiceService
 from app.services.database_service import DatabaseService
+from app.services.invoice_validation_service import InvoiceValidationService, ValidationCheck
 from app.models.database import InvoiceModel, UserModel
 from app.models.schemas import InvoiceDataSchema
 
@@ -91,6 +92,7 @@ class BulkOperationsService:
         """Initialize bulk operations service."""
         self.invoice_service = InvoiceService()
         self.db_service = DatabaseService()
+        self.validation_service = InvoiceValidationService()
         self.active_operations: Dict[str, BulkOperation] = {}
         self.operation_tasks: Dict[str, asyncio.Task] = {}
     
@@ -210,6 +212,61 @@ class BulkOperationsService:
         
         return operation_id
     
+    async def create_bulk_validate_operation(
+        self,
+        user_id: str,
+        checks: List[ValidationCheck] = None,
+        metadata: Dict[str, Any] = None
+    ) -> str:
+        """
+        Create a bulk validation operation over all of a user's invoices.
+        
+        Args:
+            user_id: User ID
+            checks: Checks to run (all checks when omitted)
+            metadata: Additional metadata
+            
+        Returns:
+            Operation ID
+        """
+        operation_id = str(uuid.uuid4())
+        checks = checks or list(ValidationCheck)
+        
+        # One item per check - each check is a single set-based pass
+        items = []
+        for check in checks:
+            item = BulkOperationItem(
+                id=str(uuid.uuid4()),
+                status="pending",
+                data={"check": ValidationCheck(check).value}
+            )
+            items.append(item)
+        
+        # Create operation
+        operation = BulkOperation(
+            id=operation_id,
+            user_id=user_id,
+            operation_type=BulkOperationType.VALIDATE,
+            status=BulkOperationStatus.PENDING,
+            items=items,
+            progress=BulkOperationProgress(
+                total=len(items),
+                processed=0,
+                successful=0,
+                failed=0,
+                percentage=0.0
+            ),
+            created_at=datetime.utcnow(),
+            metadata=metadata or {}
+        )
+        
+        # Store operation
+        self.active_operations[operation_id] = operation
+        
+        logger.info(f"Created bulk validate operation {operation_id} for user {user_id} with {len(items)} checks")
+        
+        return operation_id
+    
     async def start_operation(self, operation_id: str) -> bool:
         """
         Start executing a bulk operation.
@@ -239,6 +296,8 @@ class BulkOperationsService:
             task = asyncio.create_task(self._execute_bulk_upload(operation))
         elif operation.operation_type == BulkOperationType.DELETE:
             task = asyncio.create_task(self._execute_bulk_delete(operation))
+        elif operation.operation_type == BulkOperationType.VALIDATE:
+            task = asyncio.create_task(self._execute_bulk_validate(operation))
         else:
             logger.error(f"Unsupported operation type: {operation.operation_type}")
             operation.status = BulkOperationStatus.FAILED
@@ -411,7 +470,7 @@ class BulkOperationsService:
                     # Delete invoice
                     item.status = "processing"
                     
-                    delete_result = self.db_service.delete_invoice(invoice_id, operation.user_id)
+                    delete_result = self.db_service.delete_user_invoice(operation.user_id, invoice_id)
                     
                     if delete_result["success"]:
                         item.status = "completed"
@@ -489,6 +548,90 @@ class BulkOperationsService:
             if operation.id in self.operation_tasks:
                 del self.operation_tasks[operation.id]
     
+    async def _execute_bulk_validate(self, operation: BulkOperation):
+        """Execute bulk validation operation."""
+        try:
+            total_findings = 0
+            
+            for item in operation.items:
+                try:
+                    check = ValidationCheck(item.data["check"])
+                    operation.progress.current_item = f"Check {check.value}"
+                    
+                    # Notify progress
+                    await self._notify_progress(operation)
+                    
+                    item.status = "processing"
+                    
+                    # Aggregate SQL pass - run off the event loop
+                    findings = await asyncio.to_thread(
+                        self.validation_service.run_check,
+                        operation.user_id,
+                        check,
+                        operation.id
+                    )
+                    
+                    item.status = "completed"
+                    item.result = {"findings": findings}
+                    total_findings += findings
+                    operation.progress.successful += 1
+                    
+                except Exception as e:
+                    logger.error(f"Error running validation check {item.data.get('check')}: {e}")
+                    item.status = "failed"
+                    item.error = str(e)
+                    operation.progress.failed += 1
+                
+                item.processed_at = datetime.utcnow()
+                operation.progress.processed += 1
+                operation.progress.percentage = (operation.progress.processed / operation.progress.total) * 100
+            
+            # Operation completed
+            operation.status = BulkOperationStatus.COMPLETED if operation.progress.failed == 0 else BulkOperationStatus.PARTIAL
+            operation.completed_at = datetime.utcnow()
+            operation.metadata["total_findings"] = total_findings
+            
+            # Final notification
+            await websocket_manager.send_notification(
+                NotificationType.BULK_OPERATION,
+                f"Bulk validation completed: {total_findings} findings",
+                user_id=operation.user_id,
+                priority=NotificationPriority.HIGH,
+                data={
+                    "operation_id": operation.id,
+                    "status": "completed",
+                    "total_findings": total_findings,
+                    "successful": operation.progress.successful,
+                    "failed": operation.progress.failed,
+                    "total": operation.progress.total
+                }
+            )
+            
+            logger.info(f"Bulk validate operation {operation.id} completed with {total_findings} findings")
+            
+        except Exception as e:
+            logger.error(f"Error in bulk validate operation {operation.id}: {e}")
+            operation.status = BulkOperationStatus.FAILED
+            operation.error = str(e)
+            operation.completed_at = datetime.utcnow()
+            
+            await websocket_manager.send_notification(
+                NotificationType.BULK_OPERATION,
+                f"Bulk validation failed: {str(e)}",
+                user_id=operation.user_id,
+                priority=NotificationPriority.HIGH,
+                data={
+                    "operation_id": operation.id,
+                    "status": "failed",
+                    "error": str(e)
+                }
+            )
+        
+        finally:
+            # Remove task reference
+            if operation.id in self.operation_tasks:
+                del self.operation_tasks[operation.id]
+    
     async def _notify_progress(self, operation: BulkOperation):
         """Send progress notification for operation."""
         await websocket_manager.send_notification(
@@ -0,0 +1,480 @@
+"""
+Company Service
+
+Resolves extracted vendor and customer details to company rows. Keeps a
+bounded, TTL-aware cache of company ids keyed by GSTIN and by normalized
+company name, so saves for a user's regular vendors skip the company
+upsert entirely. Name variants ("ACME Pvt. Ltd" / "Acme Private Limited")
+resolve through a normalized-name and trigram matcher, and a background
+job merges duplicates created before it existed.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, func, and_, or_
+
+from app.core.config import get_settings
+from app.core.database import get_db_session, has_index, apply_schema_upgrades
+from app.core.monitoring import app_metrics
+from app.models.database import CompanyModel, AddressModel, InvoiceModel
+from app.services.analytics_rollup_service import analytics_rollups
+from app.services.result_cache_service import result_cache
+from app.services.search_index_service import stored_invoice_search_vector
+from app.services.suggestion_service import suggestion_index
+
+logger = logging.getLogger(__name__)
+
+# Complete legal-form suffixes, longest first. Generic words such as "co",
+# "corp" or "inc" stay part of the name: "Global Corp" is not "Global Inc".
+LEGAL_SUFFIXES = (
+    ("opc", "private", "limited"),
+    ("opc", "pvt", "ltd"),
+    ("private", "limited"),
+    ("private", "ltd"),
+    ("pvt", "limited"),
+    ("pvt", "ltd"),
+    ("pte", "ltd"),
+    ("limited",),
+    ("ltd",),
+    ("llp",),
+    ("llc",),
+    ("plc",),
+    ("gmbh",),
+)
+
+# Version of the normalization rules; stored names written by older rules
+# are renormalized by the merge job
+NORMALIZATION_VERSION = 2
+
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+CacheKey = Tuple[str, str]
+
+
+def normalize_company_name(name: Optional[str]) -> str:
+    """
+    Normalize a company name for matching.
+    
+    Lowercases, drops punctuation and one trailing legal suffix, and
+    collapses whitespace: "ACME Pvt. Ltd." and "Acme Private Limited" both
+    become "acme".
+    """
+    if not name:
+        return ""
+    
+    words = _NON_ALPHANUMERIC.sub(" ", name.lower()).split()
+    for suffix in LEGAL_SUFFIXES:
+        if len(words) > len(suffix) and tuple(words[-len(suffix):]) == suffix:
+            del words[-len(suffix):]
+            break
+    return " ".join(words)
+
+
+def company_cache_key(company_info: Any) -> Optional[CacheKey]:
+    """Cache key for extracted company details: GSTIN when present, else normalized name."""
+    if not company_info:
+        return None
+    
+    gstin = (getattr(company_info, 'gstin', None) or "").strip().upper()
+    if gstin:
+        return ("gstin", gstin)
+    
+    name = normalize_company_name(getattr(company_info, 'company_name', None))
+    return ("name", name) if name else None
+
+
+class CompanyResolutionCache:
+    """LRU of company ids with per-entry expiry, shared by all requests in a process."""
+    
+    def __init__(self, max_entries: int = None, ttl_seconds: int = None):
+        settings = get_settings()
+        self.max_entries = max_entries or settings.COMPANY_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.COMPANY_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[CacheKey, Tuple[uuid.UUID, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: CacheKey) -> Optional[uuid.UUID]:
+        """Return the cached company id for a key, or None if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            hit_ratio = self.hits / (self.hits + self.misses)
+        
+        app_metrics.metrics.increment_counter(
+            "company_cache_lookups", tags={"result": "hit" if entry else "miss"}
+        )
+        app_metrics.metrics.set_gauge("company_cache_hit_ratio", hit_ratio)
+        return entry[0] if entry else None
+    
+    def put(self, key: CacheKey, company_id: uuid.UUID):
+        """Cache a company id; only call once the company row is committed."""
+        with self._lock:
+            self._entries[key] = (company_id, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            size = len(self._entries)
+        app_metrics.metrics.set_gauge("company_cache_entries", size)
+    
+    def invalidate(self, key: CacheKey):
+        """Drop one key (e.g. after a save using it failed)."""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def invalidate_company(self, company_id: uuid.UUID):
+        """Drop every key pointing at a company that was updated, merged or deleted."""
+        company_id = uuid.UUID(str(company_id))
+        with self._lock:
+            stale = [key for key, (cached_id, _) in self._entries.items() if cached_id == company_id]
+            for key in stale:
+                del self._entries[key]
+    
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Size and hit rate since start."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Global company id cache
+company_cache = CompanyResolutionCache()
+
+
+class CompanyMatcher:
+    """
+    Finds an existing company for an extracted name.
+    
+    An exact match on the normalized name wins; otherwise the most similar
+    normalized name above the trigram similarity threshold is used. Scoring
+    normalized names keeps shared legal suffixes from inflating similarity.
+    Both run in one query: the `%` operator lets
+    idx_companies_normalized_name_search prefilter candidates before
+    similarity() is ranked.
+    """
+    
+    def __init__(self, similarity_threshold: float = None):
+        self.similarity_threshold = similarity_threshold or get_settings().COMPANY_MATCH_SIMILARITY_THRESHOLD
+    
+    def find(self, session, company_name: str, gstin: Optional[str] = None) -> Optional[uuid.UUID]:
+        """
+        Find the id of the best-matching company.
+        
+        Args:
+            session: Active database session
+            company_name: Name as extracted from the invoice
+            gstin: GSTIN, if known; companies with a different GSTIN never
+                match, and without one only GSTIN-less companies do
+        
+        Returns:
+            Company ID, or None when nothing matches
+        """
+        normalized = normalize_company_name(company_name)
+        if not normalized:
+            return None
+        
+        exact = CompanyModel.normalized_name == normalized
+        similarity = func.similarity(CompanyModel.normalized_name, normalized)
+        query = select(CompanyModel.id).where(
+            or_(
+                exact,
+                and_(CompanyModel.normalized_name.op("%")(normalized), similarity >= self.similarity_threshold)
+            )
+        )
+        if gstin:
+            query = query.where(or_(CompanyModel.gstin.is_(None), CompanyModel.gstin == gstin))
+        else:
+            # A name alone does not identify a registered company
+            query = query.where(CompanyModel.gstin.is_(None))
+        
+        company_id = session.execute(
+            query.order_by(exact.desc(), similarity.desc(), CompanyModel.created_at).limit(1)
+        ).scalar()
+        
+        app_metrics.metrics.increment_counter(
+            "company_matches", tags={"result": "hit" if company_id else "miss"}
+        )
+        return company_id
+
+
+# Global company matcher
+company_matcher = CompanyMatcher()
+
+
+def merge_companies(session, canonical_id: uuid.UUID, duplicate_ids: List[uuid.UUID]) -> int:
+    """
+    Merge duplicate companies into a canonical one.
+    
+    Repoints invoices and addresses, fills the canonical row's missing
+    contact details from the duplicates and deletes them.
+    
+    Returns:
+        Number of invoices repointed
+    """
+    if not duplicate_ids:
+        return 0
+    
+    # Search vectors index company names, so they are recomputed with the new id
+    repointed = 0
+    for column in (InvoiceModel.vendor_id, InvoiceModel.customer_id):
+        repointed += session.execute(
+            update(InvoiceModel).where(column.in_(duplicate_ids)).values({
+                column.key: canonical_id,
+                "search_vector": stored_invoice_search_vector(**{column.key: canonical_id})
+            })
+        ).rowcount
+    
+    analytics_rollups.refresh_companies(session, duplicate_ids)
+    
+    session.execute(
+        update(AddressModel).where(AddressModel.company_id.in_(duplicate_ids)).values(company_id=canonical_id)
+    )
+    
+    contact = session.execute(
+        select(func.max(CompanyModel.phone), func.max(CompanyModel.email))
+        .where(CompanyModel.id.in_(duplicate_ids))
+    ).one()
+    session.execute(
+        update(CompanyModel).where(CompanyModel.id == canonical_id).values(
+            phone=func.coalesce(CompanyModel.phone, contact[0]),
+            email=func.coalesce(CompanyModel.email, contact[1]),
+            updated_at=func.now()
+        )
+    )
+    
+    session.execute(delete(CompanyModel).where(CompanyModel.id.in_(duplicate_ids)))
+    
+    for company_id in [canonical_id, *duplicate_ids]:
+        company_cache.invalidate_company(company_id)
+    return repointed
+
+
+def _plan_name_group(rows: list) -> List[Tuple[uuid.UUID, List[uuid.UUID]]]:
+    """
+    Split companies sharing a normalized name into (canonical, duplicates).
+    
+    Rows are ordered oldest first. Only rows sharing a GSTIN merge, into
+    the oldest; GSTIN-less rows merge among themselves and never into a
+    GSTIN holder, since a shared name alone does not make them one entity.
+    """
+    by_gstin = defaultdict(list)
+    for row in rows:
+        by_gstin[row.gstin].append(row.id)
+    return [(ids[0], ids[1:]) for ids in by_gstin.values() if len(ids) > 1]
+
+
+def merge_duplicate_companies(batch_size: int = None, after: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Merge one batch of duplicate companies.
+    
+    Backfills normalized names (or rewrites those from older rules) first,
+    then merges companies sharing a GSTIN, then walks normalized-name
+    groups in key order from `after`.
+    
+    Args:
+        batch_size: Groups processed per call
+        after: Normalized name to resume after (cursor from the previous call)
+    
+    Returns:
+        Dictionary with counts and the cursor for the next call (None when done)
+    """
+    batch_size = batch_size or get_settings().COMPANY_MERGE_BATCH_SIZE
+    result = {"normalized": 0, "companies_merged": 0, "invoices_repointed": 0, "cursor": None}
+    
+    try:
+        with get_db_session() as session:
+            # Companies written before normalized names were stored, or by older rules
+            pending = session.execute(
+                select(CompanyModel.id, CompanyModel.company_name)
+                .where(or_(
+                    CompanyModel.normalized_version.is_(None),
+                    CompanyModel.normalized_version != NORMALIZATION_VERSION
+                ))
+                .limit(batch_size * 10)
+            ).all()
+            if pending:
+                session.execute(update(CompanyModel), [
+                    {
+                        "id": company_id,
+                        "normalized_name": normalize_company_name(name),
+                        "normalized_version": NORMALIZATION_VERSION
+                    }
+                    for company_id, name in pending
+                ])
+                session.flush()
+                result["normalized"] = len(pending)
+            
+            groups = []
+            
+            # Same GSTIN stored twice (possible before uq_companies_gstin existed)
+            duplicate_gstins = select(CompanyModel.gstin).where(
+                CompanyModel.gstin.isnot(None)
+            ).group_by(CompanyModel.gstin).having(func.count() > 1).limit(batch_size)
+            rows = session.execute(
+                select(CompanyModel.id, CompanyModel.gstin)
+                .where(CompanyModel.gstin.in_(duplicate_gstins))
+                .order_by(CompanyModel.gstin, CompanyModel.created_at)
+            ).all()
+            by_gstin = defaultdict(list)
+            for row in rows:
+                by_gstin[row.gstin].append(row.id)
+            groups.extend((ids[0], ids[1:]) for ids in by_gstin.values())
+            
+            # Name variants, in key order so unmergeable groups are not revisited
+            names_query = select(CompanyModel.normalized_name).where(
+                CompanyModel.normalized_name.isnot(None),
+                CompanyModel.normalized_name != ""
+            )
+            if after is not None:
+                names_query = names_query.where(CompanyModel.normalized_name > after)
+            names = session.execute(
+                names_query.group_by(CompanyModel.normalized_name)
+                .having(func.count() > 1)
+                .order_by(CompanyModel.normalized_name)
+                .limit(batch_size)
+            ).scalars().all()
+            
+            if names:
+                rows = session.execute(
+                    select(CompanyModel.id, CompanyModel.gstin, CompanyModel.normalized_name)
+                    .where(CompanyModel.normalized_name.in_(names))
+                    .order_by(CompanyModel.normalized_name, CompanyModel.created_at)
+                ).all()
+                by_name = defaultdict(list)
+                for row in rows:
+                    by_name[row.normalized_name].append(row)
+                merged_ids = {duplicate for _, duplicates in groups for duplicate in duplicates}
+                for name_rows in by_name.values():
+                    name_rows = [row for row in name_rows if row.id not in merged_ids]
+                    if len(name_rows) > 1:
+                        groups.extend(_plan_name_group(name_rows))
+                if len(names) == batch_size:
+                    result["cursor"] = names[-1]
+            
+            for canonical_id, duplicate_ids in groups:
+                if duplicate_ids:
+                    result["invoices_repointed"] += merge_companies(session, canonical_id, duplicate_ids)
+                    result["companies_merged"] += len(duplicate_ids)
+            
+            # More companies may still lack a normalized name
+            if len(pending) == batch_size * 10 and result["cursor"] is None:
+                result["cursor"] = after or ""
+        
+        app_metrics.metrics.increment_counter("companies_merged", result["companies_merged"])
+        app_metrics.metrics.increment_counter("company_merge_invoices_repointed", result["invoices_repointed"])
+        if result["companies_merged"]:
+            logger.info(
+                f"Merged {result['companies_merged']} duplicate companies, "
+                f"repointed {result['invoices_repointed']} invoices"
+            )
+        return result
+    
+    except Exception as e:
+        logger.error(f"Error merging duplicate companies: {e}")
+        return result
+
+
+class CompanyMergeJob:
+    """Background task that periodically merges duplicate companies."""
+    
+    def __init__(self, interval_seconds: int = None):
+        self.interval_seconds = interval_seconds or get_settings().COMPANY_MERGE_INTERVAL_SECONDS
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start background merging."""
+        if self._running:
+            return
+        
+        self._running = True
+        logger.info("Starting company merge job")
+        self._task = asyncio.create_task(self._merge_loop())
+    
+    def stop(self):
+        """Stop background merging."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        logger.info("Stopping company merge job")
+    
+    async def run_once(self) -> Dict[str, int]:
+        """Merge all current duplicates, one batch per transaction."""
+        totals = {"normalized": 0, "companies_merged": 0, "invoices_repointed": 0}
+        cursor = None
+        while self._running:
+            result = await asyncio.to_thread(merge_duplicate_companies, after=cursor)
+            for key in totals:
+                totals[key] += result[key]
+            cursor = result["cursor"]
+            if cursor is None:
+                break
+        
+        # Merged companies disappear from every affected user's suggestions and results
+        if totals["companies_merged"]:
+            suggestion_index.clear()
+            result_cache.clear()
+        
+        # Duplicates may have blocked the upsert conflict indexes; retry them
+        if not (
+            has_index("companies", "uq_companies_gstin")
+            and has_index("companies", "uq_companies_name_without_gstin")
+        ):
+            await asyncio.to_thread(apply_schema_upgrades)
+        return totals
+    
+    async def _merge_loop(self):
+        """Main merge loop."""
+        while self._running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error in company merge job: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+# Global company merge job
+company_merge_job = CompanyMergeJob()
+
+
+__all__ = [
+    "CompanyMatcher",
+    "CompanyMergeJob",
+    "CompanyResolutionCache",
+    "NORMALIZATION_VERSION",
+    "company_cache",
+    "company_cache_key",
+    "company_matcher",
+    "company_merge_job",
+    "merge_companies",
+    "merge_duplicate_companies",
+    "normalize_company_name",
+]
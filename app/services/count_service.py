@@ -0,0 +1,254 @@
+"""
+Count Service
+
+Totals for paginated invoice listings without an exact COUNT(*) per
+request. Unfiltered totals come from maintained per-user counters;
+filtered totals come from a COUNT(*) OVER () window in the page query
+when available, otherwise from a short-TTL cache keyed by query
+fingerprint, a planner estimate for very large result sets (flagged as
+approximate), or an exact count as the last resort.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import cast, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.monitoring import app_metrics
+from app.models.database import InvoiceModel, UserInvoiceStatsModel
+
+logger = logging.getLogger(__name__)
+
+
+class CountStrategy(str, Enum):
+    """How a listing total was obtained."""
+    MAINTAINED = "maintained"
+    WINDOW = "window"
+    CACHED = "cached"
+    ESTIMATE = "estimate"
+    EXACT = "exact"
+
+
+def query_fingerprint(endpoint: str, params: Dict[str, Any]) -> str:
+    """Stable fingerprint of a listing's filters (pagination and sort excluded by the caller)."""
+    raw = json.dumps({"endpoint": endpoint, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class InvoiceCountService:
+    """Maintained per-user invoice counters and cached filtered totals."""
+    
+    def __init__(self, ttl_seconds: int = None, max_entries: int = None, estimate_threshold: int = None):
+        settings = get_settings()
+        self.ttl_seconds = ttl_seconds or settings.COUNT_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or settings.COUNT_CACHE_MAX_ENTRIES
+        self.estimate_threshold = estimate_threshold or settings.COUNT_ESTIMATE_THRESHOLD
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    # Maintained counters
+    
+    def adjust_user_invoice_count(self, session, user_id: str, delta: int):
+        """
+        Apply a delta to a user's counter inside the caller's transaction.
+        
+        Call after the invoice change is written (its row is then part of an
+        exact count) and call invalidate_user() after commit. A missing
+        counter is created from an exact count; if another transaction
+        creates it first, the delta is applied to that one instead, so a
+        counter seeded while this change was uncommitted still gets it.
+        """
+        updated = session.execute(
+            update(UserInvoiceStatsModel)
+            .where(UserInvoiceStatsModel.user_id == user_id)
+            .values(
+                invoice_count=UserInvoiceStatsModel.invoice_count + delta,
+                updated_at=datetime.utcnow()
+            )
+        ).rowcount
+        if updated:
+            return
+        
+        session.execute(
+            pg_insert(UserInvoiceStatsModel).from_select(
+                ["user_id", "invoice_count", "updated_at"],
+                self._exact_count_select(user_id)
+            ).on_conflict_do_update(
+                index_elements=[UserInvoiceStatsModel.user_id],
+                set_={
+                    "invoice_count": UserInvoiceStatsModel.invoice_count + delta,
+                    "updated_at": datetime.utcnow()
+                }
+            )
+        )
+    
+    @staticmethod
+    def _exact_count_select(user_id: str):
+        return select(
+            cast(literal(str(user_id)), UserInvoiceStatsModel.user_id.type),
+            func.count(InvoiceModel.id),
+            func.now()
+        ).where(InvoiceModel.user_id == user_id)
+    
+    def get_user_invoice_count(self, user_id: str, session=None) -> int:
+        """Total invoices of a user from the maintained counter."""
+        if session is None:
+            with get_db_session() as session:
+                return self.get_user_invoice_count(user_id, session)
+        
+        count = session.execute(
+            select(UserInvoiceStatsModel.invoice_count).where(UserInvoiceStatsModel.user_id == user_id)
+        ).scalar()
+        if count is not None:
+            app_metrics.metrics.increment_counter("listing_counts", tags={"strategy": CountStrategy.MAINTAINED.value})
+            return count
+        
+        # First read for this user: initialize from an exact count
+        initialize = pg_insert(UserInvoiceStatsModel).from_select(
+            ["user_id", "invoice_count", "updated_at"],
+            self._exact_count_select(user_id)
+        ).on_conflict_do_nothing(index_elements=[UserInvoiceStatsModel.user_id])
+        session.execute(initialize)
+        app_metrics.metrics.increment_counter("listing_counts", tags={"strategy": CountStrategy.EXACT.value})
+        return session.execute(
+            select(UserInvoiceStatsModel.invoice_count).where(UserInvoiceStatsModel.user_id == user_id)
+        ).scalar() or 0
+    
+    # Filtered totals
+    
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry[0]
+    
+    def _cache_put(self, key: Tuple[str, str], result: Dict[str, Any]):
+        with self._lock:
+            self._cache[key] = (result, time.monotonic() + self.ttl_seconds)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+    
+    def invalidate_user(self, user_id: str):
+        """Drop a user's cached totals after their invoices change."""
+        user_id = str(user_id)
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == user_id]:
+                del self._cache[key]
+    
+    def record_total(self, user_id: str, fingerprint: str, total: int, strategy: CountStrategy = CountStrategy.WINDOW):
+        """Cache an exact total obtained elsewhere (e.g. a window count in the page query)."""
+        app_metrics.metrics.increment_counter("listing_counts", tags={"strategy": strategy.value})
+        self._cache_put((str(user_id), fingerprint), {
+            "total": total,
+            "total_is_approximate": False,
+            "count_strategy": CountStrategy.CACHED.value
+        })
+    
+    def estimate(self, session, query) -> Optional[int]:
+        """Row estimate of the planner for a query, or None if it cannot be obtained."""
+        try:
+            compiled = query.statement.compile(
+                dialect=session.bind.dialect, compile_kwargs={"render_postcompile": True}
+            )
+            cursor = session.connection().exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {compiled.string}", compiled.params
+            )
+            plan = cursor.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        except Exception as e:
+            logger.warning(f"Could not estimate row count: {e}")
+            return None
+    
+    def count_filtered(self, session, query, user_id: str, fingerprint: str) -> Dict[str, Any]:
+        """
+        Total for a filtered listing.
+        
+        Args:
+            session: Active database session
+            query: Filtered ORM query over invoices (no ordering or pagination)
+            user_id: Owner of the listing, for invalidation
+            fingerprint: query_fingerprint() of the listing's filters
+        
+        Returns:
+            Dictionary with total, total_is_approximate and count_strategy
+        """
+        key = (str(user_id), fingerprint)
+        cached = self._cache_get(key)
+        if cached is not None:
+            app_metrics.metrics.increment_counter("listing_counts", tags={"strategy": CountStrategy.CACHED.value})
+            return cached
+        
+        estimated = self.estimate(session, query)
+        if estimated is not None and estimated > self.estimate_threshold:
+            result = {
+                "total": estimated,
+                "total_is_approximate": True,
+                "count_strategy": CountStrategy.ESTIMATE.value
+            }
+        else:
+            total = query.with_entities(func.count(InvoiceModel.id)).order_by(None).scalar()
+            result = {
+                "total": total,
+                "total_is_approximate": False,
+                "count_strategy": CountStrategy.EXACT.value
+            }
+        
+        app_metrics.metrics.increment_counter("listing_counts", tags={"strategy": result["count_strategy"]})
+        self._cache_put(key, {**result, "count_strategy": CountStrategy.CACHED.value})
+        return result
+    
+    def complete_pagination(
+        self,
+        session,
+        query,
+        user_id: str,
+        fingerprint: str,
+        pagination: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Add total, pages and count metadata to a paginate() result.
+        
+        Uses the page query's window total when it has one (and caches it
+        for the following keyset pages), otherwise count_filtered().
+        """
+        if "total" in pagination:
+            self.record_total(user_id, fingerprint, pagination["total"])
+            counted = {
+                "total": pagination["total"],
+                "total_is_approximate": False,
+                "count_strategy": CountStrategy.WINDOW.value
+            }
+        else:
+            counted = self.count_filtered(session, query, user_id, fingerprint)
+        
+        limit = pagination["limit"]
+        return {**pagination, **counted, "pages": (counted["total"] + limit - 1) // limit}
+
+
+# Global count service
+invoice_count_service = InvoiceCountService()
+
+
+__all__ = [
+    "CountStrategy",
+    "InvoiceCountService",
+    "invoice_count_service",
+    "query_fingerprint",
+]
@@ -6,25 +6,48 @@ including CRUD operations and business logic for data storage.
 """
 import logging
 from typing import Optional, Any
-import os
-from pathlib import Path
 import uuid
 from datetime import datetime
 
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy.orm import selectinload, joinedload
-from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import selectinload, joinedload, aliased, undefer
+from sqlalchemy import func, and_, or_, select, exists, insert, update, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from app.core.database import get_db_session
+from app.core.database import get_db_session, count_round_trips, has_index
+from app.core.exceptions import ValidationException
+from app.core.monitoring import app_metrics
+from app.core.pagination import SortKey, paginate
+from app.core.validation import parse_invoice_date
 from app.models.database import (
     InvoiceModel, CompanyModel, AddressModel, 
-    LineItemModel, TaxCalculationModel, AddressType, ExtractionConfidence
+    LineItemModel, TaxCalculationModel, AddressType, ExtractionConfidence,
+    FileReferenceModel
 )
 from app.models.schemas import InvoiceDataSchema
+from app.services.analytics_rollup_service import analytics_rollups
+from app.services.company_service import (
+    NORMALIZATION_VERSION, company_cache, company_cache_key, company_matcher, normalize_company_name
+)
+from app.services.count_service import CountStrategy, invoice_count_service, query_fingerprint
+from app.services.file_service import FileService
+from app.services.search_index_service import build_tsquery, invoice_search_vector
+from app.services.result_cache_service import cached_result, result_cache
+from app.services.suggestion_service import invoice_suggestion_entries, suggestion_index
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Vendor and customer joins for list projections
+VENDOR = aliased(CompanyModel, name="vendor")
+CUSTOMER = aliased(CompanyModel, name="customer")
+
+# Newest first; served by idx_invoices_user_date
+INVOICE_RECENCY_KEYS = [
+    SortKey(InvoiceModel.created_at, descending=True, nullable=False),
+    SortKey(InvoiceModel.id, descending=True, nullable=False),
+]
+
 
 class DatabaseService:
     """Service for database operations."""
@@ -78,15 +101,17 @@ class DatabaseService:
                 if existing:
                     return existing
             
-            # If no GSTIN match, try by company name
-            existing = query.filter(CompanyModel.company_name == company_name).first()
-            if existing:
-                return existing
+            # If no GSTIN match, try name variants (normalized and trigram)
+            company_id = company_matcher.find(session, company_name, getattr(company_info, 'gstin', None))
+            if company_id:
+                return session.get(CompanyModel, company_id)
             
             # Create new company
             logger.info(f"Creating new company: {company_name}")
             company = CompanyModel(
                 company_name=company_name,
+                normalized_name=normalize_company_name(company_name),
+                normalized_version=NORMALIZATION_VERSION,
                 gstin=getattr(company_info, 'gstin', None),
                 phone=getattr(company_info, 'phone', None),
                 email=getattr(company_info, 'email', None)
@@ -110,21 +135,162 @@ class DatabaseService:
             
             logger.info(f"Created new company: {company_name}")
             return company
-            
+        
         except Exception as e:
             logger.error(f"Error creating/getting company: {e}")
             raise
     
+    def company_upserts_available(self) -> bool:
+        """Whether the unique indexes used as upsert conflict targets exist."""
+        return (
+            has_index("companies", "uq_companies_gstin")
+            and has_index("companies", "uq_companies_name_without_gstin")
+        )
+    
+    def upsert_company(self, session, company_info: Any, addresses: list) -> Optional[uuid.UUID]:
+        """
+        Resolve a company to its id with a single INSERT ... ON CONFLICT.
+        
+        Companies are matched by GSTIN when one is present, otherwise by exact
+        name among companies without a GSTIN (name variants are resolved by
+        the company matcher first). Missing phone/email on an existing row
+        are filled in from the new invoice.
+        
+        Args:
+            session: Active database session
+            company_info: Vendor or customer information from the extraction
+            addresses: Address rows to insert; a billing address is appended
+                for newly created companies
+        
+        Returns:
+            Company ID, or None when the company has no name
+        """
+        if not company_info:
+            return None
+        
+        company_name = getattr(company_info, 'company_name', None)
+        if not company_name or company_name.strip() == "":
+            return None
+        
+        gstin = getattr(company_info, 'gstin', None) or None
+        now = datetime.utcnow()
+        
+        upsert = pg_insert(CompanyModel).values(
+            id=uuid.uuid4(),
+            company_name=company_name,
+            normalized_name=normalize_company_name(company_name),
+            normalized_version=NORMALIZATION_VERSION,
+            gstin=gstin,
+            phone=getattr(company_info, 'phone', None),
+            email=getattr(company_info, 'email', None),
+            created_at=now,
+            updated_at=now
+        )
+        if gstin:
+            conflict_target = {
+                "index_elements": [CompanyModel.gstin],
+                "index_where": CompanyModel.gstin.isnot(None)
+            }
+        else:
+            conflict_target = {
+                "index_elements": [CompanyModel.company_name],
+                "index_where": CompanyModel.gstin.is_(None)
+            }
+        
+        # DO UPDATE (not DO NOTHING) so RETURNING yields the existing row too
+        upsert = upsert.on_conflict_do_update(
+            **conflict_target,
+            set_={
+                "phone": func.coalesce(CompanyModel.phone, upsert.excluded.phone),
+                "email": func.coalesce(CompanyModel.email, upsert.excluded.email)
+            }
+        ).returning(CompanyModel.id, literal_column("xmax = 0").label("inserted"))
+        company_id, inserted = session.execute(upsert).one()
+        
+        address = getattr(company_info, 'address', None)
+        if inserted:
+            logger.info(f"Created new company: {company_name}")
+            if address:
+                addresses.append({
+                    "id": uuid.uuid4(),
+                    "company_id": company_id,
+                    "street": getattr(address, 'street', None),
+                    "city": getattr(address, 'city', None),
+                    "state": getattr(address, 'state', None),
+                    "country": getattr(address, 'country', None),
+                    "pincode": getattr(address, 'pincode', None),
+                    "address_type": AddressType.billing
+                })
+        
+        return company_id
+    
+    def _resolve_company_id(
+        self,
+        session,
+        company_info: Any,
+        addresses: list,
+        resolved: list,
+        use_upsert: bool
+    ) -> Optional[uuid.UUID]:
+        """
+        Resolve a company id from the cache, falling back to the database.
+        
+        Ids resolved from the database are appended to `resolved` as
+        (key, id) and only cached after the transaction commits, so a rolled
+        back insert never leaves a dangling id in the cache.
+        """
+        key = company_cache_key(company_info)
+        if key:
+            company_id = company_cache.get(key)
+            if company_id:
+                app_metrics.metrics.increment_counter("company_cache_queries_saved")
+                resolved.append((key, None))
+                return company_id
+        
+        if use_upsert:
+            company_id = None
+            if key and key[0] == "name":
+                # Without a GSTIN, reuse a name variant before creating a company
+                company_id = company_matcher.find(session, company_info.company_name)
+            if not company_id:
+                company_id = self.upsert_company(session, company_info, addresses)
+        else:
+            company = self.get_or_create_company(session, company_info)
+            company_id = company.id if company else None
+        
+        if key and company_id:
+            resolved.append((key, company_id))
+        return company_id
+    
     def save_invoice_to_db(self, invoice_data: InvoiceDataSchema, user_id: str) -> dict[str, Any]:
         """
         Save complete invoice data to database.
         
+        The duplicate check, company upserts, invoice, line items and tax row
+        are written in one transaction. Round-trips per save are recorded in
+        the invoice_save_round_trips histogram.
+        
         Args:
             invoice_data: Validated invoice data schema
-            
+        
         Returns:
             Dictionary with success status and details
         """
+        use_upsert = self.company_upserts_available()
+        with count_round_trips() as trips:
+            result = self._save_invoice(invoice_data, user_id, use_upsert)
+        
+        app_metrics.metrics.record_histogram(
+            "invoice_save_round_trips",
+            trips.total,
+            tags={"path": "upsert" if use_upsert else "legacy"}
+        )
+        result["round_trips"] = trips.total
+        return result
+    
+    def _save_invoice(self, invoice_data: InvoiceDataSchema, user_id: str, use_upsert: bool) -> dict[str, Any]:
+        """Run the save transaction; see save_invoice_to_db."""
+        resolved_companies = []
         try:
             # CRITICAL DEBUG: Log the user_id being used
             logger.error(f"🚨 CRITICAL DEBUG - save_invoice_to_db called with user_id: {user_id}")
@@ -133,34 +299,52 @@ class DatabaseService:
             # Generate invoice number if missing for duplicate check
             invoice_number = invoice_data.invoice_number or self.generate_default_invoice_number()
             
-            # Check for duplicate (scoped to current user)
-            if self.check_duplicate_invoice(invoice_number, user_id):
-                return {
-                    "success": False,
-                    "duplicate": True,
-                    "message": f"Invoice {invoice_number} already exists in database",
-                    "error": "Duplicate invoice number"
-                }
-            
             with get_db_session() as session:
-                # Get or create vendor company
+                # Check for duplicate (scoped to current user) in the saving transaction
+                is_duplicate = session.execute(
+                    select(exists().where(
+                        InvoiceModel.invoice_number == invoice_number,
+                        InvoiceModel.user_id == user_id
+                    ))
+                ).scalar()
+                if is_duplicate:
+                    return {
+                        "success": False,
+                        "duplicate": True,
+                        "message": f"Invoice {invoice_number} already exists in database",
+                        "error": "Duplicate invoice number"
+                    }
+                
+                addresses = []
                 logger.info(f"Processing vendor information: {invoice_data.vendor_information}")
-                vendor = self.get_or_create_company(session, invoice_data.vendor_information)
-                logger.info(f"Vendor result: {vendor.company_name if vendor else 'None'}")
+                vendor_id = self._resolve_company_id(
+                    session, invoice_data.vendor_information, addresses, resolved_companies, use_upsert
+                )
                 
-                # Get or create customer company
                 logger.info(f"Processing customer information: {invoice_data.customer_information}")
-                customer = self.get_or_create_company(session, invoice_data.customer_information)
-                logger.info(f"Customer result: {customer.company_name if customer else 'None'}")
+                customer_id = self._resolve_company_id(
+                    session, invoice_data.customer_information, addresses, resolved_companies, use_upsert
+                )
+                
+                if addresses:
+                    session.execute(insert(AddressModel).values(addresses))
                 
                 # Create invoice record (invoice_number already generated above)
                 logger.error(f"🚨 CRITICAL DEBUG - Creating invoice with user_id: {user_id}")
                 logger.error(f"🚨 CRITICAL DEBUG - Invoice number being saved: {invoice_number}")
                 
-                invoice = InvoiceModel(
+                # The id (and created_at, which rollups are keyed by) is generated
+                # here so dependent rows need no RETURNING round-trip
+                invoice_id = uuid.uuid4()
+                created_at = datetime.utcnow()
+                invoice_date_parsed = parse_invoice_date(invoice_data.invoice_date)
+                session.execute(insert(InvoiceModel).values(
+                    id=invoice_id,
                     invoice_number=invoice_number,
                     invoice_date=invoice_data.invoice_date,
                     due_date=invoice_data.due_date,
+                    invoice_date_parsed=invoice_date_parsed,
+                    due_date_parsed=parse_invoice_date(invoice_data.due_date),
                     currency=invoice_data.currency,
                     gross_amount=invoice_data.gross_amount,
                     net_amount=invoice_data.net_amount,
@@ -168,58 +352,101 @@ class DatabaseService:
                     qr_code_data=invoice_data.qr_code_data,
                     extraction_confidence=ExtractionConfidence(invoice_data.extraction_confidence or "medium"),
                     raw_text=invoice_data.raw_text,
+                    search_vector=invoice_search_vector(
+                        invoice_number,
+                        vendor_id,
+                        customer_id,
+                        " ".join(item.description for item in invoice_data.line_items or [] if item.description),
+                        invoice_data.raw_text
+                    ),
                     original_file_id=invoice_data.original_file_id,
                     original_filename=invoice_data.original_filename,
-                    vendor_id=vendor.id if vendor else None,
-                    customer_id=customer.id if customer else None,
-                    user_id=user_id
-                )
-                session.add(invoice)
-                session.flush()  # Get invoice ID
-                
-                # Create line items
-                for item_data in invoice_data.line_items:
-                    line_item = LineItemModel(
-                        invoice_id=invoice.id,
-                        serial_number=item_data.serial_number,
-                        description=item_data.description,
-                        hsn_code=item_data.hsn_code,
-                        quantity=item_data.quantity,
-                        unit=item_data.unit,
-                        rate=item_data.rate,
-                        amount=item_data.amount
+                    vendor_id=vendor_id,
+                    customer_id=customer_id,
+                    user_id=user_id,
+                    created_at=created_at
+                ))
+                
+                # Link the uploaded file's catalog entry to this invoice
+                if invoice_data.original_file_id:
+                    session.execute(
+                        update(FileReferenceModel).where(
+                            FileReferenceModel.file_id == invoice_data.original_file_id,
+                            FileReferenceModel.user_id == user_id
+                        ).values(invoice_id=invoice_id)
                     )
-                    session.add(line_item)
+                
+                # Create line items in one multi-row INSERT
+                if invoice_data.line_items:
+                    session.execute(insert(LineItemModel).values([
+                        {
+                            "id": uuid.uuid4(),
+                            "invoice_id": invoice_id,
+                            "serial_number": item_data.serial_number,
+                            "description": item_data.description,
+                            "hsn_code": item_data.hsn_code,
+                            "quantity": item_data.quantity,
+                            "unit": item_data.unit,
+                            "rate": item_data.rate,
+                            "amount": item_data.amount
+                        }
+                        for item_data in invoice_data.line_items
+                    ]))
                 
                 # Create tax calculation if provided
                 if invoice_data.tax_calculations:
-                    tax_calc = TaxCalculationModel(
-                        invoice_id=invoice.id,
-                        taxable_amount=invoice_data.tax_calculations.taxable_amount,
-                        cgst_rate=invoice_data.tax_calculations.cgst_rate,
-                        cgst_amount=invoice_data.tax_calculations.cgst_amount,
-                        sgst_rate=invoice_data.tax_calculations.sgst_rate,
-                        sgst_amount=invoice_data.tax_calculations.sgst_amount,
-                        igst_rate=invoice_data.tax_calculations.igst_rate,
-                        igst_amount=invoice_data.tax_calculations.igst_amount,
-                        total_tax=invoice_data.tax_calculations.total_tax
-                    )
-                    session.add(tax_calc)
+                    tax = invoice_data.tax_calculations
+                    session.execute(insert(TaxCalculationModel).values(
+                        id=uuid.uuid4(),
+                        invoice_id=invoice_id,
+                        taxable_amount=tax.taxable_amount,
+                        cgst_rate=tax.cgst_rate,
+                        cgst_amount=tax.cgst_amount,
+                        sgst_rate=tax.sgst_rate,
+                        sgst_amount=tax.sgst_amount,
+                        igst_rate=tax.igst_rate,
+                        igst_amount=tax.igst_amount,
+                        total_tax=tax.total_tax
+                    ))
+                
+                invoice_count_service.adjust_user_invoice_count(session, user_id, 1)
+                analytics_rollups.refresh_invoice(session, user_id, invoice_date_parsed, created_at)
+                result_cache.bump_version(session, user_id)
+                
+                # Indexes stored from here on may already include this invoice
+                suggestions_since = suggestion_index.generation
                 
                 # Commit all changes
                 session.commit()
+                invoice_count_service.invalidate_user(user_id)
+                result_cache.invalidate_user(user_id)
+                
+                if suggestion_index.is_loaded(user_id):
+                    self._add_invoice_suggestions(
+                        session, user_id, invoice_number, vendor_id, customer_id, invoice_data, suggestions_since
+                    )
+                else:
+                    # A load running across the commit must not be kept
+                    suggestion_index.invalidate(user_id)
                 
-                logger.info(f"Successfully saved invoice {invoice_data.invoice_number} with ID {invoice.id}")
+                for key, company_id in resolved_companies:
+                    if company_id:
+                        company_cache.put(key, company_id)
+                
+                logger.info(f"Successfully saved invoice {invoice_data.invoice_number} with ID {invoice_id}")
                 
                 return {
                     "success": True,
                     "message": "Invoice saved successfully",
-                    "invoice_id": str(invoice.id),
+                    "invoice_id": str(invoice_id),
                     "duplicate": False
                 }
-                
+        
         except IntegrityError as e:
             logger.error(f"Database integrity error: {e}")
+            # A cached id may point at a company merged away since it was cached
+            for key, _ in resolved_companies:
+                company_cache.invalidate(key)
             return {
                 "success": False,
                 "error": "Database constraint violation - possible duplicate",
@@ -280,30 +507,66 @@ class DatabaseService:
                 "error": str(e)
             }
     
-    def get_user_invoices(self, user_id: str, page: int = 1, limit: int = 10) -> dict[str, Any]:
-        """Get invoices for a specific user with pagination and optimized loading."""
+    def _invoice_summary_query(self, session):
+        """
+        Narrow projection for invoice lists.
+        
+        Selects only the listed columns plus vendor/customer names; line item
+        counts and tax presence come from correlated subqueries, so neither
+        raw_text nor related rows are loaded.
+        """
+        return session.query(
+            InvoiceModel.id,
+            InvoiceModel.invoice_number,
+            InvoiceModel.invoice_date,
+            InvoiceModel.net_amount,
+            InvoiceModel.currency,
+            InvoiceModel.extraction_confidence,
+            InvoiceModel.original_file_id,
+            InvoiceModel.original_filename,
+            InvoiceModel.created_at,
+            VENDOR.company_name.label("vendor_name"),
+            CUSTOMER.company_name.label("customer_name"),
+            InvoiceModel.line_item_count,
+            InvoiceModel.has_tax_calculation
+        ).outerjoin(
+            VENDOR, InvoiceModel.vendor_id == VENDOR.id
+        ).outerjoin(
+            CUSTOMER, InvoiceModel.customer_id == CUSTOMER.id
+        )
+    
+    @cached_result("user_invoices")
+    def get_user_invoices(
+        self,
+        user_id: str,
+        page: int = 1,
+        limit: int = 10,
+        cursor: Optional[str] = None
+    ) -> dict[str, Any]:
+        """
+        Get invoices for a specific user, newest first.
+        
+        Pass `cursor` (next_cursor/prev_cursor from a previous response) for
+        keyset pagination on (created_at, id); `page` is the legacy offset
+        mode and is ignored when a cursor is given.
+        """
         try:
             # CRITICAL DEBUG: Log the user_id being queried
             logger.error(f"🚨 CRITICAL DEBUG - get_user_invoices called with user_id: {user_id}")
             
             with get_db_session() as session:
-                # Calculate offset
-                offset = (page - 1) * limit
-                
-                # Optimized count query using index
-                total = session.query(func.count(InvoiceModel.id)).filter(
-                    InvoiceModel.user_id == user_id
-                ).scalar()
-                
-                # Get paginated invoices with eager loading of related data
-                invoices = session.query(InvoiceModel).options(
-                    joinedload(InvoiceModel.vendor),
-                    joinedload(InvoiceModel.customer),
-                    selectinload(InvoiceModel.line_items),
-                    joinedload(InvoiceModel.tax_calculation)
-                ).filter(
-                    InvoiceModel.user_id == user_id
-                ).order_by(InvoiceModel.created_at.desc()).offset(offset).limit(limit).all()
+                # Unfiltered total from the maintained per-user counter
+                total = invoice_count_service.get_user_invoice_count(user_id, session)
+                
+                # Get the page as a narrow projection (no raw_text, no related rows)
+                invoices, pagination = paginate(
+                    self._invoice_summary_query(session).filter(InvoiceModel.user_id == user_id),
+                    INVOICE_RECENCY_KEYS,
+                    limit,
+                    cursor=cursor,
+                    page=page,
+                    metric_name="user_invoices_page"
+                )
                 
                 # CRITICAL DEBUG: Log what invoices were found
                 logger.error(f"🚨 CRITICAL DEBUG - Found {len(invoices)} invoices for user {user_id}")
@@ -325,29 +588,52 @@ class DatabaseService:
                         "original_file_id": invoice.original_file_id,
                         "original_filename": invoice.original_filename,
                         "created_at": invoice.created_at.isoformat(),
-                        "vendor_name": invoice.vendor.company_name if invoice.vendor else "Unknown Vendor",
-                        "customer_name": invoice.customer.company_name if invoice.customer else "Unknown Customer",
-                        "line_items_count": len(invoice.line_items) if invoice.line_items else 0,
-                        "has_tax_calculation": invoice.tax_calculation is not None
+                        "vendor_name": invoice.vendor_name or "Unknown Vendor",
+                        "customer_name": invoice.customer_name or "Unknown Customer",
+                        "line_items_count": invoice.line_item_count,
+                        "has_tax_calculation": invoice.has_tax_calculation
                     })
                 
                 return {
                     "invoices": invoice_list,
                     "pagination": {
-                        "page": page,
-                        "limit": limit,
+                        **pagination,
                         "total": total,
-                        "pages": (total + limit - 1) // limit
+                        "pages": (total + limit - 1) // limit,
+                        "total_is_approximate": False,
+                        "count_strategy": CountStrategy.MAINTAINED.value
                     }
                 }
-                
+        
+        except ValidationException:
+            raise
         except Exception as e:
             logger.error(f"Error getting user invoices for {user_id}: {e}")
             return {
+                "success": False,
+                "error": str(e),
                 "invoices": [],
                 "pagination": {"page": page, "limit": limit, "total": 0, "pages": 0}
             }
     
+    def _add_invoice_suggestions(
+        self, session, user_id: str, invoice_number: str, vendor_id, customer_id, invoice_data: InvoiceDataSchema, since: int
+    ):
+        """Add a saved invoice to the user's loaded suggestion index, under the stored company names."""
+        try:
+            company_ids = [company_id for company_id in (vendor_id, customer_id) if company_id]
+            names = dict(session.execute(
+                select(CompanyModel.id, CompanyModel.company_name).where(CompanyModel.id.in_(company_ids))
+            ).all()) if company_ids else {}
+            suggestion_index.add_invoice(user_id, invoice_suggestion_entries(
+                invoice_number,
+                [names.get(company_id) for company_id in company_ids],
+                [(item.hsn_code, item.description) for item in invoice_data.line_items or []]
+            ), since)
+        except Exception as e:
+            logger.warning(f"Could not update suggestion index for user {user_id}: {e}")
+            suggestion_index.invalidate(user_id)
+    
     def delete_user_invoice(self, user_id: str, invoice_id: str) -> dict[str, Any]:
         """Delete a specific invoice for a user and clean up associated files."""
         try:
@@ -366,17 +652,38 @@ class DatabaseService:
                 # Store file information for cleanup before deleting
                 file_id = invoice.original_file_id
                 
+                # Read before the delete; line items are loaded by the cascade anyway
+                suggestions = None
+                if suggestion_index.is_loaded(user_id):
+                    suggestions = invoice_suggestion_entries(
+                        invoice.invoice_number,
+                        [invoice.vendor.company_name if invoice.vendor else None,
+                         invoice.customer.company_name if invoice.customer else None],
+                        [(item.hsn_code, item.description) for item in invoice.line_items]
+                    )
+                
                 # Delete invoice from database (cascade will handle related records)
+                invoice_date_parsed, created_at = invoice.invoice_date_parsed, invoice.created_at
                 session.delete(invoice)
+                session.flush()
+                invoice_count_service.adjust_user_invoice_count(session, user_id, -1)
+                analytics_rollups.refresh_invoice(session, user_id, invoice_date_parsed, created_at)
+                result_cache.bump_version(session, user_id)
+                suggestions_since = suggestion_index.generation
                 session.commit()
+                invoice_count_service.invalidate_user(user_id)
+                result_cache.invalidate_user(user_id)
+                if suggestions is not None:
+                    suggestion_index.remove_invoice(user_id, suggestions, suggestions_since)
+                else:
+                    suggestion_index.invalidate(user_id)
                 
                 # Clean up associated file if it exists
                 if file_id:
                     try:
-                        file_path = Path("uploads") / file_id
-                        if file_path.exists():
-                            os.remove(file_path)
-                            logger.info(f"Deleted file: {file_path}")
+                        # Drops the user's reference; shared content is kept until unreferenced
+                        if FileService().delete_file(file_id, user_id):
+                            logger.info(f"Deleted file: {file_id}")
                     except Exception as file_error:
                         logger.warning(f"Failed to delete file {file_id}: {file_error}")
                         # Don't fail the whole operation if file cleanup fails
@@ -387,7 +694,7 @@ class DatabaseService:
                     "success": True,
                     "message": "Invoice deleted successfully"
                 }
-                
+        
         except Exception as e:
             logger.error(f"Error deleting invoice {invoice_id} for user {user_id}: {e}")
             return {
@@ -396,6 +703,7 @@ class DatabaseService:
                 "error": str(e)
             }
     
+    @cached_result("invoice_search")
     def search_invoices(
         self, 
         user_id: str, 
@@ -405,45 +713,40 @@ class DatabaseService:
         min_amount: float = None,
         max_amount: float = None,
         page: int = 1, 
-        limit: int = 10
+        limit: int = 10,
+        cursor: Optional[str] = None
     ) -> dict[str, Any]:
-        """Advanced search for user invoices with filters."""
+        """Advanced search for user invoices with filters (keyset-paginated when a cursor is given)."""
         try:
             with get_db_session() as session:
-                offset = (page - 1) * limit
-                
-                # Build base query
-                base_query = session.query(InvoiceModel).filter(
+                # Build base query (narrow projection, vendor/customer already joined)
+                base_query = self._invoice_summary_query(session).filter(
                     InvoiceModel.user_id == user_id
                 )
                 
                 # Apply filters
                 if query:
-                    # Search in invoice number, company names, and raw text
-                    search_filter = or_(
+                    # Search in invoice number, company names, and the stored full-text document
+                    conditions = [
                         InvoiceModel.invoice_number.ilike(f"%{query}%"),
-                        InvoiceModel.raw_text.ilike(f"%{query}%")
-                    )
-                    
-                    # Join with companies for name search
-                    base_query = base_query.outerjoin(
-                        CompanyModel, 
-                        or_(
-                            InvoiceModel.vendor_id == CompanyModel.id,
-                            InvoiceModel.customer_id == CompanyModel.id
-                        )
-                    ).filter(
-                        or_(
-                            search_filter,
-                            CompanyModel.company_name.ilike(f"%{query}%")
-                        )
-                    )
-                
+                        VENDOR.company_name.ilike(f"%{query}%"),
+                        CUSTOMER.company_name.ilike(f"%{query}%")
+                    ]
+                    ts_query = build_tsquery(query)
+                    if ts_query is not None:
+                        conditions.append(InvoiceModel.search_vector.op("@@")(ts_query))
+                    base_query = base_query.filter(or_(*conditions))
+                
+                # Range scan on idx_invoices_user_invoice_date
                 if date_from:
-                    base_query = base_query.filter(InvoiceModel.invoice_date >= date_from)
+                    base_query = base_query.filter(
+                        InvoiceModel.invoice_date_parsed >= self._parse_filter_date(date_from, "date_from")
+                    )
                 
                 if date_to:
-                    base_query = base_query.filter(InvoiceModel.invoice_date <= date_to)
+                    base_query = base_query.filter(
+                        InvoiceModel.invoice_date_parsed <= self._parse_filter_date(date_to, "date_to")
+                    )
                 
                 if min_amount is not None:
                     base_query = base_query.filter(InvoiceModel.net_amount >= min_amount)
@@ -451,16 +754,29 @@ class DatabaseService:
                 if max_amount is not None:
                     base_query = base_query.filter(InvoiceModel.net_amount <= max_amount)
                 
-                # Get total count
-                total = base_query.count()
-                
-                # Get results with eager loading
-                invoices = base_query.options(
-                    joinedload(InvoiceModel.vendor),
-                    joinedload(InvoiceModel.customer)
-                ).order_by(
-                    InvoiceModel.created_at.desc()
-                ).offset(offset).limit(limit).all()
+                # Get results; offset pages carry the filtered total as a window count
+                invoices, pagination = paginate(
+                    base_query,
+                    INVOICE_RECENCY_KEYS,
+                    limit,
+                    cursor=cursor,
+                    page=page,
+                    metric_name="invoice_search_page",
+                    window_total=True
+                )
+                pagination = invoice_count_service.complete_pagination(
+                    session,
+                    base_query,
+                    user_id,
+                    query_fingerprint("invoice_search", {
+                        "query": query,
+                        "date_from": date_from,
+                        "date_to": date_to,
+                        "min_amount": min_amount,
+                        "max_amount": max_amount
+                    }),
+                    pagination
+                )
                 
                 # Convert to dict format
                 invoice_list = []
@@ -472,8 +788,8 @@ class DatabaseService:
                         "net_amount": float(invoice.net_amount) if invoice.net_amount else None,
                         "total_amount": float(invoice.net_amount) if invoice.net_amount else None,
                         "currency": invoice.currency,
-                        "vendor_name": invoice.vendor.company_name if invoice.vendor else None,
-                        "customer_name": invoice.customer.company_name if invoice.customer else None,
+                        "vendor_name": invoice.vendor_name,
+                        "customer_name": invoice.customer_name,
                         "extraction_confidence": invoice.extraction_confidence,
                         "original_file_id": invoice.original_file_id,
                         "created_at": invoice.created_at.isoformat()
@@ -481,12 +797,7 @@ class DatabaseService:
                 
                 return {
                     "invoices": invoice_list,
-                    "pagination": {
-                        "page": page,
-                        "limit": limit,
-                        "total": total,
-                        "pages": (total + limit - 1) // limit
-                    },
+                    "pagination": pagination,
                     "filters": {
                         "query": query,
                         "date_from": date_from,
@@ -495,15 +806,26 @@ class DatabaseService:
                         "max_amount": max_amount
                     }
                 }
-                
+        
+        except ValidationException:
+            raise
         except Exception as e:
             logger.error(f"Error searching invoices for user {user_id}: {e}")
             return {
+                "success": False,
+                "error": str(e),
                 "invoices": [],
                 "pagination": {"page": page, "limit": limit, "total": 0, "pages": 0},
                 "filters": {}
             }
     
+    def _parse_filter_date(self, value: Any, field: str):
+        """Parse a date filter argument, rejecting values that are not dates."""
+        parsed = parse_invoice_date(value)
+        if parsed is None:
+            raise ValidationException(f"Invalid {field}", details={field: str(value)})
+        return parsed
+    
     def _serialize_date(self, date_value) -> Optional[str]:
         """Safely serialize date values to ISO format string."""
         if not date_value:
@@ -518,12 +840,13 @@ class DatabaseService:
             return date_value.isoformat()
         
         return None
-
+    
     def get_complete_invoice_details(self, invoice_id: str, user_id: str) -> Optional[dict]:
         """Get complete invoice details with all relationships."""
         try:
             with get_db_session() as session:
                 invoice = session.query(InvoiceModel).options(
+                    undefer(InvoiceModel.raw_text),
                     joinedload(InvoiceModel.vendor).joinedload(CompanyModel.addresses),
                     joinedload(InvoiceModel.customer).joinedload(CompanyModel.addresses),
                     selectinload(InvoiceModel.line_items),
@@ -619,7 +942,7 @@ class DatabaseService:
                         "total_tax": float(invoice.tax_calculation.total_tax) if invoice.tax_calculation and invoice.tax_calculation.total_tax else None
                     } if invoice.tax_calculation else None
                 }
-                
+        
         except Exception as e:
             logger.error(f"Error getting complete invoice details: {e}")
             return None
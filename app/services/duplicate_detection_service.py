@@ -0,0 +1,270 @@
+"""
+Duplicate Detection Service
+
+Flags near-duplicate invoice images (rescans, photos of the same paper
+invoice, re-exports) before they are sent for extraction. Each upload gets
+a 64-bit difference hash (dHash); lookups use a per-user BK-tree over
+Hamming distance, built lazily from the database and kept in an LRU.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple, Any
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.monitoring import app_metrics
+from app.core.storage import Buffer
+from app.models.database import FileReferenceModel, InvoiceModel
+
+logger = logging.getLogger(__name__)
+
+# dHash compares each pixel with its right neighbour on a 9x8 grayscale grid
+DHASH_WIDTH = 9
+DHASH_HEIGHT = 8
+
+HASH_BITS = 64
+SIGNED_OFFSET = 1 << HASH_BITS
+
+
+def compute_dhash(image_data: Buffer) -> int:
+    """
+    Compute a 64-bit difference hash of an image.
+    
+    JPEGs are decoded at reduced scale via draft mode, so hashing costs a
+    fraction of a full decode.
+    
+    Args:
+        image_data: Encoded image (bytes, memoryview or mmap)
+    
+    Returns:
+        Unsigned 64-bit hash
+    """
+    from PIL import Image
+    
+    source = image_data if hasattr(image_data, "seek") else BytesIO(image_data)
+    try:
+        with Image.open(source) as img:
+            img.draft("L", (DHASH_WIDTH * 8, DHASH_HEIGHT * 8))
+            pixels = list(
+                img.convert("L").resize((DHASH_WIDTH, DHASH_HEIGHT), Image.Resampling.LANCZOS).getdata()
+            )
+    finally:
+        if hasattr(image_data, "seek"):
+            image_data.seek(0)
+    
+    value = 0
+    for row in range(DHASH_HEIGHT):
+        offset = row * DHASH_WIDTH
+        for col in range(DHASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def to_signed(value: int) -> int:
+    """Convert an unsigned 64-bit hash for storage in a BIGINT column."""
+    return value - SIGNED_OFFSET if value >= SIGNED_OFFSET >> 1 else value
+
+
+def to_unsigned(value: int) -> int:
+    """Convert a stored BIGINT back to an unsigned 64-bit hash."""
+    return value + SIGNED_OFFSET if value < 0 else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance.
+    
+    Each node keeps children keyed by their distance to the node, so a
+    radius search only descends into children whose edge distance lies in
+    [d - radius, d + radius] (triangle inequality).
+    """
+    
+    def __init__(self):
+        # Node layout: [hash, items, {distance: child}]
+        self._root: Optional[list] = None
+        self.size = 0
+    
+    def add(self, value: int, item: Any):
+        """Add an item under a hash (items with equal hashes share a node)."""
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+    
+    def search(self, value: int, radius: int) -> List[Tuple[int, Any]]:
+        """
+        Find all items within radius of a hash.
+        
+        Returns:
+            List of (distance, item), closest first
+        """
+        if self._root is None:
+            return []
+        
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= radius:
+                results.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+class PerceptualHashIndex:
+    """Per-user BK-trees of upload hashes, loaded on first use and kept in an LRU."""
+    
+    def __init__(self, max_users: int = None):
+        self.max_users = max_users or get_settings().PHASH_INDEX_MAX_USERS
+        self._trees: "OrderedDict[str, BKTree]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _load_tree(self, user_id: str) -> BKTree:
+        """Build a user's tree from stored hashes."""
+        tree = BKTree()
+        with get_db_session() as session:
+            rows = session.query(
+                FileReferenceModel.perceptual_hash, FileReferenceModel.file_id
+            ).filter(
+                FileReferenceModel.user_id == user_id,
+                FileReferenceModel.perceptual_hash.isnot(None)
+            ).yield_per(10000)
+            
+            for perceptual_hash, file_id in rows:
+                tree.add(to_unsigned(perceptual_hash), file_id)
+        
+        logger.info(f"Loaded perceptual hash index for user {user_id} ({tree.size} hashes)")
+        return tree
+    
+    def _get_tree(self, user_id: str) -> BKTree:
+        with self._lock:
+            tree = self._trees.get(user_id)
+            if tree is not None:
+                self._trees.move_to_end(user_id)
+                return tree
+        
+        tree = self._load_tree(user_id)
+        
+        with self._lock:
+            # Another request may have loaded it meanwhile; keep the first one
+            tree = self._trees.setdefault(user_id, tree)
+            self._trees.move_to_end(user_id)
+            while len(self._trees) > self.max_users:
+                self._trees.popitem(last=False)
+        return tree
+    
+    def add(self, user_id: str, perceptual_hash: int, file_id: str):
+        """Add a new upload to a loaded tree (unloaded trees pick it up on load)."""
+        with self._lock:
+            tree = self._trees.get(user_id)
+            if tree is not None:
+                tree.add(perceptual_hash, file_id)
+    
+    def invalidate(self, user_id: str):
+        """Drop a user's tree after deletes; it is rebuilt on next lookup."""
+        with self._lock:
+            self._trees.pop(user_id, None)
+    
+    def search(self, user_id: str, perceptual_hash: int, radius: int) -> List[Tuple[int, str]]:
+        """Find file_ids of the user's uploads within radius of a hash."""
+        tree = self._get_tree(user_id)
+        with self._lock:
+            return tree.search(perceptual_hash, radius)
+
+
+# Global perceptual hash index
+perceptual_hash_index = PerceptualHashIndex()
+
+
+def find_near_duplicate_invoices(
+    user_id: str,
+    perceptual_hash: int,
+    exclude_file_id: str = None,
+    max_distance: int = None
+) -> List[Dict[str, Any]]:
+    """
+    Find saved invoices whose source image is a near-duplicate of a hash.
+    
+    Only uploads that ended up as an invoice count; a matching upload whose
+    extraction failed is not a reason to skip extraction.
+    
+    Args:
+        user_id: User ID
+        perceptual_hash: dHash of the new upload
+        exclude_file_id: The new upload's own file_id
+        max_distance: Maximum Hamming distance (defaults to NEAR_DUPLICATE_MAX_DISTANCE)
+    
+    Returns:
+        List of matches with file_id, invoice_id, invoice_number and distance
+    """
+    if max_distance is None:
+        max_distance = get_settings().NEAR_DUPLICATE_MAX_DISTANCE
+    
+    candidates = {
+        file_id: distance
+        for distance, file_id in perceptual_hash_index.search(user_id, perceptual_hash, max_distance)
+        if file_id != exclude_file_id
+    }
+    if not candidates:
+        app_metrics.metrics.increment_counter("near_duplicate_checks", tags={"result": "miss"})
+        return []
+    
+    with get_db_session() as session:
+        rows = session.query(
+            InvoiceModel.id, InvoiceModel.invoice_number, InvoiceModel.original_file_id
+        ).filter(
+            InvoiceModel.user_id == user_id,
+            InvoiceModel.original_file_id.in_(list(candidates))
+        ).all()
+    
+    matches = [
+        {
+            "file_id": original_file_id,
+            "invoice_id": str(invoice_id),
+            "invoice_number": invoice_number,
+            "distance": candidates[original_file_id]
+        }
+        for invoice_id, invoice_number, original_file_id in rows
+    ]
+    matches.sort(key=lambda match: match["distance"])
+    
+    app_metrics.metrics.increment_counter(
+        "near_duplicate_checks", tags={"result": "hit" if matches else "miss"}
+    )
+    return matches
+
+
+__all__ = [
+    "BKTree",
+    "PerceptualHashIndex",
+    "perceptual_hash_index",
+    "compute_dhash",
+    "find_near_duplicate_invoices",
+    "hamming_distance",
+    "to_signed",
+    "to_unsigned",
+]
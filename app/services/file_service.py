@@ -4,33 +4,82 @@ File Management Service
 Handles secure file upload, storage, and access with user isolation.
 """
 import os
+import asyncio
+import hashlib
 import logging
 import shutil
-from datetime import datetime
-from typing import Optional, Tuple, List
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Optional, Tuple, List, BinaryIO
 from pathlib import Path
 import uuid
 
 from fastapi import UploadFile
+from sqlalchemy import func, select, update, delete, case, exists, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.storage import get_storage_backend
+from app.core.exceptions import FileTooLargeException, UnsupportedFileTypeException
+from app.core.monitoring import app_metrics
+from app.models.database import (
+    FileBlobModel, FileReferenceModel, InvoiceModel, UserBlobModel, UserStorageStatsModel
+)
+from app.services.duplicate_detection_service import compute_dhash, perceptual_hash_index, to_signed
+from app.services.thumbnail_service import thumbnail_service
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Copy uploads in fixed-size chunks so a file is never held in memory whole
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Magic numbers for the formats we accept (offset, signature, MIME type)
+FILE_SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"%PDF-", "application/pdf"),
+]
+
+
+# Top-level directories under uploads/ that are not user directories
+RESERVED_UPLOAD_DIRS = {"blobs", "tmp", "thumbnails"}
+
+
+class FileSortField(str, Enum):
+    """Sort keys for file listings (each backed by an index)."""
+    CREATED_AT = "created_at"
+    SIZE = "size"
+    NAME = "name"
+
+
+def sniff_mime_type(header: bytes) -> Optional[str]:
+    """Detect MIME type from the leading bytes of a file."""
+    for offset, signature, mime_type in FILE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            if mime_type == "image/webp" and header[:4] != b"RIFF":
+                continue
+            return mime_type
+    return None
+
 
 class FileService:
     """Service for managing user file uploads with isolation."""
     
     def __init__(self):
-        """Initialize file service with upload directory."""
-        self.upload_base_dir = Path("uploads")
+        """Initialize file service with its storage backend and local staging directory."""
+        self.storage = get_storage_backend()
+        self.upload_base_dir = Path(get_settings().UPLOAD_DIR)
         self.upload_base_dir.mkdir(exist_ok=True)
-        
-    def _get_user_upload_dir(self, user_id: str) -> Path:
-        """Get user-specific upload directory."""
-        user_dir = self.upload_base_dir / user_id
-        user_dir.mkdir(exist_ok=True)
-        return user_dir
+        # Uploads are hashed in local scratch space before their key is known
+        self.temp_dir = self.upload_base_dir / "tmp"
+        self.temp_dir.mkdir(exist_ok=True)
     
     def _generate_secure_filename(self, original_filename: str) -> str:
         """Generate secure filename with timestamp and UUID."""
@@ -49,99 +98,392 @@ class FileService:
         
         return f"{timestamp}_{unique_id}_{clean_name}{file_ext}"
     
+    def _stream_to_disk(
+        self,
+        source: BinaryIO,
+        file_path: Path,
+        max_size: int,
+        file_name: str = None
+    ) -> Tuple[int, str, Optional[str]]:
+        """
+        Copy a file object to disk in fixed-size chunks.
+        
+        Size is enforced while copying, and the SHA-256 digest and sniffed
+        MIME type are computed in the same pass. Data is written to a
+        temporary ".part" file and renamed into place on success.
+        
+        Returns:
+            Tuple of (size, sha256_hex, sniffed_mime_type)
+        """
+        temp_path = file_path.with_name(file_path.name + ".part")
+        digest = hashlib.sha256()
+        size = 0
+        sniffed_type = None
+        
+        try:
+            with open(temp_path, "wb") as buffer:
+                while True:
+                    chunk = source.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    
+                    if size == 0:
+                        sniffed_type = sniff_mime_type(chunk[:16])
+                    
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeException(size, max_size, file_name)
+                    
+                    digest.update(chunk)
+                    buffer.write(chunk)
+            
+            os.replace(temp_path, file_path)
+            return size, digest.hexdigest(), sniffed_type
+            
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+    
     async def save_uploaded_file(
         self, 
         file: UploadFile, 
-        user_id: str
+        user_id: str,
+        max_size: int = None,
+        allowed_types: List[str] = None
     ) -> Tuple[str, dict]:
         """
-        Save uploaded file to user-specific directory.
+        Stream uploaded file into the content-addressed blob store.
+        
+        The copy runs in a worker thread so the event loop is never blocked
+        on disk I/O, and the upload is never read into memory whole. Content
+        that is already stored is not written again; the user only gets a
+        new reference to the existing blob.
         
         Args:
             file: Uploaded file object
             user_id: User UUID string
+            max_size: Maximum size in bytes (defaults to MAX_FILE_SIZE)
+            allowed_types: If given, the sniffed MIME type must be one of these
             
         Returns:
             Tuple of (file_id, file_info_dict)
+            
+        Raises:
+            FileTooLargeException: If the upload exceeds max_size
+            UnsupportedFileTypeException: If the content does not match allowed_types
         """
+        temp_path = self.temp_dir / f"{uuid.uuid4().hex}.upload"
+        
         try:
             # Validate file
             if not file.filename:
                 raise ValueError("No filename provided")
             
-            # Get user directory
-            user_dir = self._get_user_upload_dir(user_id)
+            max_size = max_size or get_settings().MAX_FILE_SIZE
             
-            # Generate secure filename
-            secure_filename = self._generate_secure_filename(file.filename)
-            file_path = user_dir / secure_filename
+            # Stream file to a temporary location off the event loop
+            await file.seek(0)
+            size, sha256, sniffed_type = await asyncio.to_thread(
+                self._stream_to_disk, file.file, temp_path, max_size, file.filename
+            )
             
-            # Save file
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
+            if allowed_types is not None and sniffed_type not in allowed_types:
+                raise UnsupportedFileTypeException(
+                    sniffed_type or file.content_type or "unknown", allowed_types, file.filename
+                )
             
-            # Generate file ID (relative path from uploads dir)
+            # Generate file ID (per-user reference, same format as before)
+            secure_filename = self._generate_secure_filename(file.filename)
             file_id = f"{user_id}/{secure_filename}"
+            content_type = sniffed_type or file.content_type
+            
+            perceptual_hash = None
+            if content_type and content_type.startswith("image/"):
+                perceptual_hash = await asyncio.to_thread(self._compute_perceptual_hash, temp_path)
+            
+            deduplicated = await asyncio.to_thread(
+                self._store_blob_reference,
+                temp_path, sha256, size, content_type, user_id, file_id, file.filename,
+                perceptual_hash=perceptual_hash
+            )
+            
+            if perceptual_hash is not None:
+                perceptual_hash_index.add(user_id, perceptual_hash, file_id)
             
             # Get file info
             file_info = {
                 "file_id": file_id,
                 "original_name": file.filename,
                 "secure_filename": secure_filename,
-                "file_path": str(file_path),
+                "storage_key": self.blob_key(sha256),
                 "relative_path": file_id,
-                "size": len(content),
-                "content_type": file.content_type,
+                "size": size,
+                "sha256": sha256,
+                "deduplicated": deduplicated,
+                "perceptual_hash": perceptual_hash,
+                "content_type": content_type,
+                "declared_content_type": file.content_type,
                 "created_at": datetime.now().isoformat()
             }
             
-            logger.info(f"File saved: {file_id} ({len(content)} bytes)")
+            # Prebuild thumbnails in the background
+            if content_type and content_type.startswith("image/"):
+                thumbnail_service.schedule(user_id, sha256, self.blob_key(sha256))
+            
+            logger.info(
+                f"File saved: {file_id} ({size} bytes, sha256={sha256[:12]}"
+                f"{', deduplicated' if deduplicated else ''})"
+            )
             return file_id, file_info
             
+        except (FileTooLargeException, UnsupportedFileTypeException) as e:
+            logger.warning(f"Rejected upload for user {user_id}: {e.message}")
+            raise
         except Exception as e:
             logger.error(f"Error saving file for user {user_id}: {e}")
             raise
+        finally:
+            temp_path.unlink(missing_ok=True)
     
-    def get_file_path(self, file_id: str, user_id: str) -> Optional[Path]:
+    def _store_blob_reference(
+        self,
+        temp_path: Path,
+        sha256: str,
+        size: int,
+        content_type: Optional[str],
+        user_id: str,
+        file_id: str,
+        original_name: str,
+        created_at: datetime = None,
+        perceptual_hash: Optional[int] = None
+    ) -> bool:
         """
-        Get file path if user has access to it.
+        Upsert the blob row, move new content into place and add a reference.
+        
+        The user's storage totals are updated in the same transaction.
         
-        Args:
-            file_id: File identifier (user_id/filename format)
-            user_id: Requesting user ID
-            
         Returns:
-            Path object if file exists and user has access, None otherwise
+            True if the content was already stored (deduplicated)
         """
+        blob_key = self.blob_key(sha256)
+        
+        with get_db_session() as session:
+            # Increment-or-create in a single statement; xmax = 0 only for fresh inserts
+            upsert = pg_insert(FileBlobModel).values(
+                sha256=sha256,
+                size=size,
+                content_type=content_type,
+                ref_count=1,
+                created_at=datetime.utcnow()
+            )
+            upsert = upsert.on_conflict_do_update(
+                index_elements=[FileBlobModel.sha256],
+                set_={
+                    "ref_count": FileBlobModel.ref_count + 1,
+                    "orphaned_at": None
+                }
+            ).returning(literal_column("xmax = 0").label("inserted"))
+            inserted = session.execute(upsert).scalar()
+            
+            # A fresh row always gets fresh content: content left by a blob that
+            # GC just removed is about to be deleted. The row lock taken by the
+            # upsert is held until commit, which GC waits for.
+            if inserted or not self.storage.exists(blob_key):
+                self.storage.put_file(blob_key, temp_path, content_type)
+            
+            # Physical usage only grows the first time this user stores the
+            # content. Counts missing from user_blobs (references that predate
+            # it) are seeded from the user's existing references.
+            user_blob = pg_insert(UserBlobModel).values(
+                user_id=user_id,
+                sha256=sha256,
+                ref_count=self._user_reference_count(user_id, sha256) + 1
+            ).on_conflict_do_update(
+                index_elements=[UserBlobModel.user_id, UserBlobModel.sha256],
+                set_={"ref_count": UserBlobModel.ref_count + 1}
+            ).returning(UserBlobModel.ref_count)
+            first_reference = session.execute(user_blob).scalar() == 1
+            
+            session.add(FileReferenceModel(
+                file_id=file_id,
+                user_id=user_id,
+                sha256=sha256,
+                original_name=original_name,
+                content_type=content_type,
+                size=size,
+                perceptual_hash=to_signed(perceptual_hash) if perceptual_hash is not None else None,
+                created_at=created_at or datetime.utcnow()
+            ))
+            self._adjust_user_stats(
+                session, user_id,
+                files=1, logical_bytes=size, physical_bytes=size if first_reference else 0
+            )
+            session.commit()
+        
+        return not inserted
+    
+    def _compute_perceptual_hash(self, file_path: Path) -> Optional[int]:
+        """Compute the image's dHash, or None if it cannot be decoded."""
         try:
-            # Parse file_id to extract user and filename
-            if "/" not in file_id:
-                return None
-            
-            file_user_id, filename = file_id.split("/", 1)
+            with open(file_path, "rb") as f:
+                return compute_dhash(f)
+        except Exception as e:
+            logger.warning(f"Could not compute perceptual hash for {file_path.name}: {e}")
+            return None
+    
+    def _adjust_user_stats(
+        self,
+        session,
+        user_id: str,
+        files: int,
+        logical_bytes: int,
+        physical_bytes: int
+    ):
+        """Apply deltas to the user's maintained storage totals."""
+        upsert = pg_insert(UserStorageStatsModel).values(
+            user_id=user_id,
+            file_count=files,
+            logical_bytes=logical_bytes,
+            physical_bytes=physical_bytes,
+            updated_at=datetime.utcnow()
+        )
+        session.execute(upsert.on_conflict_do_update(
+            index_elements=[UserStorageStatsModel.user_id],
+            set_={
+                "file_count": UserStorageStatsModel.file_count + files,
+                "logical_bytes": UserStorageStatsModel.logical_bytes + logical_bytes,
+                "physical_bytes": UserStorageStatsModel.physical_bytes + physical_bytes,
+                "updated_at": datetime.utcnow()
+            }
+        ))
+    
+    def _release_references(self, session, user_id: str, released: List[Tuple[str, int]]) -> List[str]:
+        """
+        Decrement blob reference counts for deleted references.
+        
+        Args:
+            session: Open database session (caller commits)
+            user_id: Owner of the deleted references
+            released: (sha256, size) for each deleted reference
             
-            # Check if user has access to this file
-            if file_user_id != user_id:
-                logger.warning(f"User {user_id} attempted to access file {file_id} (unauthorized)")
-                return None
+        Returns:
+            Hashes the user no longer references at all
+        """
+        released_counts = Counter(sha256 for sha256, _ in released)
+        sizes = {sha256: size for sha256, size in released}
+        
+        unreferenced = []
+        for sha256, count in released_counts.items():
+            session.execute(
+                update(FileBlobModel).where(
+                    FileBlobModel.sha256 == sha256
+                ).values(
+                    ref_count=FileBlobModel.ref_count - count,
+                    orphaned_at=case(
+                        (FileBlobModel.ref_count <= count, func.now()),
+                        else_=FileBlobModel.orphaned_at
+                    )
+                )
+            )
+            
+            # The caller's reference deletes are visible here, so a missing
+            # count is seeded with what remains
+            remaining = session.execute(
+                pg_insert(UserBlobModel).values(
+                    user_id=user_id,
+                    sha256=sha256,
+                    ref_count=self._user_reference_count(user_id, sha256)
+                ).on_conflict_do_update(
+                    index_elements=[UserBlobModel.user_id, UserBlobModel.sha256],
+                    set_={"ref_count": UserBlobModel.ref_count - count}
+                ).returning(UserBlobModel.ref_count)
+            ).scalar()
+            if remaining <= 0:
+                unreferenced.append(sha256)
+        
+        if unreferenced:
+            session.execute(
+                delete(UserBlobModel).where(
+                    UserBlobModel.user_id == user_id,
+                    UserBlobModel.sha256.in_(unreferenced),
+                    UserBlobModel.ref_count <= 0
+                )
+            )
+        
+        # BK-trees do not support removal; rebuild lazily on next lookup
+        perceptual_hash_index.invalidate(user_id)
+        
+        self._adjust_user_stats(
+            session, user_id,
+            files=-len(released),
+            logical_bytes=-sum(size for _, size in released),
+            physical_bytes=-sum(sizes[sha256] for sha256 in unreferenced)
+        )
+        return unreferenced
+    
+    @staticmethod
+    def _user_reference_count(user_id: str, sha256: str):
+        """Scalar subquery counting a user's references to a blob."""
+        return select(func.count()).where(
+            FileReferenceModel.user_id == user_id,
+            FileReferenceModel.sha256 == sha256
+        ).scalar_subquery()
+    
+    def blob_key(self, sha256: str) -> str:
+        """Get the storage key for a blob."""
+        return f"blobs/{sha256}"
+    
+    def _parse_file_id(self, file_id: str, user_id: str) -> bool:
+        """Check file_id format and that it belongs to the requesting user."""
+        if "/" not in file_id:
+            return False
+        
+        file_user_id, _ = file_id.split("/", 1)
+        
+        # Check if user has access to this file
+        if file_user_id != user_id:
+            logger.warning(f"User {user_id} attempted to access file {file_id} (unauthorized)")
+            return False
+        
+        return True
+    
+    def get_file_reference(self, file_id: str, user_id: str) -> Optional[dict]:
+        """
+        Get stored reference metadata (hash, size, type) for a user's file.
+        
+        Returns:
+            Reference dictionary, or None if not found or not owned by the user
+        """
+        if not self._parse_file_id(file_id, user_id):
+            return None
+        
+        with get_db_session() as session:
+            reference = session.query(FileReferenceModel).filter(
+                FileReferenceModel.file_id == file_id,
+                FileReferenceModel.user_id == user_id
+            ).first()
             
-            # Check if file exists
-            file_path = self.upload_base_dir / file_id
-            if not file_path.exists():
-                logger.warning(f"File not found: {file_id}")
+            if not reference:
                 return None
             
-            return file_path
-            
-        except Exception as e:
-            logger.error(f"Error getting file path {file_id} for user {user_id}: {e}")
-            return None
+            return {
+                "file_id": reference.file_id,
+                "sha256": reference.sha256,
+                "storage_key": self.blob_key(reference.sha256),
+                "size": reference.size,
+                "content_type": reference.content_type,
+                "original_name": reference.original_name,
+                "created_at": reference.created_at
+            }
     
     def delete_file(self, file_id: str, user_id: str) -> bool:
         """
         Delete file if user has access to it.
         
+        Removes the user's reference and decrements the blob's reference
+        count. Blob content is removed later by the garbage collector once
+        no references remain and the grace period has passed.
+        
         Args:
             file_id: File identifier
             user_id: Requesting user ID
@@ -150,57 +492,320 @@ class FileService:
             True if file was deleted, False otherwise
         """
         try:
-            file_path = self.get_file_path(file_id, user_id)
-            if not file_path:
+            if not self._parse_file_id(file_id, user_id):
                 return False
             
-            # Delete file
-            file_path.unlink()
-            logger.info(f"File deleted: {file_id}")
+            with get_db_session() as session:
+                released = session.execute(
+                    delete(FileReferenceModel).where(
+                        FileReferenceModel.file_id == file_id,
+                        FileReferenceModel.user_id == user_id
+                    ).returning(FileReferenceModel.sha256, FileReferenceModel.size)
+                ).all()
+                
+                if not released:
+                    logger.warning(f"File not found: {file_id}")
+                    return False
+                
+                unreferenced = self._release_references(session, user_id, released)
+                session.commit()
+            
+            for sha256 in unreferenced:
+                thumbnail_service.remove(user_id, sha256)
+            
+            logger.info(f"File reference deleted: {file_id}")
             return True
             
         except Exception as e:
             logger.error(f"Error deleting file {file_id} for user {user_id}: {e}")
             return False
     
-    def get_user_files(self, user_id: str) -> List[dict]:
+    def collect_garbage(self, grace_seconds: int = None, batch_size: int = 500) -> dict:
+        """
+        Remove blobs that have had no references for longer than the grace period.
+        
+        Rows are deleted (guarded on ref_count so a concurrent re-upload wins)
+        and their content is removed from the storage backend before the
+        transaction commits. A re-upload of the same content blocks on the
+        deleted rows' locks until then, so it inserts a fresh row and writes
+        the content again instead of relying on content GC is removing.
+        
+        Returns:
+            Dictionary with number of blobs and bytes reclaimed
+        """
+        grace_seconds = grace_seconds if grace_seconds is not None else get_settings().STORAGE_GC_GRACE_SECONDS
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        
+        with get_db_session() as session:
+            removed = session.execute(
+                delete(FileBlobModel).where(
+                    FileBlobModel.sha256.in_(
+                        select(FileBlobModel.sha256).where(
+                            FileBlobModel.ref_count <= 0,
+                            FileBlobModel.orphaned_at < cutoff
+                        ).limit(batch_size)
+                    ),
+                    FileBlobModel.ref_count <= 0
+                ).returning(FileBlobModel.sha256, FileBlobModel.size)
+            ).all()
+            
+            reclaimed_bytes = 0
+            for sha256, size in removed:
+                try:
+                    self.storage.delete(self.blob_key(sha256))
+                    reclaimed_bytes += size or 0
+                except Exception as e:
+                    # Leftover content is overwritten if the blob is uploaded again
+                    logger.warning(f"Failed to remove blob {sha256}: {e}")
+            session.commit()
+        
+        if removed:
+            logger.info(f"Storage GC removed {len(removed)} blobs ({reclaimed_bytes} bytes)")
+            app_metrics.metrics.increment_counter("storage_gc_blobs_removed", len(removed))
+            app_metrics.metrics.increment_counter("storage_gc_bytes_reclaimed", reclaimed_bytes)
+        
+        return {"blobs_removed": len(removed), "bytes_reclaimed": reclaimed_bytes}
+    
+    def reap_orphan_files(
+        self,
+        cursor: Optional[Tuple[datetime, uuid.UUID]] = None,
+        batch_size: int = None,
+        grace_seconds: int = None
+    ) -> dict:
         """
-        Get list of files for a user.
+        Delete one batch of catalog entries that no invoice references.
+        
+        Walks file_references in (created_at, id) order starting after the
+        cursor. An entry is an orphan when it is older than the grace period,
+        has no linked invoice and no invoice names it in original_file_id
+        (uploads whose parsing failed, or whose invoice was deleted).
+        Only catalog rows are deleted here; blobs left unreferenced are
+        removed, and their space freed, later by the garbage collector.
         
         Args:
-            user_id: User ID
+            cursor: (created_at, id) of the last entry scanned, None to start over
+            batch_size: Number of entries to scan
+            grace_seconds: Minimum age of an orphan
             
         Returns:
-            List of file info dictionaries
+            Dictionary with scanned/reaped counts, the logical size of the
+            reaped references and the next cursor (None once the sweep has
+            reached the end)
         """
-        try:
-            user_dir = self._get_user_upload_dir(user_id)
-            files = []
+        settings = get_settings()
+        batch_size = batch_size or settings.STORAGE_REAPER_BATCH_SIZE
+        grace_seconds = grace_seconds if grace_seconds is not None else settings.STORAGE_REAPER_GRACE_SECONDS
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        
+        with get_db_session() as session:
+            query = select(FileReferenceModel.created_at, FileReferenceModel.id).where(
+                FileReferenceModel.created_at < cutoff
+            )
+            if cursor:
+                query = query.where(
+                    tuple_(FileReferenceModel.created_at, FileReferenceModel.id) > tuple_(*cursor)
+                )
+            scanned = session.execute(
+                query.order_by(FileReferenceModel.created_at, FileReferenceModel.id).limit(batch_size)
+            ).all()
+            
+            if not scanned:
+                return {"scanned": 0, "reaped": 0, "logical_bytes_released": 0, "cursor": None}
+            
+            is_referenced = exists().where(
+                InvoiceModel.original_file_id == FileReferenceModel.file_id
+            )
+            released = session.execute(
+                delete(FileReferenceModel).where(
+                    FileReferenceModel.id.in_([row.id for row in scanned]),
+                    FileReferenceModel.invoice_id.is_(None),
+                    ~is_referenced
+                ).returning(
+                    FileReferenceModel.user_id,
+                    FileReferenceModel.sha256,
+                    FileReferenceModel.size
+                )
+            ).all()
+            
+            released_by_user = {}
+            for user_id, sha256, size in released:
+                released_by_user.setdefault(str(user_id), []).append((sha256, size))
+            
+            unreferenced = {
+                user_id: self._release_references(session, user_id, user_released)
+                for user_id, user_released in released_by_user.items()
+            }
+            session.commit()
+        
+        for user_id, hashes in unreferenced.items():
+            for sha256 in hashes:
+                thumbnail_service.remove(user_id, sha256)
+        
+        # Not space freed: shared blobs stay, and the GC frees the rest later
+        logical_bytes = sum(size for _, _, size in released)
+        if released:
+            logger.info(f"Reaped {len(released)} orphan files ({logical_bytes} logical bytes)")
+            app_metrics.metrics.increment_counter("storage_reaper_files_reaped", len(released))
+            app_metrics.metrics.increment_counter("storage_reaper_logical_bytes_released", logical_bytes)
+        
+        last = scanned[-1]
+        return {
+            "scanned": len(scanned),
+            "reaped": len(released),
+            "logical_bytes_released": logical_bytes,
+            "cursor": (last.created_at, last.id) if len(scanned) == batch_size else None
+        }
+    
+    def import_legacy_files(self) -> int:
+        """
+        Move files stored directly under uploads/<user_id>/ into the catalog.
+        
+        Each file is hashed into the storage backend and keeps its existing
+        file_id, so invoices that reference it are unaffected. This is the
+        only code that reads the pre-catalog local layout directly. Safe to
+        run repeatedly; imported files are removed from the legacy location.
+        
+        Returns:
+            Number of files imported
+        """
+        imported = 0
+        
+        for user_dir in self.upload_base_dir.iterdir():
+            if not user_dir.is_dir() or user_dir.name in RESERVED_UPLOAD_DIRS:
+                continue
+            
+            try:
+                user_id = str(uuid.UUID(user_dir.name))
+            except ValueError:
+                continue
             
             for file_path in user_dir.iterdir():
-                if file_path.is_file() and not file_path.name.startswith('.'):
+                if not file_path.is_file() or file_path.name.startswith('.'):
+                    continue
+                
+                file_id = f"{user_id}/{file_path.name}"
+                try:
+                    digest = hashlib.sha256()
+                    with open(file_path, "rb") as source:
+                        header = source.read(16)
+                        source.seek(0)
+                        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                            digest.update(chunk)
+                    
                     stat = file_path.stat()
-                    file_info = {
-                        "file_id": f"{user_id}/{file_path.name}",
-                        "filename": file_path.name,
-                        "size": stat.st_size,
-                        "created_at": datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat()
+                    self._store_blob_reference(
+                        file_path, digest.hexdigest(), stat.st_size, sniff_mime_type(header),
+                        user_id, file_id, file_path.name,
+                        created_at=datetime.utcfromtimestamp(stat.st_mtime),
+                        perceptual_hash=self._compute_perceptual_hash(file_path)
+                    )
+                    file_path.unlink(missing_ok=True)
+                    
+                    self._link_invoices(file_id)
+                    imported += 1
+                except Exception as e:
+                    logger.warning(f"Failed to import legacy file {file_id}: {e}")
+        
+        if imported:
+            logger.info(f"Imported {imported} legacy files into the file catalog")
+        return imported
+    
+    def _link_invoices(self, file_id: str):
+        """Set the linked invoice on a catalog entry from invoices.original_file_id."""
+        with get_db_session() as session:
+            invoice_id = select(InvoiceModel.id).where(
+                InvoiceModel.original_file_id == file_id
+            ).limit(1).scalar_subquery()
+            session.execute(
+                update(FileReferenceModel).where(
+                    FileReferenceModel.file_id == file_id
+                ).values(invoice_id=invoice_id)
+            )
+            session.commit()
+    
+    def get_user_files(
+        self,
+        user_id: str,
+        page: int = 1,
+        limit: int = 50,
+        sort_by: FileSortField = FileSortField.CREATED_AT,
+        sort_order: str = "desc"
+    ) -> dict:
+        """
+        Get a page of files for a user from the file catalog.
+        
+        Every sort key has a (user_id, key, id) index, so a page is an index
+        range scan regardless of how many files the user has.
+        
+        Args:
+            user_id: User ID
+            page: Page number (1-based)
+            limit: Files per page
+            sort_by: Sort key
+            sort_order: "asc" or "desc"
+            
+        Returns:
+            Dictionary with files and pagination info
+        """
+        try:
+            sort_column = {
+                FileSortField.CREATED_AT: FileReferenceModel.created_at,
+                FileSortField.SIZE: FileReferenceModel.size,
+                FileSortField.NAME: FileReferenceModel.original_name,
+            }[FileSortField(sort_by)]
+            
+            if sort_order == "asc":
+                order = [sort_column.asc(), FileReferenceModel.id.asc()]
+            else:
+                order = [sort_column.desc(), FileReferenceModel.id.desc()]
+            
+            with get_db_session() as session:
+                references = session.query(FileReferenceModel).filter(
+                    FileReferenceModel.user_id == user_id
+                ).order_by(*order).offset((page - 1) * limit).limit(limit).all()
+                
+                files = [
+                    {
+                        "file_id": reference.file_id,
+                        "filename": reference.file_id.split("/", 1)[1],
+                        "original_name": reference.original_name,
+                        "size": reference.size,
+                        "sha256": reference.sha256,
+                        "content_type": reference.content_type,
+                        "invoice_id": str(reference.invoice_id) if reference.invoice_id else None,
+                        "created_at": reference.created_at.isoformat(),
+                        "modified_at": reference.created_at.isoformat()
                     }
-                    files.append(file_info)
+                    for reference in references
+                ]
+            
+            total = self.get_user_storage_stats(user_id)["file_count"]
             
-            # Sort by creation time (newest first)
-            files.sort(key=lambda x: x["created_at"], reverse=True)
-            return files
+            return {
+                "files": files,
+                "pagination": {
+                    "page": page,
+                    "limit": limit,
+                    "total": total,
+                    "pages": (total + limit - 1) // limit
+                }
+            }
             
         except Exception as e:
             logger.error(f"Error getting files for user {user_id}: {e}")
-            return []
+            return {
+                "files": [],
+                "pagination": {"page": page, "limit": limit, "total": 0, "pages": 0}
+            }
     
     def get_user_storage_stats(self, user_id: str) -> dict:
         """
         Get storage statistics for a user.
         
+        Reads the maintained per-user totals. Logical bytes count every
+        reference the user holds; physical bytes count each distinct blob
+        once, which is what the user's files actually occupy on disk.
+        
         Args:
             user_id: User ID
             
@@ -208,21 +813,23 @@ class FileService:
             Dictionary with storage statistics
         """
         try:
-            user_dir = self._get_user_upload_dir(user_id)
-            
-            total_size = 0
-            file_count = 0
-            
-            for file_path in user_dir.iterdir():
-                if file_path.is_file() and not file_path.name.startswith('.'):
-                    total_size += file_path.stat().st_size
-                    file_count += 1
+            with get_db_session() as session:
+                stats = session.query(UserStorageStatsModel).filter(
+                    UserStorageStatsModel.user_id == user_id
+                ).first()
+                
+                file_count = stats.file_count if stats else 0
+                logical_size = stats.logical_bytes if stats else 0
+                physical_size = stats.physical_bytes if stats else 0
             
             return {
                 "file_count": file_count,
-                "total_size": total_size,
-                "total_size_mb": round(total_size / (1024 * 1024), 2),
-                "directory": str(user_dir)
+                "total_size": logical_size,
+                "total_size_mb": round(logical_size / (1024 * 1024), 2),
+                "logical_size": logical_size,
+                "physical_size": physical_size,
+                "deduplicated_size": logical_size - physical_size,
+                "backend": get_settings().STORAGE_BACKEND
             }
             
         except Exception as e:
@@ -231,13 +838,19 @@ class FileService:
                 "file_count": 0,
                 "total_size": 0,
                 "total_size_mb": 0.0,
-                "directory": ""
+                "logical_size": 0,
+                "physical_size": 0,
+                "deduplicated_size": 0,
+                "backend": get_settings().STORAGE_BACKEND
             }
     
     def cleanup_user_files(self, user_id: str, days_old: int = 30) -> int:
         """
         Clean up old files for a user.
         
+        Only files not linked to an invoice are removed. The delete is a
+        range scan on the (user_id, created_at) index.
+        
         Args:
             user_id: User ID
             days_old: Delete files older than this many days
@@ -246,66 +859,150 @@ class FileService:
             Number of files deleted
         """
         try:
-            user_dir = self._get_user_upload_dir(user_id)
-            deleted_count = 0
-            cutoff_time = datetime.now().timestamp() - (days_old * 24 * 60 * 60)
+            cutoff = datetime.utcnow() - timedelta(days=days_old)
+            
+            with get_db_session() as session:
+                released = session.execute(
+                    delete(FileReferenceModel).where(
+                        FileReferenceModel.user_id == user_id,
+                        FileReferenceModel.created_at < cutoff,
+                        FileReferenceModel.invoice_id.is_(None)
+                    ).returning(FileReferenceModel.sha256, FileReferenceModel.size)
+                ).all()
+                
+                if not released:
+                    return 0
+                
+                unreferenced = self._release_references(session, user_id, released)
+                session.commit()
             
-            for file_path in user_dir.iterdir():
-                if file_path.is_file() and not file_path.name.startswith('.'):
-                    if file_path.stat().st_mtime < cutoff_time:
-                        file_path.unlink()
-                        deleted_count += 1
-                        logger.info(f"Cleaned up old file: {file_path}")
+            for sha256 in unreferenced:
+                thumbnail_service.remove(user_id, sha256)
             
-            return deleted_count
+            logger.info(f"Cleaned up {len(released)} old files for user {user_id}")
+            return len(released)
             
         except Exception as e:
             logger.error(f"Error cleaning up files for user {user_id}: {e}")
             return 0
+
+
+class StorageGarbageCollector:
+    """Background task that periodically removes unreferenced blobs."""
     
-    def generate_thumbnail(self, file_path: Path, size: int = 150) -> Optional[Path]:
-        """
-        Generate a thumbnail for an image file.
+    def __init__(self, interval_seconds: int = None):
+        self.interval_seconds = interval_seconds or get_settings().STORAGE_GC_INTERVAL_SECONDS
+        self.batch_size = 500
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start background garbage collection."""
+        if self._running:
+            return
         
-        Args:
-            file_path: Path to the original image file
-            size: Thumbnail size in pixels (square)
-            
-        Returns:
-            Path to generated thumbnail or None if failed
-        """
+        self._running = True
+        logger.info("Starting storage garbage collector")
+        self._task = asyncio.create_task(self._collection_loop())
+    
+    def stop(self):
+        """Stop background garbage collection."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        logger.info("Stopping storage garbage collector")
+    
+    async def _collection_loop(self):
+        """Main collection loop."""
+        # Bring files from before the catalog into it once per start
         try:
-            from PIL import Image
-            import os
-            
-            # Create thumbnails directory
-            thumbnails_dir = self.upload_base_dir / "thumbnails"
-            thumbnails_dir.mkdir(exist_ok=True)
-            
-            # Generate thumbnail filename
-            file_stem = file_path.stem
-            thumbnail_name = f"{file_stem}_{size}.jpg"
-            thumbnail_path = thumbnails_dir / thumbnail_name
-            
-            # Check if thumbnail already exists
-            if thumbnail_path.exists():
-                return thumbnail_path
-            
-            # Open and resize image
-            with Image.open(file_path) as img:
-                # Convert to RGB if necessary
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Create thumbnail maintaining aspect ratio
-                img.thumbnail((size, size), Image.Resampling.LANCZOS)
-                
-                # Save thumbnail
-                img.save(thumbnail_path, "JPEG", quality=85)
-                
-            logger.info(f"Generated thumbnail: {thumbnail_path}")
-            return thumbnail_path
-            
+            await asyncio.to_thread(FileService().import_legacy_files)
         except Exception as e:
-            logger.error(f"Error generating thumbnail for {file_path}: {e}")
-            return None
\ No newline at end of file
+            logger.error(f"Error importing legacy files: {e}")
+        
+        while self._running:
+            try:
+                # Keep collecting while batches come back full, within the I/O budget
+                while self._running:
+                    started = time.monotonic()
+                    result = await asyncio.to_thread(FileService().collect_garbage, batch_size=self.batch_size)
+                    await throttle_io(result["bytes_reclaimed"], time.monotonic() - started)
+                    if result["blobs_removed"] < self.batch_size:
+                        break
+            except Exception as e:
+                logger.error(f"Error in storage garbage collector: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+class OrphanFileReaper:
+    """
+    Background task that deletes uploads no invoice references.
+    
+    Each pass scans one batch from a cursor and yields between batches.
+    Reaping only deletes catalog rows; the blob deletes it leads to are
+    budgeted by the garbage collector, which performs them.
+    """
+    
+    def __init__(self, interval_seconds: int = None):
+        self.interval_seconds = interval_seconds or get_settings().STORAGE_REAPER_INTERVAL_SECONDS
+        self.cursor: Optional[Tuple[datetime, uuid.UUID]] = None
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start background reaping."""
+        if self._running:
+            return
+        
+        self._running = True
+        logger.info("Starting orphan file reaper")
+        self._task = asyncio.create_task(self._reap_loop())
+    
+    def stop(self):
+        """Stop background reaping."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        logger.info("Stopping orphan file reaper")
+    
+    async def _reap_loop(self):
+        """Main reaping loop."""
+        while self._running:
+            try:
+                result = await asyncio.to_thread(FileService().reap_orphan_files, self.cursor)
+                self.cursor = result["cursor"]
+            except Exception as e:
+                logger.error(f"Error in orphan file reaper: {e}")
+                self.cursor = None
+                await asyncio.sleep(self.interval_seconds)
+                continue
+            
+            # Sweep finished; wait before starting over
+            if self.cursor is None:
+                await asyncio.sleep(self.interval_seconds)
+
+
+async def throttle_io(bytes_processed: int, elapsed_seconds: float):
+    """Sleep long enough to keep background storage I/O within its budget."""
+    budget = get_settings().STORAGE_IO_BUDGET_BYTES_PER_SECOND
+    delay = bytes_processed / budget - elapsed_seconds if budget > 0 else 0
+    # Always yield, so a long sweep never monopolises the event loop
+    await asyncio.sleep(max(delay, 0))
+
+
+# Global background storage maintenance instances
+storage_gc = StorageGarbageCollector()
+orphan_file_reaper = OrphanFileReaper()
+
+
+__all__ = [
+    "FileService",
+    "FileSortField",
+    "StorageGarbageCollector",
+    "OrphanFileReaper",
+    "storage_gc",
+    "orphan_file_reaper",
+    "sniff_mime_type",
+]
@@ -0,0 +1,168 @@
+"""
+Invoice Date Service
+
+Backfills the parsed invoice_date_parsed / due_date_parsed columns for
+invoices saved before they existed. New invoices get both at save time;
+this job walks older rows in id order, one batch per transaction, so the
+backfill never holds long locks on the invoices table.
+"""
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, or_, select, update
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.monitoring import app_metrics
+from app.core.validation import parse_invoice_date
+from app.models.database import InvoiceModel
+from app.services.analytics_rollup_service import analytics_rollups
+from app.services.count_service import invoice_count_service
+from app.services.result_cache_service import result_cache
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_invoice_dates(batch_size: int = None, after: Optional[uuid.UUID] = None) -> Dict[str, Any]:
+    """
+    Parse the stored date strings of one batch of invoices.
+    
+    Rows whose strings do not parse keep NULL dates; the cursor moves past
+    them, so a run visits every row once.
+    
+    Args:
+        batch_size: Invoices examined per call
+        after: Invoice id to resume after (cursor from the previous call)
+    
+    Returns:
+        Dictionary with counts and the cursor for the next call (None when done)
+    """
+    batch_size = batch_size or get_settings().INVOICE_DATE_BACKFILL_BATCH_SIZE
+    result = {"examined": 0, "updated": 0, "unparseable": 0, "cursor": None}
+    
+    with get_db_session() as session:
+        query = select(
+            InvoiceModel.id,
+            InvoiceModel.user_id,
+            InvoiceModel.created_at,
+            InvoiceModel.invoice_date,
+            InvoiceModel.due_date,
+            InvoiceModel.invoice_date_parsed,
+            InvoiceModel.due_date_parsed
+        ).where(
+            or_(
+                and_(InvoiceModel.invoice_date_parsed.is_(None), InvoiceModel.invoice_date.isnot(None)),
+                and_(InvoiceModel.due_date_parsed.is_(None), InvoiceModel.due_date.isnot(None))
+            )
+        )
+        if after:
+            query = query.where(InvoiceModel.id > after)
+        rows = session.execute(query.order_by(InvoiceModel.id).limit(batch_size)).all()
+        
+        updates = []
+        updated_users = set()
+        rollup_days = defaultdict(set)
+        for invoice_id, user_id, created_at, invoice_date, due_date, invoice_date_parsed, due_date_parsed in rows:
+            values = {}
+            if invoice_date_parsed is None and invoice_date:
+                values["invoice_date_parsed"] = parse_invoice_date(invoice_date)
+                # The invoice moves from its processing day to its invoice day
+                if values["invoice_date_parsed"] and created_at:
+                    rollup_days[user_id].update((created_at.date(), values["invoice_date_parsed"]))
+            if due_date_parsed is None and due_date:
+                values["due_date_parsed"] = parse_invoice_date(due_date)
+            
+            if any(value is None for value in values.values()):
+                result["unparseable"] += 1
+            values = {key: value for key, value in values.items() if value is not None}
+            if values:
+                updates.append({"id": invoice_id, **values})
+                updated_users.add(user_id)
+        
+        if updates:
+            # Rows differ in which columns they set; group them so each executemany is uniform
+            for columns in {tuple(sorted(row)) for row in updates}:
+                session.execute(update(InvoiceModel), [row for row in updates if tuple(sorted(row)) == columns])
+            for user_id in sorted(rollup_days):
+                analytics_rollups.refresh(session, user_id, rollup_days[user_id])
+            # Dashboards, insights and date-filtered listings change with the new dates
+            for user_id in sorted(updated_users):
+                result_cache.bump_version(session, user_id)
+            session.commit()
+            for user_id in updated_users:
+                invoice_count_service.invalidate_user(user_id)
+                result_cache.invalidate_user(user_id)
+    
+    result["examined"] = len(rows)
+    result["updated"] = len(updates)
+    if len(rows) == batch_size:
+        result["cursor"] = rows[-1][0]
+    
+    app_metrics.metrics.increment_counter("invoice_date_backfill_rows", value=result["updated"], tags={"result": "updated"})
+    app_metrics.metrics.increment_counter("invoice_date_backfill_rows", value=result["unparseable"], tags={"result": "unparseable"})
+    return result
+
+
+class InvoiceDateBackfillJob:
+    """Background task that backfills parsed invoice dates once at startup."""
+    
+    def __init__(self):
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start the backfill."""
+        if self._running:
+            return
+        
+        self._running = True
+        logger.info("Starting invoice date backfill")
+        self._task = asyncio.create_task(self._backfill())
+    
+    def stop(self):
+        """Stop the backfill (a later start resumes from the first unparsed row)."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        logger.info("Stopping invoice date backfill")
+    
+    async def run_once(self) -> Dict[str, int]:
+        """Backfill every invoice, one batch per transaction."""
+        totals = {"examined": 0, "updated": 0, "unparseable": 0}
+        cursor = None
+        while self._running:
+            result = await asyncio.to_thread(backfill_invoice_dates, after=cursor)
+            for key in totals:
+                totals[key] += result[key]
+            cursor = result["cursor"]
+            if cursor is None:
+                break
+        return totals
+    
+    async def _backfill(self):
+        try:
+            totals = await self.run_once()
+            if totals["examined"]:
+                logger.info(
+                    f"Invoice date backfill complete: {totals['updated']} updated, "
+                    f"{totals['unparseable']} with unparseable dates"
+                )
+        except Exception as e:
+            logger.error(f"Error in invoice date backfill: {e}")
+        finally:
+            self._running = False
+
+
+# Global invoice date backfill job
+invoice_date_backfill_job = InvoiceDateBackfillJob()
+
+
+__all__ = [
+    "InvoiceDateBackfillJob",
+    "backfill_invoice_dates",
+    "invoice_date_backfill_job",
+]
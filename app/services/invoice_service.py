@@ -10,6 +10,7 @@ from typing import Tuple
 
 from app.core.ai_processor import AIProcessor
 from app.core.logging_config import performance_monitor
+from app.core.storage import Buffer
 from app.core.websocket_manager import notify_invoice_processing, notify_invoice_completed, notify_invoice_failed
 from app.services.database_service import DatabaseService
 from app.models.schemas import InvoiceDataSchema, ParseResponseSchema, SaveResponseSchema
@@ -29,7 +30,7 @@ class InvoiceService:
     @performance_monitor("ai_processing", "invoice_extraction")
     async def process_invoice(
         self, 
-        file_data: bytes, 
+        file_data: Buffer, 
         content_type: str, 
         filename: str = "invoice",
         user_id: str = None
@@ -38,7 +39,7 @@ class InvoiceService:
         Process an invoice image through the complete AI extraction pipeline.
         
         Args:
-            file_data: Raw image file bytes
+            file_data: Raw image file bytes or a memory-mapped stored file
             content_type: MIME type of the image
             filename: Original filename (for logging)
             
@@ -155,7 +156,7 @@ class InvoiceService:
     
     async def process_and_save_invoice(
         self, 
-        file_data: bytes, 
+        file_data: Buffer, 
         content_type: str, 
         filename: str = "invoice",
         auto_save: bool = False,
@@ -167,7 +168,7 @@ class InvoiceService:
         Complete invoice processing pipeline: extract and optionally save.
         
         Args:
-            file_data: Raw image file bytes
+            file_data: Raw image file bytes or a memory-mapped stored file
             content_type: MIME type of the image
             filename: Original filename
             auto_save: Whether to automatically save to database
@@ -221,7 +222,7 @@ class InvoiceService:
                 }
             }
     
-    def validate_file(self, file_data: bytes, content_type: str, max_size: int = 10 * 1024 * 1024) -> Tuple[bool, str]:
+    def validate_file(self, file_data: Buffer, content_type: str, max_size: int = 10 * 1024 * 1024) -> Tuple[bool, str]:
         """
         Validate uploaded file for processing.
         
@@ -0,0 +1,466 @@
+"""
+Invoice Validation Service
+
+Runs arithmetic and GST consistency checks over a user's stored invoices
+as set-based SQL statements and persists the results as findings.
+"""
+import logging
+from enum import Enum
+from typing import Dict, List, Optional, Any
+
+from sqlalchemy import (
+    func, and_, or_, select, insert, delete, literal, cast, null, values, column,
+    String, DECIMAL, case
+)
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.logging_config import performance_monitor
+from app.models.database import (
+    InvoiceModel, CompanyModel, LineItemModel, TaxCalculationModel,
+    InvoiceValidationFindingModel
+)
+
+logger = logging.getLogger(__name__)
+
+# GSTIN characters in checksum order (0-9 then A-Z)
+GSTIN_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# State/UT codes issued by GSTN (97: other territory, 99: centre jurisdiction)
+VALID_GST_STATE_CODES = {f"{code:02d}" for code in range(1, 39)} | {"97", "99"}
+
+
+class ValidationCheck(str, Enum):
+    """Checks performed by the bulk validation pass."""
+    LINE_AMOUNT = "line_amount"
+    LINE_TOTAL = "line_total"
+    GST_SPLIT = "gst_split"
+    TAX_TOTAL = "tax_total"
+    GSTIN = "gstin"
+    DUPLICATE_NUMBER = "duplicate_number"
+
+
+def gstin_error(gstin: str) -> Optional[str]:
+    """Return the reason a GSTIN is invalid, or None if it is valid."""
+    value = (gstin or "").strip().upper()
+
+    if len(value) != 15 or any(c not in GSTIN_CHARSET for c in value):
+        return "GSTIN must be 15 alphanumeric characters"
+
+    if value[:2] not in VALID_GST_STATE_CODES:
+        return f"Unknown GST state code {value[:2]}"
+
+    # Luhn mod-36 over the first 14 characters, doubling every second one
+    total = 0
+    for index, char in enumerate(value[:14]):
+        product = GSTIN_CHARSET.index(char) * (2 if index % 2 else 1)
+        total += product // 36 + product % 36
+    check_char = GSTIN_CHARSET[(36 - total % 36) % 36]
+
+    if value[14] != check_char:
+        return f"GSTIN checksum mismatch (expected {check_char})"
+
+    return None
+
+
+class InvoiceValidationService:
+    """Service for set-based invoice validation and findings storage."""
+
+    def __init__(self, amount_tolerance: float = None):
+        """Initialize validation service with the rounding tolerance for amount checks."""
+        settings = get_settings()
+        self.amount_tolerance = (
+            amount_tolerance if amount_tolerance is not None
+            else settings.VALIDATION_AMOUNT_TOLERANCE
+        )
+
+    @performance_monitor("validation", "validate_user_invoices")
+    def validate_user_invoices(
+        self,
+        user_id: str,
+        checks: List[ValidationCheck] = None,
+        operation_id: str = None
+    ) -> Dict[str, Any]:
+        """
+        Run the requested checks over all of a user's invoices.
+
+        Args:
+            user_id: User ID for scoping data
+            checks: Checks to run (all checks when omitted)
+            operation_id: Bulk operation ID to tag findings with
+
+        Returns:
+            Dictionary with finding counts per check
+        """
+        checks = checks or list(ValidationCheck)
+        counts = {}
+        for check in checks:
+            counts[check.value] = self.run_check(user_id, check, operation_id)
+
+        return {
+            "success": True,
+            "findings": counts,
+            "total_findings": sum(counts.values())
+        }
+
+    def run_check(self, user_id: str, check: ValidationCheck, operation_id: str = None) -> int:
+        """
+        Run a single check and replace its previous findings for the user.
+
+        Each check is one transaction: stale findings are deleted and the new
+        ones are produced by INSERT ... SELECT without leaving the database.
+
+        Returns:
+            Number of findings written
+        """
+        check = ValidationCheck(check)
+        runners = {
+            ValidationCheck.LINE_AMOUNT: self._check_line_amounts,
+            ValidationCheck.LINE_TOTAL: self._check_line_totals,
+            ValidationCheck.GST_SPLIT: self._check_gst_split,
+            ValidationCheck.TAX_TOTAL: self._check_tax_totals,
+            ValidationCheck.GSTIN: self._check_gstins,
+            ValidationCheck.DUPLICATE_NUMBER: self._check_duplicate_numbers,
+        }
+
+        with get_db_session() as session:
+            session.execute(
+                delete(InvoiceValidationFindingModel).where(
+                    InvoiceValidationFindingModel.user_id == user_id,
+                    InvoiceValidationFindingModel.check_type == check.value
+                )
+            )
+            written = runners[check](session, user_id, operation_id)
+            session.commit()
+
+        logger.info(f"Validation check {check.value} for user {user_id}: {written} findings")
+        return written
+
+    def _insert_findings(self, session: Session, finding_select) -> int:
+        """Insert findings produced by a SELECT with the standard finding columns."""
+        finding_columns = [
+            "id", "user_id", "invoice_id", "line_item_id", "check_type", "severity",
+            "message", "expected_value", "actual_value", "operation_id", "created_at"
+        ]
+        result = session.execute(
+            insert(InvoiceValidationFindingModel).from_select(finding_columns, finding_select)
+        )
+        return result.rowcount or 0
+
+    def _finding_columns(
+        self,
+        check: ValidationCheck,
+        message,
+        user_id_col,
+        invoice_id_col,
+        operation_id: str = None,
+        line_item_id_col=None,
+        expected=None,
+        actual=None,
+        severity: str = "error"
+    ) -> list:
+        """Build the SELECT list for a finding row with properly typed NULLs."""
+        return [
+            func.gen_random_uuid(),
+            user_id_col,
+            invoice_id_col,
+            line_item_id_col if line_item_id_col is not None else cast(null(), UUID(as_uuid=True)),
+            literal(check.value, String),
+            literal(severity, String),
+            message if not isinstance(message, str) else literal(message, String),
+            expected if expected is not None else cast(null(), DECIMAL(15, 2)),
+            actual if actual is not None else cast(null(), DECIMAL(15, 2)),
+            literal(operation_id, String) if operation_id else cast(null(), String),
+            func.now()
+        ]
+
+    def _check_line_amounts(self, session: Session, user_id: str, operation_id: str) -> int:
+        """Line item amount must equal quantity x rate."""
+        expected = func.round(LineItemModel.quantity * LineItemModel.rate, 2)
+
+        finding_select = select(*self._finding_columns(
+            ValidationCheck.LINE_AMOUNT,
+            "Line item amount does not equal quantity x rate",
+            InvoiceModel.user_id,
+            LineItemModel.invoice_id,
+            operation_id,
+            line_item_id_col=LineItemModel.id,
+            expected=expected,
+            actual=LineItemModel.amount
+        )).join_from(
+            LineItemModel, InvoiceModel, LineItemModel.invoice_id == InvoiceModel.id
+        ).where(
+            InvoiceModel.user_id == user_id,
+            LineItemModel.quantity.isnot(None),
+            LineItemModel.rate.isnot(None),
+            LineItemModel.amount.isnot(None),
+            func.abs(expected - LineItemModel.amount) > self.amount_tolerance
+        )
+
+        return self._insert_findings(session, finding_select)
+
+    def _check_line_totals(self, session: Session, user_id: str, operation_id: str) -> int:
+        """Sum of line item amounts must equal the taxable amount."""
+        line_totals = select(
+            LineItemModel.invoice_id.label("invoice_id"),
+            func.sum(LineItemModel.amount).label("line_total")
+        ).join_from(
+            LineItemModel, InvoiceModel, LineItemModel.invoice_id == InvoiceModel.id
+        ).where(
+            InvoiceModel.user_id == user_id,
+            LineItemModel.amount.isnot(None)
+        ).group_by(LineItemModel.invoice_id).subquery("line_totals")
+
+        finding_select = select(*self._finding_columns(
+            ValidationCheck.LINE_TOTAL,
+            "Line items do not sum to the taxable amount",
+            InvoiceModel.user_id,
+            InvoiceModel.id,
+            operation_id,
+            expected=TaxCalculationModel.taxable_amount,
+            actual=line_totals.c.line_total
+        )).select_from(InvoiceModel).join(
+            TaxCalculationModel, TaxCalculationModel.invoice_id == InvoiceModel.id
+        ).join(
+            line_totals, line_totals.c.invoice_id == InvoiceModel.id
+        ).where(
+            InvoiceModel.user_id == user_id,
+            TaxCalculationModel.taxable_amount.isnot(None),
+            func.abs(line_totals.c.line_total - TaxCalculationModel.taxable_amount) > self.amount_tolerance
+        )
+
+        return self._insert_findings(session, finding_select)
+
+    def _check_gst_split(self, session: Session, user_id: str, operation_id: str) -> int:
+        """CGST/SGST and IGST must not be mixed and must match the place of supply."""
+        vendor = aliased(CompanyModel)
+        customer = aliased(CompanyModel)
+
+        cgst = func.coalesce(TaxCalculationModel.cgst_amount, 0)
+        sgst = func.coalesce(TaxCalculationModel.sgst_amount, 0)
+        igst = func.coalesce(TaxCalculationModel.igst_amount, 0)
+
+        has_split = or_(cgst > 0, sgst > 0)
+        has_igst = igst > 0
+        both_states_known = and_(
+            func.length(vendor.gstin) >= 2,
+            func.length(customer.gstin) >= 2
+        )
+        same_state = func.substr(vendor.gstin, 1, 2) == func.substr(customer.gstin, 1, 2)
+
+        mixed = and_(has_split, has_igst)
+        unequal_halves = func.abs(cgst - sgst) > self.amount_tolerance
+        igst_intra_state = and_(has_igst, both_states_known, same_state)
+        split_inter_state = and_(has_split, both_states_known, ~same_state)
+
+        message = case(
+            (mixed, "Invoice charges both CGST/SGST and IGST"),
+            (unequal_halves, "CGST and SGST amounts differ"),
+            (igst_intra_state, "IGST charged on an intra-state supply"),
+            else_="CGST/SGST charged on an inter-state supply"
+        )
+
+        finding_select = select(*self._finding_columns(
+            ValidationCheck.GST_SPLIT,
+            message,
+            InvoiceModel.user_id,
+            InvoiceModel.id,
+            operation_id,
+            expected=cgst,
+            actual=sgst
+        )).select_from(InvoiceModel).join(
+            TaxCalculationModel, TaxCalculationModel.invoice_id == InvoiceModel.id
+        ).outerjoin(
+            vendor, InvoiceModel.vendor_id == vendor.id
+        ).outerjoin(
+            customer, InvoiceModel.customer_id == customer.id
+        ).where(
+            InvoiceModel.user_id == user_id,
+            or_(mixed, unequal_halves, igst_intra_state, split_inter_state)
+        )
+
+        return self._insert_findings(session, finding_select)
+
+    def _check_tax_totals(self, session: Session, user_id: str, operation_id: str) -> int:
+        """CGST + SGST + IGST must equal the total tax."""
+        component_sum = (
+            func.coalesce(TaxCalculationModel.cgst_amount, 0)
+            + func.coalesce(TaxCalculationModel.sgst_amount, 0)
+            + func.coalesce(TaxCalculationModel.igst_amount, 0)
+        )
+
+        finding_select = select(*self._finding_columns(
+            ValidationCheck.TAX_TOTAL,
+            "Tax components do not sum to the total tax",
+            InvoiceModel.user_id,
+            InvoiceModel.id,
+            operation_id,
+            expected=TaxCalculationModel.total_tax,
+            actual=component_sum
+        )).select_from(InvoiceModel).join(
+            TaxCalculationModel, TaxCalculationModel.invoice_id == InvoiceModel.id
+        ).where(
+            InvoiceModel.user_id == user_id,
+            TaxCalculationModel.total_tax.isnot(None),
+            func.abs(component_sum - TaxCalculationModel.total_tax) > self.amount_tolerance
+        )
+
+        return self._insert_findings(session, finding_select)
+
+    def _check_gstins(self, session: Session, user_id: str, operation_id: str) -> int:
+        """Vendor and customer GSTINs must have a valid state code and checksum."""
+        # The distinct GSTIN set per user is small; validate it once, not per invoice
+        party_gstins = select(CompanyModel.gstin).join(
+            InvoiceModel,
+            or_(InvoiceModel.vendor_id == CompanyModel.id, InvoiceModel.customer_id == CompanyModel.id)
+        ).where(
+            InvoiceModel.user_id == user_id,
+            CompanyModel.gstin.isnot(None),
+            CompanyModel.gstin != ""
+        ).distinct()
+
+        invalid = []
+        for (gstin,) in session.execute(party_gstins):
+            reason = gstin_error(gstin)
+            if reason:
+                invalid.append((gstin, reason))
+
+        if not invalid:
+            return 0
+
+        bad_gstins = values(
+            column("gstin", String), column("reason", String), name="bad_gstins"
+        ).data(invalid)
+
+        written = 0
+        for party, fk_column in (("Vendor", InvoiceModel.vendor_id), ("Customer", InvoiceModel.customer_id)):
+            finding_select = select(*self._finding_columns(
+                ValidationCheck.GSTIN,
+                literal(f"{party} ", String) + bad_gstins.c.reason + literal(": ", String) + bad_gstins.c.gstin,
+                InvoiceModel.user_id,
+                InvoiceModel.id,
+                operation_id
+            )).select_from(InvoiceModel).join(
+                CompanyModel, fk_column == CompanyModel.id
+            ).join(
+                bad_gstins, bad_gstins.c.gstin == CompanyModel.gstin
+            ).where(InvoiceModel.user_id == user_id)
+
+            written += self._insert_findings(session, finding_select)
+
+        return written
+
+    def _check_duplicate_numbers(self, session: Session, user_id: str, operation_id: str) -> int:
+        """Invoice numbers must be unique per vendor after normalization."""
+        normalized = func.regexp_replace(func.upper(InvoiceModel.invoice_number), "[^A-Z0-9]", "", "g")
+
+        numbered = select(
+            InvoiceModel.id.label("invoice_id"),
+            InvoiceModel.user_id.label("user_id"),
+            func.count().over(partition_by=(InvoiceModel.vendor_id, normalized)).label("occurrences")
+        ).where(
+            InvoiceModel.user_id == user_id,
+            InvoiceModel.vendor_id.isnot(None),
+            InvoiceModel.invoice_number.isnot(None)
+        ).subquery("numbered")
+
+        finding_select = select(*self._finding_columns(
+            ValidationCheck.DUPLICATE_NUMBER,
+            "Invoice number appears more than once for this vendor",
+            numbered.c.user_id,
+            numbered.c.invoice_id,
+            operation_id,
+            severity="warning"
+        )).where(numbered.c.occurrences > 1)
+
+        return self._insert_findings(session, finding_select)
+
+    def get_findings(
+        self,
+        user_id: str,
+        check_type: Optional[ValidationCheck] = None,
+        invoice_id: str = None,
+        page: int = 1,
+        limit: int = 50
+    ) -> Dict[str, Any]:
+        """Get stored findings for a user with optional check/invoice filters."""
+        try:
+            with get_db_session() as session:
+                query = session.query(
+                    InvoiceValidationFindingModel,
+                    InvoiceModel.invoice_number
+                ).join(
+                    InvoiceModel, InvoiceValidationFindingModel.invoice_id == InvoiceModel.id
+                ).filter(InvoiceValidationFindingModel.user_id == user_id)
+
+                if check_type:
+                    query = query.filter(InvoiceValidationFindingModel.check_type == ValidationCheck(check_type).value)
+                if invoice_id:
+                    query = query.filter(InvoiceValidationFindingModel.invoice_id == invoice_id)
+
+                total = query.count()
+                rows = query.order_by(
+                    InvoiceValidationFindingModel.created_at.desc()
+                ).offset((page - 1) * limit).limit(limit).all()
+
+                return {
+                    "findings": [
+                        {
+                            "id": str(finding.id),
+                            "invoice_id": str(finding.invoice_id),
+                            "invoice_number": invoice_number,
+                            "line_item_id": str(finding.line_item_id) if finding.line_item_id else None,
+                            "check_type": finding.check_type,
+                            "severity": finding.severity,
+                            "message": finding.message,
+                            "expected_value": float(finding.expected_value) if finding.expected_value is not None else None,
+                            "actual_value": float(finding.actual_value) if finding.actual_value is not None else None,
+                            "operation_id": finding.operation_id,
+                            "created_at": finding.created_at.isoformat() if finding.created_at else None
+                        }
+                        for finding, invoice_number in rows
+                    ],
+                    "pagination": {
+                        "page": page,
+                        "limit": limit,
+                        "total": total,
+                        "pages": (total + limit - 1) // limit
+                    }
+                }
+
+        except Exception as e:
+            logger.error(f"Error getting validation findings for user {user_id}: {e}")
+            return {
+                "findings": [],
+                "pagination": {"page": page, "limit": limit, "total": 0, "pages": 0}
+            }
+
+    def get_findings_summary(self, user_id: str) -> Dict[str, Any]:
+        """Get finding counts per check and the number of affected invoices."""
+        try:
+            with get_db_session() as session:
+                rows = session.query(
+                    InvoiceValidationFindingModel.check_type,
+                    func.count(InvoiceValidationFindingModel.id).label("findings"),
+                    func.count(func.distinct(InvoiceValidationFindingModel.invoice_id)).label("invoices")
+                ).filter(
+                    InvoiceValidationFindingModel.user_id == user_id
+                ).group_by(InvoiceValidationFindingModel.check_type).all()
+
+                return {
+                    "by_check": {
+                        row.check_type: {"findings": row.findings, "invoices": row.invoices}
+                        for row in rows
+                    },
+                    "total_findings": sum(row.findings for row in rows)
+                }
+
+        except Exception as e:
+            logger.error(f"Error getting validation summary for user {user_id}: {e}")
+            return {"by_check": {}, "total_findings": 0}
+
+
+# Export validation service
+__all__ = ["InvoiceValidationService", "ValidationCheck", "gstin_error"]
@@ -0,0 +1,320 @@
+"""
+Result Cache Service
+
+Caches computed per-user results (dashboard listings, analytics, insights,
+search pages and facets) keyed by (user, endpoint, normalized params).
+
+Invalidation is by version rather than by key: every user has a data
+version that invoice writes bump, and each cached result records the
+version it was computed at, so a write makes all of that user's results
+stale at once without enumerating them.
+
+Results are stored serialized, which gives the in-process LRU an exact
+size in bytes to bound and means callers always receive a fresh copy.
+With RESULT_CACHE_SHARED, versions live in user_cache_versions (bumped in
+the writing transaction) and results are also written to a database
+tier, so workers share results and see each other's writes.
+"""
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.monitoring import app_metrics
+from app.models.database import ResultCacheEntryModel, UserCacheVersionModel
+from app.services.count_service import query_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Expired shared-tier rows are purged once per this many writes
+SHARED_PURGE_INTERVAL = 1000
+
+
+def _normalize(value: Any) -> Any:
+    """Reduce call parameters to plain JSON values for fingerprinting."""
+    if hasattr(value, "to_dict"):
+        return _normalize(value.to_dict())
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+class ResultCache:
+    """Versioned per-user result cache with a byte-bounded LRU and an optional shared tier."""
+    
+    def __init__(
+        self,
+        ttl_seconds: int = None,
+        max_bytes: int = None,
+        max_entry_bytes: int = None,
+        shared: bool = None
+    ):
+        settings = get_settings()
+        self.ttl_seconds = ttl_seconds or settings.RESULT_CACHE_TTL_SECONDS
+        self.max_bytes = max_bytes or settings.RESULT_CACHE_MAX_BYTES
+        self.max_entry_bytes = max_entry_bytes or settings.RESULT_CACHE_MAX_ENTRY_BYTES
+        self.shared = settings.RESULT_CACHE_SHARED if shared is None else shared
+        
+        # key -> (version, payload, expires_at)
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[int, str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._versions: Dict[str, int] = {}
+        self._lookups: Dict[str, Dict[str, int]] = {}
+        self._shared_writes = 0
+        self._lock = threading.Lock()
+    
+    # Versions
+    
+    def _version(self, user_id: str) -> int:
+        if not self.shared:
+            with self._lock:
+                return self._versions.get(user_id, 0)
+        
+        with get_db_session() as session:
+            return session.execute(
+                select(UserCacheVersionModel.version).where(UserCacheVersionModel.user_id == user_id)
+            ).scalar() or 0
+    
+    def bump_version(self, session, user_id: str):
+        """
+        Bump the shared version inside the caller's write transaction.
+        
+        A no-op unless the shared tier is enabled; invalidate_user() must
+        still be called after commit for this process.
+        """
+        if not self.shared:
+            return
+        session.execute(
+            pg_insert(UserCacheVersionModel)
+            .values(user_id=user_id, version=1)
+            .on_conflict_do_update(
+                index_elements=[UserCacheVersionModel.user_id],
+                set_={"version": UserCacheVersionModel.version + 1}
+            )
+        )
+    
+    def invalidate_user(self, user_id: str):
+        """Make every cached result of a user stale (call after the write commits)."""
+        user_id = str(user_id)
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+    
+    def clear(self):
+        """Make every cached result stale (after changes that span users, such as company merges)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._versions = {user_id: version + 1 for user_id, version in self._versions.items()}
+        
+        if self.shared:
+            with get_db_session() as session:
+                session.execute(update(UserCacheVersionModel).values(version=UserCacheVersionModel.version + 1))
+                session.commit()
+    
+    # Local tier
+    
+    def _local_get(self, key: Tuple[str, str, str], version: int) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version or entry[2] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def _local_put(self, key: Tuple[str, str, str], version: int, payload: str):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (version, payload, time.monotonic() + self.ttl_seconds)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+            app_metrics.metrics.set_gauge("result_cache_bytes", self._bytes)
+            app_metrics.metrics.set_gauge("result_cache_entries", len(self._entries))
+    
+    def _remove(self, key: Tuple[str, str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+    
+    # Shared tier
+    
+    @staticmethod
+    def _shared_key(key: Tuple[str, str, str], version: int) -> str:
+        return f"{key[0]}:{key[1]}:{key[2]}:{version}"
+    
+    def _shared_get(self, key: Tuple[str, str, str], version: int) -> Optional[str]:
+        try:
+            with get_db_session() as session:
+                return session.execute(
+                    select(ResultCacheEntryModel.value).where(
+                        ResultCacheEntryModel.cache_key == self._shared_key(key, version),
+                        ResultCacheEntryModel.expires_at > datetime.utcnow()
+                    )
+                ).scalar()
+        except Exception as e:
+            logger.warning(f"Shared result cache read failed: {e}")
+            return None
+    
+    def _shared_put(self, key: Tuple[str, str, str], version: int, payload: str):
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        try:
+            with get_db_session() as session:
+                session.execute(
+                    pg_insert(ResultCacheEntryModel)
+                    .values(cache_key=self._shared_key(key, version), value=payload, expires_at=expires_at)
+                    .on_conflict_do_update(
+                        index_elements=[ResultCacheEntryModel.cache_key],
+                        set_={"value": payload, "expires_at": expires_at}
+                    )
+                )
+                
+                # Entries of old versions are never read again; drop them once expired
+                self._shared_writes += 1
+                if self._shared_writes % SHARED_PURGE_INTERVAL == 0:
+                    session.execute(
+                        delete(ResultCacheEntryModel).where(ResultCacheEntryModel.expires_at <= datetime.utcnow())
+                    )
+                session.commit()
+        except Exception as e:
+            logger.warning(f"Shared result cache write failed: {e}")
+    
+    # Lookups
+    
+    def _record_lookup(self, endpoint: str, result: str):
+        app_metrics.metrics.increment_counter("result_cache_lookups", tags={"endpoint": endpoint, "result": result})
+        with self._lock:
+            counts = self._lookups.setdefault(endpoint, {"hits": 0, "lookups": 0})
+            counts["lookups"] += 1
+            if result != "miss":
+                counts["hits"] += 1
+            ratio = counts["hits"] / counts["lookups"]
+        app_metrics.metrics.set_gauge("result_cache_hit_ratio", ratio, tags={"endpoint": endpoint})
+    
+    def get_or_compute(self, user_id: str, endpoint: str, params: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached result for (user, endpoint, params), computing it on a miss.
+        
+        Results with success=False are returned but not cached.
+        """
+        user_id = str(user_id)
+        key = (user_id, endpoint, query_fingerprint(endpoint, _normalize(params)))
+        version = self._version(user_id)
+        
+        payload = self._local_get(key, version)
+        if payload is not None:
+            self._record_lookup(endpoint, "hit")
+            return json.loads(payload)
+        
+        if self.shared:
+            payload = self._shared_get(key, version)
+            if payload is not None:
+                self._record_lookup(endpoint, "shared_hit")
+                self._local_put(key, version, payload)
+                return json.loads(payload)
+        
+        self._record_lookup(endpoint, "miss")
+        result = compute()
+        if isinstance(result, dict) and result.get("success") is False:
+            return result
+        
+        try:
+            payload = json.dumps(result, default=_encode, separators=(",", ":"))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Result of {endpoint} is not cacheable: {e}")
+            return result
+        if len(payload) > self.max_entry_bytes:
+            return result
+        
+        # A write may have landed while computing; store under the version read
+        # before, so such a result is already stale
+        self._local_put(key, version, payload)
+        if self.shared:
+            self._shared_put(key, version, payload)
+        
+        # Callers get the same (decoded) shape on hits and misses
+        return json.loads(payload)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache statistics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "shared": self.shared,
+                "hit_ratio": {
+                    endpoint: counts["hits"] / counts["lookups"]
+                    for endpoint, counts in self._lookups.items() if counts["lookups"]
+                }
+            }
+
+
+# Global result cache
+result_cache = ResultCache()
+
+
+def cached_result(endpoint: str):
+    """
+    Cache a service method whose first argument after self is user_id.
+    
+    All other arguments (defaults applied) form the cache key. Methods that
+    catch errors must return them with success=False so the fallback is
+    not cached.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+        
+        @functools.wraps(method)
+        def wrapper(self, user_id, *args, **kwargs):
+            bound = signature.bind(self, user_id, *args, **kwargs)
+            bound.apply_defaults()
+            params = {name: value for name, value in bound.arguments.items() if name not in ("self", "user_id")}
+            return result_cache.get_or_compute(
+                user_id, endpoint, params, lambda: method(self, user_id, *args, **kwargs)
+            )
+        
+        return wrapper
+    return decorator
+
+
+__all__ = [
+    "ResultCache",
+    "cached_result",
+    "result_cache",
+]
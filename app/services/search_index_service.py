@@ -0,0 +1,192 @@
+"""
+Search Index Service
+
+Maintains invoices.search_vector, the stored full-text document behind
+invoice search. The document is weighted so ts_rank prefers matches in
+the fields users usually search for:
+
+    A  invoice number
+    B  vendor and customer names
+    C  line item descriptions
+    D  raw extracted text
+
+The vector is written in the same statement as the invoice insert (and
+recomputed when company merges repoint invoices), so searches match it
+against the GIN index instead of running to_tsvector over every row.
+"""
+import asyncio
+import logging
+import re
+import uuid
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.models.database import CompanyModel, InvoiceModel, LineItemModel
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration for documents and queries; they must match
+SEARCH_CONFIG = "english"
+
+
+def _weighted(value, weight: str):
+    return func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(value, "")), weight, type_=TSVECTOR)
+
+
+def _company_name(company_id):
+    return select(CompanyModel.company_name).where(CompanyModel.id == company_id).scalar_subquery()
+
+
+def line_item_descriptions(invoice_id):
+    """Line item descriptions of an invoice, concatenated (for recomputing stored vectors)."""
+    return select(
+        func.string_agg(LineItemModel.description, " ")
+    ).where(LineItemModel.invoice_id == invoice_id).scalar_subquery()
+
+
+def invoice_search_vector(invoice_number, vendor_id, customer_id, descriptions, raw_text):
+    """
+    SQL expression for an invoice's weighted search document.
+    
+    Arguments may be Python values (at insert time) or columns and
+    subqueries (when recomputing stored rows); company names are always
+    read from the companies table so both paths index the same names.
+    """
+    parties = func.concat_ws(" ", _company_name(vendor_id), _company_name(customer_id))
+    return (
+        _weighted(invoice_number, "A")
+        .op("||")(_weighted(parties, "B"))
+        .op("||")(_weighted(descriptions, "C"))
+        .op("||")(_weighted(raw_text, "D"))
+    )
+
+
+def stored_invoice_search_vector(vendor_id=None, customer_id=None):
+    """
+    invoice_search_vector over an invoice row's own columns.
+    
+    vendor_id / customer_id override the row's company ids, for UPDATEs
+    that change them in the same statement.
+    """
+    return invoice_search_vector(
+        InvoiceModel.invoice_number,
+        InvoiceModel.vendor_id if vendor_id is None else vendor_id,
+        InvoiceModel.customer_id if customer_id is None else customer_id,
+        line_item_descriptions(InvoiceModel.id),
+        InvoiceModel.raw_text
+    )
+
+
+def build_tsquery(search_text: str, weights: str = ""):
+    """
+    Prefix tsquery matching every word of (sanitized) search text.
+    
+    Args:
+        search_text: Sanitized search text
+        weights: Restrict matches to these weight labels (e.g. "D" for raw text only)
+    
+    Returns:
+        to_tsquery expression, or None if the text has no words
+    """
+    words = re.findall(r"\w+", search_text)
+    if not words:
+        return None
+    return func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{word}:*{weights}" for word in words))
+
+
+def backfill_search_vectors(batch_size: int = None, after: Optional[uuid.UUID] = None) -> Dict[str, Any]:
+    """
+    Compute stored vectors for one batch of invoices written before the column existed.
+    
+    Args:
+        batch_size: Invoices updated per call
+        after: Invoice id to resume after (cursor from the previous call)
+    
+    Returns:
+        Dictionary with the update count and the cursor for the next call (None when done)
+    """
+    batch_size = batch_size or get_settings().SEARCH_VECTOR_BACKFILL_BATCH_SIZE
+    
+    with get_db_session() as session:
+        query = select(InvoiceModel.id).where(InvoiceModel.search_vector.is_(None))
+        if after:
+            query = query.where(InvoiceModel.id > after)
+        ids = session.execute(query.order_by(InvoiceModel.id).limit(batch_size)).scalars().all()
+        
+        if ids:
+            session.execute(
+                update(InvoiceModel)
+                .where(InvoiceModel.id.in_(ids))
+                .values(search_vector=stored_invoice_search_vector())
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+    
+    return {"updated": len(ids), "cursor": ids[-1] if len(ids) == batch_size else None}
+
+
+class SearchVectorBackfillJob:
+    """Background task that fills search vectors of older invoices once at startup."""
+    
+    def __init__(self):
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self):
+        """Start the backfill."""
+        if self._running:
+            return
+        
+        self._running = True
+        logger.info("Starting search vector backfill")
+        self._task = asyncio.create_task(self._backfill())
+    
+    def stop(self):
+        """Stop the backfill (a later start resumes with the remaining rows)."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        logger.info("Stopping search vector backfill")
+    
+    async def run_once(self) -> int:
+        """Backfill every invoice without a vector, one batch per transaction."""
+        updated = 0
+        cursor = None
+        while self._running:
+            result = await asyncio.to_thread(backfill_search_vectors, after=cursor)
+            updated += result["updated"]
+            cursor = result["cursor"]
+            if cursor is None:
+                break
+        return updated
+    
+    async def _backfill(self):
+        try:
+            updated = await self.run_once()
+            if updated:
+                logger.info(f"Search vector backfill complete: {updated} invoices indexed")
+        except Exception as e:
+            logger.error(f"Error in search vector backfill: {e}")
+        finally:
+            self._running = False
+
+
+# Global search vector backfill job
+search_vector_backfill_job = SearchVectorBackfillJob()
+
+
+__all__ = [
+    "SEARCH_CONFIG",
+    "SearchVectorBackfillJob",
+    "backfill_search_vectors",
+    "build_tsquery",
+    "invoice_search_vector",
+    "line_item_descriptions",
+    "search_vector_backfill_job",
+    "stored_invoice_search_vector",
+]
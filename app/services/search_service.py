@@ -5,22 +5,46 @@ Provides comprehensive search, filtering, and faceted search capabilities
 for invoices and related data with performance optimization.
 """
 import logging
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional, Any, Tuple
 from decimal import Decimal
 from enum import Enum
 
-from sqlalchemy import func, and_, or_, text, desc, asc
-from sqlalchemy.orm import Session, joinedload, selectinload
-from sqlalchemy.dialects.postgresql import to_tsvector, to_tsquery
+from sqlalchemy import func, and_, or_, case, select, text, desc, asc, Float
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload, undefer
 
 from app.core.database import get_db_session
+from app.core.exceptions import ValidationException
 from app.core.logging_config import performance_monitor
-from app.core.validation import sanitize_search_query
+from app.core.pagination import SortKey, paginate
+from app.core.validation import parse_invoice_date, sanitize_search_query
 from app.models.database import InvoiceModel, CompanyModel, UserModel, LineItemModel
+from app.services.count_service import invoice_count_service, query_fingerprint
+from app.services.result_cache_service import cached_result, result_cache
+from app.services.search_index_service import SEARCH_CONFIG, build_tsquery
+from app.services.suggestion_service import suggestion_index
 
 logger = logging.getLogger(__name__)
 
+# ts_headline snippet of the raw text around the matched terms
+HEADLINE_OPTIONS = "MaxFragments=1, MaxWords=20, MinWords=8, StartSel=**, StopSel=**"
+
+# Facet buckets: (label, lower bound, upper bound or None) and (label, days back)
+FACET_AMOUNT_RANGES = [
+    ("0-100", 0, 100),
+    ("100-500", 100, 500),
+    ("500-1000", 500, 1000),
+    ("1000-5000", 1000, 5000),
+    ("5000+", 5000, None),
+]
+FACET_DATE_RANGES = [
+    ("last_30_days", 30),
+    ("last_90_days", 90),
+    ("last_180_days", 180),
+    ("last_year", 365),
+]
+FACET_TOP_VENDORS = 10
+
 
 class SearchSortOrder(str, Enum):
     """Search result sorting options."""
@@ -41,9 +65,14 @@ class SearchScope(str, Enum):
     VENDOR = "vendor"
     CUSTOMER = "customer"
     DESCRIPTION = "description"
+    HSN_CODE = "hsn_code"
     RAW_TEXT = "raw_text"
 
 
+# Scopes answered from line items rather than invoice columns
+LINE_ITEM_SCOPES = (SearchScope.DESCRIPTION, SearchScope.HSN_CODE)
+
+
 class SearchFilter:
     """Represents a search filter with type and value."""
     
@@ -86,6 +115,7 @@ class AdvancedSearchService:
         pass
     
     @performance_monitor("search", "advanced_search")
+    @cached_result("advanced_search")
     def search_invoices(
         self,
         user_id: str,
@@ -95,7 +125,8 @@ class AdvancedSearchService:
         sort_by: SearchSortOrder = SearchSortOrder.RELEVANCE,
         page: int = 1,
         limit: int = 20,
-        include_facets: bool = False
+        include_facets: bool = False,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Perform advanced search with full-text search, filtering, and faceting.
@@ -106,9 +137,10 @@ class AdvancedSearchService:
             filters: List of filters to apply
             scope: Search scope (all fields or specific field)
             sort_by: Sort order for results
-            page: Page number for pagination
+            page: Page number for legacy offset pagination
             limit: Number of results per page
             include_facets: Whether to include facet counts
+            cursor: next_cursor/prev_cursor from a previous response (keyset pagination)
             
         Returns:
             Dictionary with search results, pagination, and facets
@@ -126,18 +158,45 @@ class AdvancedSearchService:
                 if filters:
                     base_query = self._apply_filters(base_query, filters)
                 
-                # Get total count before pagination
-                total_count = base_query.count()
+                # Load what the result conversion reads; raw_text stays in the
+                # database (scores and snippets are computed there for the page)
+                results_query = base_query.options(
+                    joinedload(InvoiceModel.vendor),
+                    joinedload(InvoiceModel.customer),
+                    undefer(InvoiceModel.line_item_count)
+                )
                 
-                # Apply sorting
-                base_query = self._apply_sorting(base_query, sort_by, query)
+                # Apply sorting and pagination (keyset with a cursor, offset otherwise);
+                # offset pages carry the filtered total as a window count
+                results_query, sort_keys = self._apply_sorting(results_query, sort_by, query)
+                results, pagination = paginate(
+                    results_query,
+                    sort_keys,
+                    limit,
+                    cursor=cursor,
+                    page=page,
+                    metric_name="advanced_search_page",
+                    window_total=True
+                )
+                pagination = invoice_count_service.complete_pagination(
+                    session,
+                    base_query,
+                    user_id,
+                    query_fingerprint("advanced_search", {
+                        "query": query,
+                        "scope": scope.value,
+                        "filters": [filter_obj.to_dict() for filter_obj in filters or []]
+                    }),
+                    pagination
+                )
                 
-                # Apply pagination
-                offset = (page - 1) * limit
-                results = base_query.offset(offset).limit(limit).all()
+                # Line-item scopes report how many lines of each invoice matched
+                matched_lines = None
+                if query and scope in LINE_ITEM_SCOPES:
+                    matched_lines = self._count_matched_lines(session, [invoice.id for invoice in results], query, scope)
                 
                 # Convert to search results
-                search_results = self._convert_to_search_results(results, query)
+                search_results = self._convert_to_search_results(session, results, query, matched_lines)
                 
                 # Get facets if requested
                 facets = {}
@@ -147,14 +206,7 @@ class AdvancedSearchService:
                 return {
                     "success": True,
                     "results": [result.to_dict() for result in search_results],
-                    "pagination": {
-                        "page": page,
-                        "limit": limit,
-                        "total": total_count,
-                        "pages": (total_count + limit - 1) // limit,
-                        "has_next": page * limit < total_count,
-                        "has_prev": page > 1
-                    },
+                    "pagination": pagination,
                     "facets": facets,
                     "search_info": {
                         "query": query,
@@ -164,6 +216,8 @@ class AdvancedSearchService:
                     }
                 }
                 
+        except ValidationException:
+            raise
         except Exception as e:
             logger.error(f"Error in advanced search: {e}")
             return {
@@ -175,12 +229,8 @@ class AdvancedSearchService:
             }
     
     def _build_base_query(self, session: Session, user_id: str):
-        """Build base query with eager loading."""
-        return session.query(InvoiceModel).options(
-            joinedload(InvoiceModel.vendor),
-            joinedload(InvoiceModel.customer),
-            selectinload(InvoiceModel.line_items)
-        ).filter(InvoiceModel.user_id == user_id)
+        """Build the user-scoped base query (loader options are added per use)."""
+        return session.query(InvoiceModel).filter(InvoiceModel.user_id == user_id)
     
     def _apply_text_search(self, query, search_text: str, scope: SearchScope):
         """Apply full-text search based on scope."""
@@ -189,37 +239,61 @@ class AdvancedSearchService:
         if not clean_search:
             return query
         
-        # PostgreSQL full-text search
-        search_terms = clean_search.split()
-        ts_query = " & ".join(search_terms)
-        
         if scope == SearchScope.ALL:
-            # Search across all text fields
-            return query.filter(
-                or_(
-                    InvoiceModel.invoice_number.ilike(f"%{clean_search}%"),
-                    InvoiceModel.raw_text.op("@@")(func.to_tsquery("english", ts_query)),
-                    InvoiceModel.vendor.has(CompanyModel.company_name.ilike(f"%{clean_search}%")),
-                    InvoiceModel.customer.has(CompanyModel.company_name.ilike(f"%{clean_search}%"))
-                )
-            )
+            # The stored document covers number, company names, line items and raw text
+            ts_query = build_tsquery(clean_search)
+            return query.filter(InvoiceModel.search_vector.op("@@")(ts_query)) if ts_query is not None else query
         elif scope == SearchScope.INVOICE_NUMBER:
             return query.filter(InvoiceModel.invoice_number.ilike(f"%{clean_search}%"))
         elif scope == SearchScope.VENDOR:
             return query.filter(InvoiceModel.vendor.has(CompanyModel.company_name.ilike(f"%{clean_search}%")))
         elif scope == SearchScope.CUSTOMER:
             return query.filter(InvoiceModel.customer.has(CompanyModel.company_name.ilike(f"%{clean_search}%")))
+        elif scope in LINE_ITEM_SCOPES:
+            # Invoices with at least one matching line (semi-join on the line item indexes)
+            return query.filter(InvoiceModel.id.in_(
+                select(LineItemModel.invoice_id).where(self._line_item_condition(scope, clean_search))
+            ))
         elif scope == SearchScope.RAW_TEXT:
-            return query.filter(InvoiceModel.raw_text.op("@@")(func.to_tsquery("english", ts_query)))
+            # Only the raw text is weighted D
+            ts_query = build_tsquery(clean_search, weights="D")
+            return query.filter(InvoiceModel.search_vector.op("@@")(ts_query)) if ts_query is not None else query
         else:
             return query
     
+    def _line_item_condition(self, scope: SearchScope, clean_search: str):
+        """Line item match for a line-item scope: description substring (trigram index) or HSN prefix (B-tree)."""
+        if scope == SearchScope.HSN_CODE:
+            return LineItemModel.hsn_code.like(f"{clean_search.replace(' ', '')}%")
+        return LineItemModel.description.ilike(f"%{clean_search}%")
+    
+    def _count_matched_lines(self, session: Session, invoice_ids: List[Any], search_text: str, scope: SearchScope) -> Dict[Any, int]:
+        """Matching line items per invoice of a result page."""
+        clean_search = sanitize_search_query(search_text)
+        if not clean_search or not invoice_ids:
+            return {}
+        
+        rows = session.query(
+            LineItemModel.invoice_id, func.count(LineItemModel.id)
+        ).filter(
+            LineItemModel.invoice_id.in_(invoice_ids),
+            self._line_item_condition(scope, clean_search)
+        ).group_by(LineItemModel.invoice_id).all()
+        return dict(rows)
+    
     def _apply_filters(self, query, filters: List[SearchFilter]):
         """Apply filters to the query."""
         for filter_obj in filters:
             query = self._apply_single_filter(query, filter_obj)
         return query
     
+    def _filter_date(self, value: Any) -> date:
+        """Parse a date filter value (date or string in any supported format)."""
+        parsed = parse_invoice_date(value)
+        if parsed is None:
+            raise ValidationException("Invalid date filter", details={"date": str(value)})
+        return parsed
+    
     def _apply_single_filter(self, query, filter_obj: SearchFilter):
         """Apply a single filter to the query."""
         field = filter_obj.field
@@ -239,16 +313,17 @@ class AdvancedSearchService:
                     return query.filter(column.between(Decimal(str(value[0])), Decimal(str(value[1]))))
         
         elif field == "date":
-            column = InvoiceModel.invoice_date
+            # Range scan on idx_invoices_user_invoice_date
+            column = InvoiceModel.invoice_date_parsed
             if operator == "gte":
-                return query.filter(column >= value)
+                return query.filter(column >= self._filter_date(value))
             elif operator == "lte":
-                return query.filter(column <= value)
+                return query.filter(column <= self._filter_date(value))
             elif operator == "eq":
-                return query.filter(column == value)
+                return query.filter(column == self._filter_date(value))
             elif operator == "between":
                 if isinstance(value, list) and len(value) == 2:
-                    return query.filter(column.between(value[0], value[1]))
+                    return query.filter(column.between(self._filter_date(value[0]), self._filter_date(value[1])))
         
         elif field == "created_at":
             column = InvoiceModel.created_at
@@ -291,39 +366,56 @@ class AdvancedSearchService:
         return query
     
     def _apply_sorting(self, query, sort_by: SearchSortOrder, search_text: str = None):
-        """Apply sorting to the query."""
+        """
+        Resolve the sort order to keyset sort keys.
+        
+        Every order ends with (created_at, id) so keys are unique and pages
+        are stable. Returns the query (joined when sorting by a company
+        name) and the keys.
+        """
+        recency = [
+            SortKey(InvoiceModel.created_at, descending=True, nullable=False),
+            SortKey(InvoiceModel.id, descending=True, nullable=False),
+        ]
+        
         if sort_by == SearchSortOrder.DATE_DESC:
-            return query.order_by(desc(InvoiceModel.created_at))
+            return query, recency
         elif sort_by == SearchSortOrder.DATE_ASC:
-            return query.order_by(asc(InvoiceModel.created_at))
+            return query, [
+                SortKey(InvoiceModel.created_at, nullable=False),
+                SortKey(InvoiceModel.id, nullable=False),
+            ]
         elif sort_by == SearchSortOrder.AMOUNT_DESC:
-            return query.order_by(desc(InvoiceModel.net_amount))
+            return query, [SortKey(InvoiceModel.net_amount, descending=True), *recency]
         elif sort_by == SearchSortOrder.AMOUNT_ASC:
-            return query.order_by(asc(InvoiceModel.net_amount))
+            return query, [SortKey(InvoiceModel.net_amount), *recency]
         elif sort_by == SearchSortOrder.INVOICE_NUMBER:
-            return query.order_by(asc(InvoiceModel.invoice_number))
-        elif sort_by == SearchSortOrder.VENDOR_NAME:
-            return query.join(CompanyModel, InvoiceModel.vendor_id == CompanyModel.id, isouter=True)\
-                        .order_by(asc(CompanyModel.company_name))
-        elif sort_by == SearchSortOrder.CUSTOMER_NAME:
-            return query.join(CompanyModel, InvoiceModel.customer_id == CompanyModel.id, isouter=True)\
-                        .order_by(asc(CompanyModel.company_name))
+            return query, [SortKey(InvoiceModel.invoice_number), *recency]
+        elif sort_by in (SearchSortOrder.VENDOR_NAME, SearchSortOrder.CUSTOMER_NAME):
+            company = aliased(CompanyModel)
+            foreign_key = InvoiceModel.vendor_id if sort_by == SearchSortOrder.VENDOR_NAME else InvoiceModel.customer_id
+            query = query.outerjoin(company, foreign_key == company.id)
+            return query, [SortKey(company.company_name), *recency]
         elif sort_by == SearchSortOrder.RELEVANCE and search_text:
             # PostgreSQL relevance ranking
-            clean_search = sanitize_search_query(search_text)
-            if clean_search:
-                search_terms = clean_search.split()
-                ts_query = " & ".join(search_terms)
-                return query.order_by(desc(func.ts_rank(
-                    func.to_tsvector("english", InvoiceModel.raw_text),
-                    func.to_tsquery("english", ts_query)
-                )))
+            ts_query = build_tsquery(sanitize_search_query(search_text))
+            if ts_query is not None:
+                # ts_rank is float4; as float8 the cursor's value compares equal to the boundary row
+                rank = func.ts_rank(InvoiceModel.search_vector, ts_query).cast(Float(53))
+                return query, [SortKey(rank, descending=True), *recency]
         
         # Default sorting
-        return query.order_by(desc(InvoiceModel.created_at))
+        return query, recency
     
-    def _convert_to_search_results(self, invoices: List[InvoiceModel], search_text: str = None) -> List[SearchResult]:
+    def _convert_to_search_results(
+        self,
+        session: Session,
+        invoices: List[InvoiceModel],
+        search_text: str = None,
+        matched_lines: Optional[Dict[Any, int]] = None
+    ) -> List[SearchResult]:
         """Convert invoice models to search results."""
+        ranking = self._rank_page(session, [invoice.id for invoice in invoices], search_text) if search_text else {}
         results = []
         
         for invoice in invoices:
@@ -331,7 +423,7 @@ class AdvancedSearchService:
             invoice_dict = {
                 "id": str(invoice.id),
                 "invoice_number": invoice.invoice_number,
-                "invoice_date": invoice.invoice_date.isoformat() if invoice.invoice_date else None,
+                "invoice_date": invoice.invoice_date_parsed.isoformat() if invoice.invoice_date_parsed else invoice.invoice_date,
                 "net_amount": float(invoice.net_amount) if invoice.net_amount else None,
                 "currency": invoice.currency,
                 "vendor_name": invoice.vendor.company_name if invoice.vendor else None,
@@ -340,23 +432,52 @@ class AdvancedSearchService:
                 "original_file_id": invoice.original_file_id,
                 "original_filename": invoice.original_filename,
                 "created_at": invoice.created_at.isoformat(),
-                "line_items_count": len(invoice.line_items) if invoice.line_items else 0
+                "line_items_count": invoice.line_item_count
             }
+            if matched_lines is not None:
+                invoice_dict["matched_line_items"] = matched_lines.get(invoice.id, 0)
+            
+            score, snippet = ranking.get(invoice.id, (0.0, None))
             
             # Generate highlights if search text provided
             highlights = []
             if search_text:
-                highlights = self._generate_highlights(invoice, search_text)
-            
-            # Calculate relevance score (simplified)
-            score = self._calculate_relevance_score(invoice, search_text)
+                highlights = self._generate_highlights(invoice, search_text, snippet)
             
             results.append(SearchResult(invoice_dict, score, highlights))
         
         return results
     
-    def _generate_highlights(self, invoice: InvoiceModel, search_text: str) -> List[str]:
-        """Generate search result highlights."""
+    def _rank_page(self, session: Session, invoice_ids: List[Any], search_text: str) -> Dict[Any, Tuple[float, Optional[str]]]:
+        """
+        Score and snippet each invoice of a result page in the database.
+        
+        ts_rank_cd runs on the stored vector; ts_headline reads raw_text
+        only for page rows whose raw text matched, so the text never
+        leaves the database.
+        
+        Returns:
+            {invoice id: (score, raw text snippet or None)}
+        """
+        clean_search = sanitize_search_query(search_text)
+        ts_query = build_tsquery(clean_search)
+        if ts_query is None or not invoice_ids:
+            return {}
+        
+        raw_text_matched = InvoiceModel.search_vector.op("@@")(build_tsquery(clean_search, weights="D"))
+        rows = session.query(
+            InvoiceModel.id,
+            func.ts_rank_cd(InvoiceModel.search_vector, ts_query),
+            case(
+                (raw_text_matched, func.ts_headline(SEARCH_CONFIG, InvoiceModel.raw_text, ts_query, HEADLINE_OPTIONS)),
+                else_=None
+            )
+        ).filter(InvoiceModel.id.in_(invoice_ids)).all()
+        
+        return {invoice_id: (float(score or 0), snippet) for invoice_id, score, snippet in rows}
+    
+    def _generate_highlights(self, invoice: InvoiceModel, search_text: str, snippet: Optional[str] = None) -> List[str]:
+        """Generate search result highlights from the short fields and the database snippet."""
         highlights = []
         clean_search = sanitize_search_query(search_text).lower()
         
@@ -379,65 +500,29 @@ class AdvancedSearchService:
             if any(term in invoice.customer.company_name.lower() for term in search_terms):
                 highlights.append(f"Customer: {invoice.customer.company_name}")
         
-        # Check raw text (first 100 chars containing search term)
-        if invoice.raw_text:
-            for term in search_terms:
-                if term in invoice.raw_text.lower():
-                    # Find context around the term
-                    text_lower = invoice.raw_text.lower()
-                    index = text_lower.find(term)
-                    if index != -1:
-                        start = max(0, index - 50)
-                        end = min(len(invoice.raw_text), index + 50)
-                        context = invoice.raw_text[start:end]
-                        if start > 0:
-                            context = "..." + context
-                        if end < len(invoice.raw_text):
-                            context = context + "..."
-                        highlights.append(f"Text: {context}")
-                        break
+        # Raw text context (ts_headline)
+        if snippet:
+            highlights.append(f"Text: {snippet}")
         
         return highlights[:3]  # Limit to 3 highlights
     
-    def _calculate_relevance_score(self, invoice: InvoiceModel, search_text: str = None) -> float:
-        """Calculate relevance score for search result."""
-        if not search_text:
-            return 0.0
-        
-        score = 0.0
-        clean_search = sanitize_search_query(search_text).lower()
-        search_terms = clean_search.split()
-        
-        # Invoice number match (highest weight)
-        if invoice.invoice_number:
-            for term in search_terms:
-                if term in invoice.invoice_number.lower():
-                    score += 10.0
-        
-        # Exact company name match
-        if invoice.vendor and invoice.vendor.company_name:
-            for term in search_terms:
-                if term in invoice.vendor.company_name.lower():
-                    score += 5.0
-        
-        if invoice.customer and invoice.customer.company_name:
-            for term in search_terms:
-                if term in invoice.customer.company_name.lower():
-                    score += 5.0
-        
-        # Raw text match (lower weight)
-        if invoice.raw_text:
-            text_lower = invoice.raw_text.lower()
-            for term in search_terms:
-                count = text_lower.count(term)
-                score += count * 1.0
-        
-        return score
-    
     def _get_facets(self, session: Session, user_id: str, existing_filters: List[SearchFilter] = None) -> Dict[str, Any]:
-        """Get facet counts for search refinement."""
-        facets = {}
+        """Get facet counts for search refinement (cached per user and filters until the user's invoices change)."""
+        return result_cache.get_or_compute(
+            user_id,
+            "search_facets",
+            {"filters": existing_filters or []},
+            lambda: self._compute_facets(session, user_id, existing_filters)
+        )
+    
+    def _compute_facets(self, session: Session, user_id: str, existing_filters: List[SearchFilter] = None) -> Dict[str, Any]:
+        """
+        Compute facet counts in one scan of the filtered invoices.
         
+        GROUPING SETS produce per-currency and per-vendor counts plus a
+        grand-total row whose COUNT(*) FILTER columns hold the amount and
+        date buckets.
+        """
         # Base query for facets
         base_query = session.query(InvoiceModel).filter(InvoiceModel.user_id == user_id)
         
@@ -446,107 +531,76 @@ class AdvancedSearchService:
             for filter_obj in existing_filters:
                 base_query = self._apply_single_filter(base_query, filter_obj)
         
-        # Currency facet
-        currency_facet = base_query.with_entities(
-            InvoiceModel.currency,
-            func.count(InvoiceModel.id).label('count')
-        ).group_by(InvoiceModel.currency).all()
-        
-        facets["currency"] = [
-            {"value": row.currency, "count": row.count}
-            for row in currency_facet if row.currency
-        ]
-        
-        # Amount range facet
-        amount_ranges = [
-            ("0-100", 0, 100),
-            ("100-500", 100, 500),
-            ("500-1000", 500, 1000),
-            ("1000-5000", 1000, 5000),
-            ("5000+", 5000, None)
-        ]
-        
-        amount_facet = []
-        for label, min_amount, max_amount in amount_ranges:
-            if max_amount:
-                count = base_query.filter(
-                    InvoiceModel.net_amount >= min_amount,
-                    InvoiceModel.net_amount < max_amount
-                ).count()
-            else:
-                count = base_query.filter(InvoiceModel.net_amount >= min_amount).count()
-            
-            amount_facet.append({"value": label, "count": count})
-        
-        facets["amount_range"] = amount_facet
-        
-        # Date range facet (last 30, 90, 180, 365 days)
-        from datetime import timedelta
         now = datetime.utcnow()
-        date_ranges = [
-            ("last_30_days", now - timedelta(days=30)),
-            ("last_90_days", now - timedelta(days=90)),
-            ("last_180_days", now - timedelta(days=180)),
-            ("last_year", now - timedelta(days=365))
+        buckets = [
+            *[
+                (label, func.count().filter(
+                    and_(InvoiceModel.net_amount >= low, InvoiceModel.net_amount < high) if high is not None
+                    else InvoiceModel.net_amount >= low
+                ))
+                for label, low, high in FACET_AMOUNT_RANGES
+            ],
+            *[
+                (label, func.count().filter(InvoiceModel.created_at >= now - timedelta(days=days)))
+                for label, days in FACET_DATE_RANGES
+            ],
         ]
         
-        date_facet = []
-        for label, since_date in date_ranges:
-            count = base_query.filter(InvoiceModel.created_at >= since_date).count()
-            date_facet.append({"value": label, "count": count})
-        
-        facets["date_range"] = date_facet
-        
-        # Top vendors facet
-        vendor_facet = base_query.join(
-            CompanyModel, InvoiceModel.vendor_id == CompanyModel.id
+        vendor = aliased(CompanyModel)
+        grouping = func.grouping(InvoiceModel.currency, vendor.company_name)
+        rows = base_query.outerjoin(
+            vendor, InvoiceModel.vendor_id == vendor.id
         ).with_entities(
-            CompanyModel.company_name,
-            func.count(InvoiceModel.id).label('count')
-        ).group_by(CompanyModel.company_name).order_by(
-            func.count(InvoiceModel.id).desc()
-        ).limit(10).all()
-        
-        facets["vendors"] = [
-            {"value": row.company_name, "count": row.count}
-            for row in vendor_facet
-        ]
+            grouping.label("grouping"),
+            InvoiceModel.currency,
+            vendor.company_name,
+            func.count().label("count"),
+            *[expression.label(f"bucket_{index}") for index, (label, expression) in enumerate(buckets)]
+        ).group_by(
+            func.grouping_sets(InvoiceModel.currency, vendor.company_name, text("()"))
+        ).all()
+        
+        # grouping() sets a bit for each column the row is not grouped by
+        currency_rows = [row for row in rows if row.grouping == 1 and row.currency]
+        vendor_rows = [row for row in rows if row.grouping == 2 and row.company_name]
+        total_row = next((row for row in rows if row.grouping == 3), None)
+        
+        currency_rows.sort(key=lambda row: row.count, reverse=True)
+        vendor_rows.sort(key=lambda row: row.count, reverse=True)
+        
+        bucket_counts = [getattr(total_row, f"bucket_{index}") if total_row else 0 for index in range(len(buckets))]
+        amount_count = len(FACET_AMOUNT_RANGES)
+        
+        facets = {
+            "currency": [{"value": row.currency, "count": row.count} for row in currency_rows],
+            "amount_range": [
+                {"value": label, "count": count}
+                for (label, low, high), count in zip(FACET_AMOUNT_RANGES, bucket_counts[:amount_count])
+            ],
+            "date_range": [
+                {"value": label, "count": count}
+                for (label, days), count in zip(FACET_DATE_RANGES, bucket_counts[amount_count:])
+            ],
+            "vendors": [
+                {"value": row.company_name, "count": row.count}
+                for row in vendor_rows[:FACET_TOP_VENDORS]
+            ]
+        }
         
         return facets
     
     @performance_monitor("search", "suggestions")
     def get_search_suggestions(self, user_id: str, query: str, limit: int = 10) -> List[str]:
-        """Get search suggestions based on query."""
+        """Get search suggestions based on query (served from the in-memory suggestion index)."""
         try:
             if not query or len(query) < 2:
                 return []
             
             clean_query = sanitize_search_query(query).lower()
-            suggestions = []
-            
-            with get_db_session() as session:
-                # Invoice number suggestions
-                invoice_numbers = session.query(InvoiceModel.invoice_number).filter(
-                    InvoiceModel.user_id == user_id,
-                    InvoiceModel.invoice_number.ilike(f"{clean_query}%")
-                ).limit(5).all()
-                
-                suggestions.extend([inv.invoice_number for inv in invoice_numbers if inv.invoice_number])
-                
-                # Company name suggestions
-                companies = session.query(CompanyModel.company_name).join(
-                    InvoiceModel, or_(
-                        InvoiceModel.vendor_id == CompanyModel.id,
-                        InvoiceModel.customer_id == CompanyModel.id
-                    )
-                ).filter(
-                    InvoiceModel.user_id == user_id,
-                    CompanyModel.company_name.ilike(f"{clean_query}%")
-                ).distinct().limit(5).all()
-                
-                suggestions.extend([comp.company_name for comp in companies if comp.company_name])
+            if not clean_query:
+                return []
             
-            return list(set(suggestions))[:limit]
+            return suggestion_index.search(user_id, clean_query, limit)
             
         except Exception as e:
             logger.error(f"Error getting search suggestions: {e}")
@@ -0,0 +1,341 @@
+"""
+Suggestion Service
+
+Typeahead suggestions served from memory. Each user gets a sorted array
+of (key, suggestion) pairs covering invoice numbers, vendor and customer
+names, HSN codes and frequent line-item terms, with a weight per
+suggestion (how many invoices or lines it occurs in). Every word start of
+a suggestion is a key, so "steel" finds "Acme Steel Pvt Ltd"; a prefix
+lookup is a binary search plus a short scan.
+
+Indexes are built from the database on a user's first lookup, kept in an
+LRU across users and updated in place when that user's invoices are
+saved or deleted.
+"""
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select
+
+from app.core.config import get_settings
+from app.core.database import get_db_session
+from app.core.monitoring import app_metrics
+from app.models.database import CompanyModel, InvoiceModel, LineItemModel
+
+logger = logging.getLogger(__name__)
+
+# Suggestion kinds
+INVOICE_NUMBER = "invoice_number"
+COMPANY = "company"
+HSN_CODE = "hsn_code"
+TERM = "term"
+
+# Words too common in line items to be useful suggestions
+TERM_STOPWORDS = frozenset({
+    "and", "for", "the", "with", "from", "per", "nos", "pcs", "qty", "of", "to", "in",
+})
+_TERM_PATTERN = re.compile(r"[a-z][a-z0-9\-]{2,}")
+_WORD_START = re.compile(r"(?:^|(?<=[^0-9a-z]))[0-9a-z]")
+
+# Entries scanned per lookup; bounds latency for very short prefixes
+MAX_SCAN = 2000
+
+SuggestionEntries = Counter  # (suggestion, kind) -> occurrences
+
+
+def line_item_terms(description: Optional[str]) -> List[str]:
+    """Suggestion terms of a line item description."""
+    if not description:
+        return []
+    return [term for term in _TERM_PATTERN.findall(description.lower()) if term not in TERM_STOPWORDS]
+
+
+def invoice_suggestion_entries(
+    invoice_number: Optional[str],
+    company_names: Iterable[Optional[str]],
+    line_items: Iterable[Tuple[Optional[str], Optional[str]]]
+) -> SuggestionEntries:
+    """
+    Suggestions contributed by one invoice.
+    
+    Saves and deletes must pass the same values the loader reads (stored
+    company names, line item hsn_code and description) so weights return
+    to zero when the invoice is deleted.
+    
+    Args:
+        invoice_number: Invoice number
+        company_names: Vendor and customer names (each distinct name counts once)
+        line_items: (hsn_code, description) per line
+    """
+    entries = Counter()
+    if invoice_number:
+        entries[(invoice_number, INVOICE_NUMBER)] += 1
+    for name in {name for name in company_names if name}:
+        entries[(name, COMPANY)] += 1
+    for hsn_code, description in line_items:
+        if hsn_code:
+            entries[(hsn_code, HSN_CODE)] += 1
+        for term in line_item_terms(description):
+            entries[(term, TERM)] += 1
+    return entries
+
+
+class UserSuggestionIndex:
+    """Weighted suggestions of one user, keyed by every word start in a sorted array."""
+    
+    def __init__(self, min_term_frequency: int):
+        self.min_term_frequency = min_term_frequency
+        # SuggestionIndex generation at which this index was stored
+        self.loaded_generation = 0
+        self._keys: List[Tuple[str, str]] = []
+        self._weights: Dict[str, int] = {}
+        self._kinds: Dict[str, str] = {}
+    
+    @staticmethod
+    def _word_keys(suggestion: str) -> List[str]:
+        lowered = suggestion.lower()
+        return [lowered[match.start():] for match in _WORD_START.finditer(lowered)]
+    
+    def build(self, entries: SuggestionEntries):
+        """Bulk load (one sort instead of an insertion per key)."""
+        for (suggestion, kind), count in entries.items():
+            self._weights[suggestion] = self._weights.get(suggestion, 0) + count
+            self._kinds.setdefault(suggestion, kind)
+        self._keys = sorted(
+            (key, suggestion) for suggestion in self._weights for key in self._word_keys(suggestion)
+        )
+    
+    def apply(self, entries: SuggestionEntries, sign: int):
+        """Add (sign=1) or remove (sign=-1) an invoice's entries."""
+        for (suggestion, kind), count in entries.items():
+            weight = self._weights.get(suggestion, 0) + sign * count
+            if weight > 0 and suggestion not in self._weights:
+                for key in self._word_keys(suggestion):
+                    bisect.insort(self._keys, (key, suggestion))
+                self._kinds[suggestion] = kind
+            elif weight <= 0 and suggestion in self._weights:
+                for key in self._word_keys(suggestion):
+                    position = bisect.bisect_left(self._keys, (key, suggestion))
+                    if position < len(self._keys) and self._keys[position] == (key, suggestion):
+                        del self._keys[position]
+                del self._weights[suggestion]
+                self._kinds.pop(suggestion, None)
+                continue
+            if weight > 0:
+                self._weights[suggestion] = weight
+    
+    def search(self, prefix: str, limit: int) -> List[str]:
+        """Heaviest suggestions with a word starting with prefix."""
+        matches = set()
+        position = bisect.bisect_left(self._keys, (prefix,))
+        end = min(len(self._keys), position + MAX_SCAN)
+        while position < end and self._keys[position][0].startswith(prefix):
+            suggestion = self._keys[position][1]
+            if self._kinds.get(suggestion) != TERM or self._weights[suggestion] >= self.min_term_frequency:
+                matches.add(suggestion)
+            position += 1
+        return heapq.nsmallest(
+            limit, matches, key=lambda suggestion: (-self._weights[suggestion], len(suggestion), suggestion)
+        )
+    
+    @property
+    def size(self) -> int:
+        return len(self._weights)
+
+
+class SuggestionIndex:
+    """
+    Per-user suggestion indexes, loaded on first use and kept in an LRU.
+    
+    Loads run outside the lock, so invoices may be saved or deleted while
+    one reads. Every change and every stored load bumps a generation: a
+    load during which its user changed is not kept, and a change only
+    updates an index stored before the caller's commit (one stored later
+    may already contain it, so it is dropped instead).
+    """
+    
+    def __init__(self, max_users: int = None, min_term_frequency: int = None):
+        settings = get_settings()
+        self.max_users = max_users or settings.SUGGESTION_INDEX_MAX_USERS
+        self.min_term_frequency = min_term_frequency or settings.SUGGESTION_MIN_TERM_FREQUENCY
+        self._indexes: "OrderedDict[str, UserSuggestionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._cleared_at = 0
+        # Generation of each user's last change, kept only while loads run
+        self._changed_at: Dict[str, int] = {}
+        self._loads = 0
+    
+    @property
+    def generation(self) -> int:
+        """Current generation; read it before committing a change and pass it to add/remove_invoice."""
+        with self._lock:
+            return self._generation
+    
+    def _load_index(self, user_id: str) -> UserSuggestionIndex:
+        """Build a user's index from stored invoices."""
+        started = time.perf_counter()
+        entries = Counter()
+        with get_db_session() as session:
+            numbers = session.execute(
+                select(InvoiceModel.invoice_number).where(
+                    InvoiceModel.user_id == user_id,
+                    InvoiceModel.invoice_number.isnot(None)
+                )
+            ).scalars()
+            entries.update((number, INVOICE_NUMBER) for number in numbers)
+            
+            companies = session.execute(
+                select(CompanyModel.company_name, func.count(func.distinct(InvoiceModel.id))).join(
+                    InvoiceModel,
+                    or_(InvoiceModel.vendor_id == CompanyModel.id, InvoiceModel.customer_id == CompanyModel.id)
+                ).where(InvoiceModel.user_id == user_id).group_by(CompanyModel.company_name)
+            )
+            for name, count in companies:
+                if name:
+                    entries[(name, COMPANY)] += count
+            
+            lines = session.execute(
+                select(LineItemModel.hsn_code, LineItemModel.description).join(
+                    InvoiceModel, LineItemModel.invoice_id == InvoiceModel.id
+                ).where(InvoiceModel.user_id == user_id).execution_options(yield_per=5000)
+            )
+            for hsn_code, description in lines:
+                if hsn_code:
+                    entries[(hsn_code, HSN_CODE)] += 1
+                for term in line_item_terms(description):
+                    entries[(term, TERM)] += 1
+        
+        index = UserSuggestionIndex(self.min_term_frequency)
+        index.build(entries)
+        app_metrics.metrics.record_timing("suggestion_index_load", (time.perf_counter() - started) * 1000)
+        logger.info(f"Loaded suggestion index for user {user_id} ({index.size} suggestions)")
+        return index
+    
+    def _get_index(self, user_id: str) -> UserSuggestionIndex:
+        user_id = str(user_id)
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index
+            self._loads += 1
+            started_at = self._generation
+        
+        try:
+            loaded = self._load_index(user_id)
+        except Exception:
+            with self._lock:
+                self._end_load()
+            raise
+        
+        with self._lock:
+            changed = max(self._changed_at.get(user_id, 0), self._cleared_at) > started_at
+            self._end_load()
+            if not changed:
+                # Another request may have loaded it meanwhile; keep the first one
+                index = self._indexes.get(user_id)
+                if index is None:
+                    self._generation += 1
+                    loaded.loaded_generation = self._generation
+                    index = self._indexes[user_id] = loaded
+                self._indexes.move_to_end(user_id)
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+                app_metrics.metrics.set_gauge("suggestion_index_users", len(self._indexes))
+        
+        if changed:
+            # The snapshot may miss or double count that change; serve this lookup only
+            app_metrics.metrics.increment_counter("suggestion_index_loads_discarded")
+            return loaded
+        return index
+    
+    def _end_load(self):
+        self._loads -= 1
+        if not self._loads:
+            self._changed_at.clear()
+    
+    def _record_change(self, user_id: str):
+        self._generation += 1
+        if self._loads:
+            self._changed_at[user_id] = self._generation
+    
+    def _apply(self, user_id: str, entries: SuggestionEntries, sign: int, since: int):
+        user_id = str(user_id)
+        with self._lock:
+            self._record_change(user_id)
+            index = self._indexes.get(user_id)
+            if index is None:
+                return
+            if index.loaded_generation > since:
+                # Loaded after the caller read `since`; it may already reflect the change
+                del self._indexes[user_id]
+            else:
+                index.apply(entries, sign)
+    
+    def is_loaded(self, user_id: str) -> bool:
+        """Whether a user's index is in memory (and so needs incremental updates)."""
+        with self._lock:
+            return str(user_id) in self._indexes
+    
+    def add_invoice(self, user_id: str, entries: SuggestionEntries, since: int):
+        """
+        Add a saved invoice to a loaded index (unloaded indexes pick it up on load).
+        
+        Args:
+            user_id: Owner of the invoice
+            entries: The invoice's suggestion entries
+            since: `generation` read before the save committed
+        """
+        self._apply(user_id, entries, 1, since)
+    
+    def remove_invoice(self, user_id: str, entries: SuggestionEntries, since: int):
+        """Remove a deleted invoice from a loaded index; `since` as for add_invoice."""
+        self._apply(user_id, entries, -1, since)
+    
+    def invalidate(self, user_id: str):
+        """
+        Drop a user's index; it is rebuilt on next lookup.
+        
+        Also call after a change the index was not updated for, so a load
+        running across that change is not kept.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            self._record_change(user_id)
+            self._indexes.pop(user_id, None)
+    
+    def clear(self):
+        """Drop all indexes (after changes that span users, such as company merges)."""
+        with self._lock:
+            self._generation += 1
+            self._cleared_at = self._generation
+            self._indexes.clear()
+    
+    def search(self, user_id: str, prefix: str, limit: int = 10) -> List[str]:
+        """Suggestions for a (lower-cased) prefix."""
+        index = self._get_index(user_id)
+        started = time.perf_counter()
+        with self._lock:
+            results = index.search(prefix, limit)
+        app_metrics.metrics.record_timing("suggestion_lookup", (time.perf_counter() - started) * 1000)
+        return results
+
+
+# Global suggestion index
+suggestion_index = SuggestionIndex()
+
+
+__all__ = [
+    "SuggestionIndex",
+    "UserSuggestionIndex",
+    "invoice_suggestion_entries",
+    "line_item_terms",
+    "suggestion_index",
+]
@@ -0,0 +1,226 @@
+"""
+Thumbnail Service
+
+Prebuilds WebP thumbnails in a process pool so image resizing never runs
+on the event loop. Thumbnails are stored per user and keyed by content hash:
+
+    thumbnails/<user_id>/<sha256>_<size>.webp
+"""
+import asyncio
+import io
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, List, Set, Tuple
+
+from app.core.config import get_settings
+from app.core.monitoring import app_metrics
+from app.core.storage import StorageBackendType, get_storage_backend
+
+logger = logging.getLogger(__name__)
+
+
+def thumbnail_key(user_id: str, content_key: str, size: int) -> str:
+    """Get the storage key of a thumbnail."""
+    return f"thumbnails/{user_id}/{content_key}_{size}.webp"
+
+
+def render_thumbnails(source_key: str, user_id: str, content_key: str, sizes: List[int]) -> List[str]:
+    """
+    Render all thumbnail sizes for one image.
+    
+    Runs inside a worker process, so it only takes and returns plain values
+    and opens its own storage backend. The source is decoded once and each
+    size is resized from the previous, larger result to keep the LANCZOS
+    work small.
+    
+    Args:
+        source_key: Storage key of the original image
+        user_id: Owner of the file
+        content_key: Content hash used in the thumbnail keys
+        sizes: Bounding box sizes in pixels
+        
+    Returns:
+        List of written thumbnail keys
+    """
+    from PIL import Image
+    
+    storage = get_storage_backend()
+    written = []
+    
+    # Decode straight from disk when the backend is local
+    source = storage.local_path(source_key) or io.BytesIO(storage.read(source_key))
+    
+    with Image.open(source) as img:
+        # Let the decoder downscale JPEGs before the full decode
+        img.draft("RGB", (max(sizes), max(sizes)))
+        
+        # Convert to RGB if necessary
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        for size in sorted(sizes, reverse=True):
+            key = thumbnail_key(user_id, content_key, size)
+            if storage.exists(key):
+                written.append(key)
+                continue
+            
+            # Create thumbnail maintaining aspect ratio
+            img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            
+            buffer = io.BytesIO()
+            img.save(buffer, "WEBP", quality=80, method=4)
+            buffer.seek(0)
+            storage.put(key, buffer, "image/webp")
+            written.append(key)
+    
+    return written
+
+
+class ThumbnailService:
+    """Schedules thumbnail generation and resolves prebuilt thumbnails."""
+    
+    def __init__(self):
+        settings = get_settings()
+        self.storage_backend = StorageBackendType(settings.STORAGE_BACKEND)
+        self.sizes = sorted(settings.THUMBNAIL_SIZES)
+        self.max_workers = settings.THUMBNAIL_WORKERS
+        self._executor: Optional[Executor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Set[Tuple[str, str]] = set()
+        self._worker_tasks: List[asyncio.Task] = []
+    
+    async def start(self):
+        """Start the process pool and one queue consumer per worker."""
+        if self._executor:
+            return
+        
+        logger.info(f"Starting thumbnail workers ({self.max_workers} processes)")
+        if self.storage_backend == StorageBackendType.MEMORY:
+            # Worker processes cannot see this process's in-memory store
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._queue = asyncio.Queue()
+        # Each consumer keeps one render in flight, so all pool workers stay busy
+        self._worker_tasks = [asyncio.create_task(self._queue_worker()) for _ in range(self.max_workers)]
+    
+    def stop(self):
+        """Stop the queue consumers and shut down the process pool."""
+        for task in self._worker_tasks:
+            task.cancel()
+        self._worker_tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+        logger.info("Stopping thumbnail workers")
+    
+    def resolve_size(self, size: int) -> int:
+        """Map a requested size to the smallest prebuilt size that covers it."""
+        for candidate in self.sizes:
+            if candidate >= size:
+                return candidate
+        return self.sizes[-1]
+    
+    async def get_thumbnail(self, user_id: str, content_key: str, size: int) -> Optional[str]:
+        """
+        Get a prebuilt thumbnail, falling back to the nearest larger size.
+        
+        Existence checks may be network calls (S3), so they run in a thread.
+        
+        Args:
+            user_id: Owner of the file
+            content_key: Content hash of the original
+            size: Requested size in pixels
+            
+        Returns:
+            Storage key of a prebuilt thumbnail or None if none exists yet
+        """
+        resolved = self.resolve_size(size)
+        candidates = [s for s in self.sizes if s >= resolved] + [s for s in reversed(self.sizes) if s < resolved]
+        
+        candidate = await asyncio.to_thread(self._first_existing, user_id, content_key, candidates)
+        if candidate is None:
+            app_metrics.metrics.increment_counter("thumbnails_missed")
+            return None
+        
+        app_metrics.metrics.increment_counter("thumbnails_served", tags={"exact": str(candidate == resolved).lower()})
+        return thumbnail_key(user_id, content_key, candidate)
+    
+    @staticmethod
+    def _first_existing(user_id: str, content_key: str, candidates: List[int]) -> Optional[int]:
+        """First candidate size whose thumbnail is stored."""
+        storage = get_storage_backend()
+        for candidate in candidates:
+            if storage.exists(thumbnail_key(user_id, content_key, candidate)):
+                return candidate
+        return None
+    
+    def schedule(self, user_id: str, content_key: str, source_key: str):
+        """
+        Queue thumbnail generation for an upload without waiting for it.
+        
+        Args:
+            user_id: Owner of the file
+            content_key: Content hash of the original
+            source_key: Storage key of the stored original
+        """
+        if not self._queue:
+            logger.warning("Thumbnail workers not running; skipping thumbnail generation")
+            return
+        
+        key = (user_id, content_key)
+        if key in self._pending:
+            return
+        
+        self._pending.add(key)
+        self._queue.put_nowait((user_id, content_key, source_key))
+    
+    def remove(self, user_id: str, content_key: str):
+        """Remove all thumbnails of one original for a user."""
+        storage = get_storage_backend()
+        for size in self.sizes:
+            storage.delete(thumbnail_key(user_id, content_key, size))
+    
+    def remove_user(self, user_id: str):
+        """Remove all thumbnails for a user."""
+        storage = get_storage_backend()
+        for stored in list(storage.list(f"thumbnails/{user_id}/")):
+            storage.delete(stored.key)
+    
+    async def _queue_worker(self):
+        """Feed queued uploads and misses to the process pool, one render at a time."""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            user_id, content_key, source_key = await self._queue.get()
+            try:
+                written = await loop.run_in_executor(
+                    self._executor,
+                    render_thumbnails,
+                    source_key,
+                    user_id,
+                    content_key,
+                    self.sizes
+                )
+                app_metrics.metrics.increment_counter("thumbnails_generated", len(written))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error generating thumbnails for {source_key}: {e}")
+                app_metrics.metrics.increment_counter("thumbnail_errors")
+            finally:
+                self._pending.discard((user_id, content_key))
+                self._queue.task_done()
+
+
+# Global thumbnail service instance
+thumbnail_service = ThumbnailService()
+
+
+__all__ = [
+    "ThumbnailService",
+    "thumbnail_service",
+    "render_thumbnails",
+    "thumbnail_key",
+]
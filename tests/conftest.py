@@ -0,0 +1,28 @@
+"""
+Shared fixtures.
+
+Tests that need PostgreSQL take the `database` fixture, which points the
+app at a disposable database named by TEST_DATABASE_URL (with the
+pg_trgm extension installed) and skips the test without one.
+"""
+import os
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def database(monkeypatch):
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    
+    from app.core import database
+    from app.core.config import settings
+    
+    monkeypatch.setattr(settings, "DATABASE_URL", TEST_DATABASE_URL)
+    monkeypatch.setattr(database, "engine", None)
+    monkeypatch.setattr(database, "SessionLocal", None)
+    assert database.create_tables()
+    yield database
+    database.get_database_engine().dispose()
@@ -0,0 +1,79 @@
+"""
+Statement budget of the dashboard analytics.
+
+Runs against the database named by TEST_DATABASE_URL (see conftest.py).
+"""
+import inspect
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+
+@pytest.fixture
+def user_id(database):
+    from app.models.database import CompanyModel, InvoiceModel, UserModel
+    
+    user_id = uuid.uuid4()
+    today = datetime.utcnow()
+    with database.get_db_session() as session:
+        session.add(UserModel(
+            id=user_id,
+            name="Round Trips",
+            email=f"{user_id}@example.com",
+            hashed_password="x"
+        ))
+        vendors = [CompanyModel(company_name=f"Vendor {i}") for i in range(3)]
+        session.add_all(vendors)
+        session.flush()
+        
+        # Spread over both the current and the previous 30-day period
+        for i in range(12):
+            created_at = today - timedelta(days=5 * i)
+            session.add(InvoiceModel(
+                user_id=user_id,
+                vendor_id=vendors[i % len(vendors)].id,
+                invoice_number=f"RT-{user_id.hex[:8]}-{i}",
+                invoice_date=created_at.strftime("%Y-%m-%d"),
+                invoice_date_parsed=created_at.date(),
+                due_date_parsed=date.today() + timedelta(days=i - 6),
+                currency="INR" if i % 4 else "USD",
+                gross_amount=Decimal(100 * (i + 1)),
+                net_amount=Decimal(118 * (i + 1)),
+                created_at=created_at
+            ))
+    return str(user_id)
+
+
+def test_dashboard_analytics_stays_within_statement_budget(database, user_id):
+    from app.services.analytics_rollup_service import analytics_rollups
+    from app.services.analytics_service import DASHBOARD_STATEMENT_BUDGET, AnalyticsService
+    
+    analytics_rollups.ensure_built(user_id)
+    
+    # Past the result cache, which would otherwise answer a repeat call
+    get_dashboard_analytics = inspect.unwrap(AnalyticsService.get_dashboard_analytics)
+    
+    with database.count_round_trips() as trips:
+        result = get_dashboard_analytics(AnalyticsService(), user_id)
+    
+    assert result["success"], result.get("error")
+    assert result["data"]["summary"]
+    assert trips.statements <= DASHBOARD_STATEMENT_BUDGET
+    assert trips.transactions == 1
+
+
+def test_round_trips_count_toward_enclosing_blocks(database):
+    from sqlalchemy import text
+    
+    with database.count_round_trips() as outer:
+        with database.get_db_session() as session:
+            session.execute(text("SELECT 1"))
+        with database.count_round_trips() as inner, database.get_db_session() as session:
+            session.execute(text("SELECT 1"))
+            session.execute(text("SELECT 1"))
+    
+    assert (inner.statements, inner.transactions) == (2, 1)
+    assert (outer.statements, outer.transactions) == (3, 2)
+    assert outer.total == 7
@@ -0,0 +1,103 @@
+"""Company name normalization, fuzzy matching and duplicate merge planning."""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.company_service import CompanyMatcher, _plan_name_group, normalize_company_name
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("ACME Pvt. Ltd.", "acme"),
+    ("Acme Private Limited", "acme"),
+    ("Acme (OPC) Private Limited", "acme"),
+    ("Acme LLP", "acme"),
+    ("Tata Motors Limited", "tata motors"),
+    ("Global Corp", "global corp"),
+    ("Global Inc", "global inc"),
+    ("The Company", "the company"),
+    ("Kumar & Co", "kumar co"),
+    ("Limited", "limited"),
+    ("Acme Pvt Ltd Ltd", "acme pvt ltd"),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_company_name(name, expected):
+    assert normalize_company_name(name) == expected
+
+
+def _row(gstin=None):
+    return SimpleNamespace(id=uuid.uuid4(), gstin=gstin)
+
+
+def test_plan_name_group_merges_only_rows_with_the_same_gstin():
+    plain, registered, plain_again, registered_again = _row(), _row("29ABCDE1234F1Z5"), _row(), _row("29ABCDE1234F1Z5")
+    
+    plan = _plan_name_group([plain, registered, plain_again, registered_again])
+    
+    assert sorted(plan, key=str) == sorted([
+        (plain.id, [plain_again.id]),
+        (registered.id, [registered_again.id])
+    ], key=str)
+
+
+def test_plan_name_group_never_merges_gstin_less_rows_into_a_gstin_holder():
+    assert _plan_name_group([_row("29ABCDE1234F1Z5"), _row()]) == []
+
+
+@pytest.fixture
+def session(database):
+    from app.models.database import CompanyModel
+    
+    # Everything added here is rolled back after the test
+    session = database.get_session_factory()()
+    
+    def add_company(company_name, gstin=None):
+        company = CompanyModel(
+            company_name=company_name,
+            normalized_name=normalize_company_name(company_name),
+            gstin=gstin
+        )
+        session.add(company)
+        session.flush()
+        return company.id
+    
+    session.add_company = add_company
+    yield session
+    session.rollback()
+    session.close()
+
+
+@pytest.mark.parametrize("existing, extracted", [
+    ("ABC Enterprises Private Limited", "XYZ Enterprises Private Limited"),
+    ("Verma Traders Pvt Ltd", "Sharma Traders Pvt Ltd"),
+    ("A1 Traders", "A2 Traders"),
+    ("Global Corp", "Global Inc"),
+    ("Acme Industries India", "Acme Industries"),
+])
+def test_near_miss_names_do_not_match(session, existing, extracted):
+    session.add_company(existing)
+    
+    assert CompanyMatcher().find(session, extracted) is None
+
+
+@pytest.mark.parametrize("existing, extracted", [
+    ("ACME Industries Pvt. Ltd.", "Acme Industries Private Limited"),
+    ("Tata Consultancy Services Limited", "Tata Consultancy Service Ltd"),
+])
+def test_name_variants_match(session, existing, extracted):
+    company_id = session.add_company(existing)
+    
+    assert CompanyMatcher().find(session, extracted) == company_id
+
+
+def test_gstin_less_extraction_never_matches_a_registered_company(session):
+    session.add_company("Acme Industries Pvt Ltd", gstin="29ABCDE1234F1Z5")
+    
+    assert CompanyMatcher().find(session, "Acme Industries Private Limited") is None
+
+
+def test_extraction_with_gstin_never_matches_another_gstin(session):
+    session.add_company("Acme Industries Pvt Ltd", gstin="29ABCDE1234F1Z5")
+    
+    assert CompanyMatcher().find(session, "Acme Industries Private Limited", gstin="27ABCDE1234F1Z5") is None
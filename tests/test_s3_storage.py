@@ -0,0 +1,99 @@
+"""S3 storage backend against moto's in-process S3 (install the `test` extra)."""
+import io
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from app.core.storage import STORAGE_CHUNK_SIZE, S3StorageBackend
+
+BUCKET = "invoices"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def storage(client):
+    return S3StorageBackend(BUCKET, client=client, prefix="/app/")
+
+
+def test_put_and_get_round_trip_in_chunks(storage):
+    data = bytes(range(256)) * (STORAGE_CHUNK_SIZE // 128)
+    
+    assert storage.put("blobs/abc", io.BytesIO(data), "application/pdf") == len(data)
+    
+    chunks = list(storage.get("blobs/abc"))
+    assert len(chunks) > 1
+    assert max(len(chunk) for chunk in chunks) <= STORAGE_CHUNK_SIZE
+    assert b"".join(chunks) == data
+    assert storage.read("blobs/abc") == data
+
+
+def test_objects_are_stored_under_the_prefix(storage, client):
+    storage.put("blobs/abc", io.BytesIO(b"content"))
+    
+    assert client.get_object(Bucket=BUCKET, Key="app/blobs/abc")["Body"].read() == b"content"
+
+
+def test_get_range_is_inclusive(storage):
+    storage.put("blobs/abc", io.BytesIO(b"0123456789"))
+    
+    assert b"".join(storage.get_range("blobs/abc", 2, 5)) == b"2345"
+    assert b"".join(storage.get_range("blobs/abc", 9, 9)) == b"9"
+
+
+def test_stat(storage):
+    storage.put("thumbnails/u1/abc_150.webp", io.BytesIO(b"webp"), "image/webp")
+    
+    stored = storage.stat("thumbnails/u1/abc_150.webp")
+    assert stored.key == "thumbnails/u1/abc_150.webp"
+    assert stored.size == 4
+    assert stored.content_type == "image/webp"
+    assert stored.last_modified > 0
+    
+    assert storage.stat("thumbnails/u1/missing.webp") is None
+    assert storage.exists("thumbnails/u1/abc_150.webp")
+    assert not storage.exists("thumbnails/u1/missing.webp")
+
+
+def test_list_strips_the_prefix_and_filters(storage, client):
+    storage.put("thumbnails/u1/a_150.webp", io.BytesIO(b"a"))
+    storage.put("thumbnails/u1/b_150.webp", io.BytesIO(b"bb"))
+    storage.put("thumbnails/u2/c_150.webp", io.BytesIO(b"ccc"))
+    client.put_object(Bucket=BUCKET, Key="elsewhere/thumbnails/u1/x", Body=b"x")
+    
+    listed = {stored.key: stored.size for stored in storage.list("thumbnails/u1/")}
+    
+    assert listed == {"thumbnails/u1/a_150.webp": 1, "thumbnails/u1/b_150.webp": 2}
+    assert len(list(storage.list())) == 3
+
+
+def test_list_pages_through_many_objects(storage):
+    for i in range(1005):
+        storage.put(f"blobs/{i:04d}", io.BytesIO(b"x"))
+    
+    assert len(list(storage.list("blobs/"))) == 1005
+
+
+def test_delete(storage):
+    storage.put("blobs/abc", io.BytesIO(b"content"))
+    
+    assert storage.delete("blobs/abc") is True
+    assert storage.stat("blobs/abc") is None
+    assert storage.delete("blobs/abc") is False
+
+
+def test_open_buffer_reads_the_whole_object(storage):
+    storage.put("blobs/abc", io.BytesIO(b"content"))
+    
+    with storage.open_buffer("blobs/abc") as buffer:
+        assert bytes(buffer) == b"content"
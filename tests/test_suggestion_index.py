@@ -0,0 +1,158 @@
+"""In-memory suggestion indexes: lookups, incremental updates and loads racing with changes."""
+from collections import Counter
+
+import pytest
+
+from app.services.suggestion_service import (
+    COMPANY,
+    INVOICE_NUMBER,
+    TERM,
+    SuggestionIndex,
+    UserSuggestionIndex,
+    invoice_suggestion_entries,
+)
+
+
+def _index(min_term_frequency: int = 1, **entries) -> UserSuggestionIndex:
+    index = UserSuggestionIndex(min_term_frequency)
+    index.build(Counter(entries))
+    return index
+
+
+def _acme_invoice(number: str = "INV-001") -> Counter:
+    return invoice_suggestion_entries(number, ["Acme Steel Pvt Ltd"], [("7208", "Hot rolled steel coil")])
+
+
+def test_search_matches_any_word_start():
+    index = UserSuggestionIndex(1)
+    index.apply(_acme_invoice(), 1)
+    
+    assert index.search("steel", 10) == ["steel", "Acme Steel Pvt Ltd"]
+    assert index.search("acme", 10) == ["Acme Steel Pvt Ltd"]
+    assert index.search("teel", 10) == []
+
+
+def test_search_ranks_by_weight_then_length():
+    index = UserSuggestionIndex(1)
+    index.build(Counter({("Steel Traders", COMPANY): 1, ("Steel Corp", COMPANY): 1, ("steel", TERM): 5}))
+    
+    assert index.search("steel", 10) == ["steel", "Steel Corp", "Steel Traders"]
+    assert index.search("steel", 1) == ["steel"]
+
+
+def test_search_hides_infrequent_terms_but_not_other_kinds():
+    index = UserSuggestionIndex(3)
+    index.build(Counter({("coil", TERM): 2, ("COIL-7", INVOICE_NUMBER): 1}))
+    
+    assert index.search("coil", 10) == ["COIL-7"]
+    
+    index.apply(Counter({("coil", TERM): 1}), 1)
+    assert index.search("coil", 10) == ["coil", "COIL-7"]
+
+
+def test_apply_adds_and_removes_weights():
+    index = UserSuggestionIndex(1)
+    index.apply(_acme_invoice("INV-001"), 1)
+    index.apply(_acme_invoice("INV-002"), 1)
+    
+    assert index.size == 8
+    
+    index.apply(_acme_invoice("INV-001"), -1)
+    assert index.search("inv", 10) == ["INV-002"]
+    assert index.search("acme", 10) == ["Acme Steel Pvt Ltd"]
+    
+    index.apply(_acme_invoice("INV-002"), -1)
+    assert index.size == 0
+    assert index.search("acme", 10) == []
+    assert index._keys == []
+
+
+def test_apply_ignores_removing_unknown_suggestions():
+    index = UserSuggestionIndex(1)
+    index.apply(_acme_invoice(), -1)
+    
+    assert index.size == 0
+    assert index.search("acme", 10) == []
+
+
+class ScriptedSuggestionIndex(SuggestionIndex):
+    """Loads from a list of invoices; `during_load` runs between the snapshot and the store."""
+    
+    def __init__(self):
+        super().__init__(max_users=10, min_term_frequency=1)
+        self.invoices = []
+        self.during_load = None
+        self.load_count = 0
+    
+    def _load_index(self, user_id):
+        self.load_count += 1
+        entries = sum(self.invoices, Counter())
+        if self.during_load:
+            during_load, self.during_load = self.during_load, None
+            during_load()
+        index = UserSuggestionIndex(self.min_term_frequency)
+        index.build(entries)
+        return index
+
+
+@pytest.fixture
+def suggestions():
+    return ScriptedSuggestionIndex()
+
+
+def test_save_committed_during_load_is_not_lost(suggestions):
+    def save():
+        suggestions.invoices.append(_acme_invoice("INV-002"))
+        # Not loaded yet when the save committed
+        suggestions.invalidate("u1")
+    
+    suggestions.invoices.append(_acme_invoice("INV-001"))
+    suggestions.during_load = save
+    
+    assert suggestions.search("u1", "inv") == ["INV-001"]
+    assert not suggestions.is_loaded("u1")
+    assert suggestions.search("u1", "inv") == ["INV-001", "INV-002"]
+    assert suggestions.load_count == 2
+
+
+def test_save_committed_before_load_stored_is_not_counted_twice(suggestions):
+    since = suggestions.generation
+    suggestions.invoices.append(_acme_invoice("INV-001"))
+    
+    # The index loads (and sees the invoice) before the save updates it
+    assert suggestions.search("u1", "acme") == ["Acme Steel Pvt Ltd"]
+    suggestions.add_invoice("u1", _acme_invoice("INV-001"), since)
+    
+    assert not suggestions.is_loaded("u1")
+    suggestions.search("u1", "acme")
+    assert suggestions._indexes["u1"]._weights["Acme Steel Pvt Ltd"] == 1
+
+
+def test_changes_after_load_update_the_index(suggestions):
+    suggestions.invoices.append(_acme_invoice("INV-001"))
+    assert suggestions.search("u1", "inv") == ["INV-001"]
+    
+    since = suggestions.generation
+    suggestions.add_invoice("u1", _acme_invoice("INV-002"), since)
+    since = suggestions.generation
+    suggestions.remove_invoice("u1", _acme_invoice("INV-001"), since)
+    
+    assert suggestions.search("u1", "inv") == ["INV-002"]
+    assert suggestions.load_count == 1
+
+
+def test_changes_of_other_users_do_not_discard_a_load(suggestions):
+    suggestions.invoices.append(_acme_invoice("INV-001"))
+    suggestions.during_load = lambda: suggestions.invalidate("u2")
+    
+    suggestions.search("u1", "inv")
+    
+    assert suggestions.is_loaded("u1")
+
+
+def test_clear_during_load_discards_it(suggestions):
+    suggestions.during_load = suggestions.clear
+    
+    suggestions.search("u1", "inv")
+    
+    assert not suggestions.is_loaded("u1")